@@ -0,0 +1,4 @@
+"""Benchmarks for the Solar System Information Program.
+
+Run them from the repository root, e.g. ``python -m benchmarks.bench_storage``.
+"""
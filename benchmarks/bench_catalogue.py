@@ -0,0 +1,72 @@
+import argparse
+import random
+import time
+
+from benchmarks.synthetic import make_solar_system
+from catalogue import Catalogue
+
+
+def make_catalogue(system_count, planet_count, shard_count):
+    """Build a catalogue of random systems named System-0, System-1, ..."""
+    catalogue = Catalogue(shard_count)
+    for i in range(system_count):
+        catalogue.add_system(f"System-{i}", make_solar_system(planet_count, seed=i))
+    return catalogue
+
+
+def time_queries(catalogue, queries):
+    """Return the mean milliseconds per query."""
+    start = time.perf_counter()
+    for query in queries:
+        catalogue.process_query(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def bench_catalogue(system_count, planet_count, shard_count, query_count, workers):
+    """
+    Time routed and scatter-gather queries on one catalogue.
+
+    Routed queries name a random system; global ones ask for the heaviest
+    planets anywhere, with a different count each time so every query
+    misses the shards' caches.
+
+    Returns:
+        tuple: (routed ms per query, global ms per query)
+    """
+    catalogue = make_catalogue(system_count, planet_count, shard_count)
+    rng = random.Random(0)
+    routed = [
+        f"How massive is Planet-{rng.randrange(planet_count)} "
+        f"in System-{rng.randrange(system_count)}?"
+        for _ in range(query_count)
+    ]
+    scatter = [f"Top {i + 1} heaviest planets" for i in range(query_count)]
+    with catalogue:
+        if workers:
+            catalogue.start()
+        return time_queries(catalogue, routed), time_queries(catalogue, scatter)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time routed and scatter-gather catalogue queries."
+    )
+    parser.add_argument("--systems", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--planets", type=int, default=50, help="planets per system")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--workers", action="store_true", help="serve each shard from its own process"
+    )
+    args = parser.parse_args()
+
+    print(f"{'systems':>8} {'routed ms':>10} {'global ms':>10}")
+    for count in args.systems:
+        routed, scatter = bench_catalogue(
+            count, args.planets, args.shards, args.queries, args.workers
+        )
+        print(f"{count:>8} {routed:>10.3f} {scatter:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+from benchmarks.synthetic import make_solar_system
+from columns import np
+
+
+def bench_positions(planet_count, time_count, repeats):
+    """
+    Time SolarSystem.positions over every planet and time.
+
+    Args:
+        planet_count (int): Number of planets, each with an orbit
+        time_count (int): Number of times, spread over a century
+        repeats (int): Runs to take the best of
+
+    Returns:
+        float: Best seconds for one call
+    """
+    solar_system = make_solar_system(planet_count, max_moons=0, with_orbits=True)
+    solar_system.get_columns()
+    days = [i * 36525 / time_count for i in range(time_count)]
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        solar_system.positions(days)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time planet positions over many planets and times."
+    )
+    parser.add_argument("--planets", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--positions", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"NumPy: {'yes' if np is not None else 'no'}")
+    print(f"{'planets':>10} {'times':>10} {'seconds':>10} {'positions/sec':>15}")
+    for count in args.planets:
+        times = max(1, args.positions // count)
+        seconds = bench_positions(count, times, args.repeats)
+        print(f"{count:>10} {times:>10} {seconds:>10.3f} {count * times / seconds:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
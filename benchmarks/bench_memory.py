@@ -0,0 +1,57 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.synthetic import make_planets, make_solar_system
+from models import SolarSystem
+
+
+def measure(build):
+    """Return the object built and the bytes allocated while building it."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, used
+
+
+def count_bodies(planets):
+    return sum(1 + planet.get_moon_count() for planet in planets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory used per body.")
+    parser.add_argument("--planets", type=int, nargs="+", default=[1000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'planets':>10} {'bodies':>10} {'storage':>10} {'bytes/body':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.planets:
+            # Planet and Moon objects alone, then with the name indexes
+            planets, used = measure(lambda: make_planets(count))
+            bodies = count_bodies(planets)
+            print(f"{count:>10} {bodies:>10} {'objects':>10} {used / bodies:>12.1f}")
+            del planets
+
+            solar_system, used = measure(lambda: make_solar_system(count))
+            print(f"{count:>10} {bodies:>10} {'indexed':>10} {used / bodies:>12.1f}")
+
+            file_path = os.path.join(directory, "catalogue.ssm")
+            solar_system.save_to_file(file_path)
+            del solar_system
+
+            def open_mapped():
+                mapped = SolarSystem()
+                mapped.load_from_file(file_path)
+                return mapped
+
+            mapped, used = measure(open_mapped)
+            print(f"{count:>10} {bodies:>10} {'mapped':>10} {used / bodies:>12.1f}")
+            del mapped
+
+
+if __name__ == "__main__":
+    main()
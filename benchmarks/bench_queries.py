@@ -0,0 +1,192 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import make_solar_system
+from columns import np
+from query import QueryProcessor
+
+# Query intent -> question template, filled with random planet names
+INTENT_QUERIES = {
+    "everything": "Tell me everything about {a}",
+    "membership": "Is {a} in the list of planets?",
+    "mass": "How massive is {a}?",
+    "distance": "How far is {a} from the Sun?",
+    "moons": "How many moons does {a} have?",
+    "list": "List all planets",
+    "comparison": "Is {a} heavier than {b}?",
+    "comparison_list": "Which planets are farther than {a}?",
+    "range": "Which planets are between 100 and 200 million km from the sun?",
+    "moon_range": "Which moons are larger than 5990 km?",
+    "superlative": "What are the three most massive planets?",
+    "moon_superlative": "What are the three largest moons?",
+    "sort": "List the planets sorted by distance",
+    "compound": "Mass, distance and moons of {a} and {b}",
+    "derived": "How long is a year on {a}?",
+    "conversion": "How many Earth masses is {a}?",
+    "unknown": "What colour is the sky?",
+}
+
+
+def time_operation(operation, arguments, min_time):
+    """
+    Call operation with each argument in turn until min_time has passed.
+
+    Returns:
+        dict: Calls made, seconds taken and calls per second
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for argument in arguments:
+            operation(argument)
+        calls += len(arguments)
+        elapsed = time.perf_counter() - start
+    return {"calls": calls, "seconds": elapsed, "ops_per_sec": calls / elapsed}
+
+
+def measure_build(planet_count, max_moons, seed):
+    """Build a solar system, returning it with build seconds and bytes used."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    solar_system = make_solar_system(planet_count, max_moons, seed)
+    seconds = time.perf_counter() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return solar_system, seconds, used
+
+
+def bench_catalogue(planet_count, max_moons, min_time, samples, seed=0):
+    """
+    Time model lookups and every query intent over one synthetic catalogue.
+
+    Args:
+        planet_count (int): Number of planets to generate
+        max_moons (int): Most moons given to a single planet
+        min_time (float): Seconds to spend on each operation
+        samples (int): Distinct names or queries cycled through per operation
+        seed (int): Seed for the catalogue and the sampled names
+
+    Returns:
+        dict: Catalogue size, build cost and per-operation timings
+    """
+    solar_system, build_seconds, memory_bytes = measure_build(
+        planet_count, max_moons, seed
+    )
+    rng = random.Random(seed)
+    planets = [solar_system.planets[rng.randrange(planet_count)] for _ in range(samples)]
+    names = [planet.name for planet in planets]
+    # Uncached, so each call does the full parse and answer
+    processor = QueryProcessor(solar_system, cache_size=0)
+    cached = QueryProcessor(solar_system)
+
+    operations = {
+        "get_planet_by_name": time_operation(
+            solar_system.get_planet_by_name, names, min_time
+        ),
+        "get_all_planet_names": time_operation(
+            lambda _: solar_system.get_all_planet_names(), [None], min_time
+        ),
+        "planet_str": time_operation(str, planets, min_time),
+    }
+    for intent, template in INTENT_QUERIES.items():
+        queries = [
+            template.format(a=name, b=rng.choice(names)) for name in names
+        ]
+        operations[f"query:{intent}"] = time_operation(
+            processor.process_query, queries, min_time
+        )
+    operations["query:cached"] = time_operation(
+        cached.process_query, [INTENT_QUERIES["mass"].format(a=names[0])], min_time
+    )
+
+    bodies = planet_count + sum(planet.get_moon_count() for planet in solar_system.planets)
+    return {
+        "planets": planet_count,
+        "max_moons": max_moons,
+        "bodies": bodies,
+        "build_seconds": build_seconds,
+        "memory_bytes": memory_bytes,
+        "bytes_per_body": memory_bytes / bodies,
+        "operations": operations,
+    }
+
+
+def compare(results, baseline_path):
+    """Print each operation's speed relative to an earlier JSON report."""
+    with open(baseline_path, "r") as file:
+        baseline = {
+            (entry["planets"], entry["max_moons"]): entry
+            for entry in json.load(file)["results"]
+        }
+    print(f"\n{'planets':>10} {'moons':>6} {'operation':<26} {'vs baseline':>12}")
+    for entry in results:
+        old = baseline.get((entry["planets"], entry["max_moons"]))
+        if old is None:
+            continue
+        for name, timing in entry["operations"].items():
+            if name in old["operations"]:
+                ratio = timing["ops_per_sec"] / old["operations"][name]["ops_per_sec"]
+                print(
+                    f"{entry['planets']:>10} {entry['max_moons']:>6} "
+                    f"{name:<26} {ratio:>11.2f}x"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time model lookups and query intents over synthetic catalogues."
+    )
+    parser.add_argument(
+        "--planets",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000, 10000, 100000, 1000000],
+    )
+    parser.add_argument("--max-moons", type=int, nargs="+", default=[4])
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="seconds spent on each operation"
+    )
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json report to compare with")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'planets':>10} {'moons':>6} {'operation':<26} {'ops/sec':>14}")
+    for count in args.planets:
+        for max_moons in args.max_moons:
+            entry = bench_catalogue(count, max_moons, args.min_time, args.samples)
+            results.append(entry)
+            print(
+                f"{count:>10} {max_moons:>6} {'build':<26} "
+                f"{count / entry['build_seconds']:>14.0f}"
+                f"   ({entry['bytes_per_body']:.0f} bytes/body)"
+            )
+            for name, timing in entry["operations"].items():
+                print(f"{count:>10} {max_moons:>6} {name:<26} {timing['ops_per_sec']:>14.0f}")
+
+    if args.json:
+        report = {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "numpy": np is not None,
+            "min_time": args.min_time,
+            "samples": args.samples,
+            "results": results,
+        }
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
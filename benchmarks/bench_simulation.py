@@ -0,0 +1,100 @@
+import argparse
+import time
+
+from columns import np
+from simulation import Simulation
+
+# Largest system the all-pairs backend is timed on; beyond it only
+# Barnes-Hut runs, and force errors are not measured.
+DIRECT_LIMIT = 20000
+
+
+def make_cluster(count, seed=0):
+    """Return masses, positions and velocities of a random star cluster."""
+    rng = np.random.default_rng(seed)
+    masses = rng.uniform(1, 10, count)
+    positions = rng.normal(size=(count, 3))
+    velocities = rng.normal(size=(count, 3)) * 1e-4
+    return masses, positions, velocities
+
+
+def time_step(simulation, repeats):
+    """Return the best seconds taken by one force evaluation."""
+    simulation.accelerations()
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        simulation.accelerations()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_backends(count, thetas, workers, repeats):
+    """
+    Time each backend on one cluster, with Barnes-Hut's error against direct.
+
+    Returns:
+        list: (backend label, seconds per step, median relative force error)
+    """
+    bodies = make_cluster(count)
+    results = []
+    exact = None
+    if count <= DIRECT_LIMIT:
+        with Simulation(*bodies) as simulation:
+            results.append(("direct", time_step(simulation, repeats), 0.0))
+            exact = simulation.accelerations()
+    for theta in thetas:
+        with Simulation(*bodies, backend="barnes_hut", theta=theta, workers=workers) as simulation:
+            seconds = time_step(simulation, repeats)
+            error = float("nan")
+            if exact is not None:
+                found = simulation.accelerations()
+                error = float(
+                    np.median(
+                        np.linalg.norm(found - exact, axis=1) / np.linalg.norm(exact, axis=1)
+                    )
+                )
+            label = f"barnes_hut {theta}" + (f" x{workers}" if workers else "")
+            results.append((label, seconds, error))
+    return results
+
+
+def bench_energy(count, steps, dt):
+    """Return the largest energy drift of each backend over a short run."""
+    bodies = make_cluster(count)
+    drifts = {}
+    for backend in ("direct", "barnes_hut"):
+        with Simulation(*bodies, backend=backend, softening=0.01) as simulation:
+            drift = simulation.run(dt, steps, every=max(1, steps // 10))
+            drifts[backend] = max(abs(value) for _, value in drift)
+    return drifts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the N-body simulation backends."
+    )
+    parser.add_argument("--bodies", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--theta", type=float, nargs="+", default=[0.3, 0.5, 0.7])
+    parser.add_argument("--workers", type=int, help="processes for force evaluation")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--energy-steps", type=int, default=200, help="steps of the energy drift run"
+    )
+    args = parser.parse_args()
+
+    print(f"{'bodies':>8} {'backend':<22} {'s/step':>10} {'force error':>12}")
+    for count in args.bodies:
+        for label, seconds, error in bench_backends(
+            count, args.theta, args.workers, args.repeats
+        ):
+            print(f"{count:>8} {label:<22} {seconds:>10.4f} {error:>12.2e}")
+
+    drifts = bench_energy(500, args.energy_steps, 10.0)
+    print(f"\nEnergy drift, 500 bodies, {args.energy_steps} steps:")
+    for backend, drift in drifts.items():
+        print(f"  {backend:<12} {drift:.2e}")
+
+
+if __name__ == "__main__":
+    main()
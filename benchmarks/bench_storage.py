@@ -0,0 +1,48 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import make_solar_system
+from models import SolarSystem
+
+
+def bench_format(solar_system, file_path, repeat):
+    """Return the best save and load times, in seconds, for one file."""
+    save_times = []
+    load_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        solar_system.save_to_file(file_path)
+        save_times.append(time.perf_counter() - start)
+
+        loaded = SolarSystem()
+        start = time.perf_counter()
+        loaded.load_from_file(file_path)
+        load_times.append(time.perf_counter() - start)
+    return min(save_times), min(load_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark save and load times.")
+    parser.add_argument(
+        "--planets", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'planets':>10} {'format':>7} {'save (s)':>10} {'load (s)':>10} {'size':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.planets:
+            solar_system = make_solar_system(count)
+            for suffix in (".json", ".bin", ".ssm"):
+                file_path = os.path.join(directory, f"catalogue{suffix}")
+                save, load = bench_format(solar_system, file_path, args.repeat)
+                size = os.path.getsize(file_path)
+                print(
+                    f"{count:>10} {suffix[1:]:>7} {save:>10.3f} {load:>10.3f} {size:>12}"
+                )
+
+
+if __name__ == "__main__":
+    main()
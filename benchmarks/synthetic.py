@@ -0,0 +1,59 @@
+import random
+
+from ephemeris import Orbit
+from models import Moon, Planet, SolarSystem
+
+
+def make_planets(planet_count, max_moons=4, seed=0, with_orbits=False):
+    """
+    Build randomly generated planets and moons.
+
+    Args:
+        planet_count (int): Number of planets to create
+        max_moons (int): Most moons given to a single planet
+        seed (int): Seed for the random generator, for repeatable runs
+        with_orbits (bool): Give each planet random orbital elements
+
+    Returns:
+        list: The generated planets
+    """
+    rng = random.Random(seed)
+    planets = []
+    for i in range(planet_count):
+        planet = Planet(
+            f"Planet-{i}",
+            round(rng.uniform(0.01, 2000), 3),
+            round(rng.uniform(10, 10000), 1),
+        )
+        if with_orbits:
+            planet.orbit = Orbit(
+                rng.uniform(0.3, 50),
+                rng.uniform(0, 0.3),
+                rng.uniform(0, 20),
+                rng.uniform(0, 360),
+                rng.uniform(0, 360),
+                rng.uniform(0, 360),
+            )
+        for j in range(rng.randint(0, max_moons)):
+            planet.add_moon(Moon(f"Moon-{i}-{j}", rng.randint(5, 6000)))
+        planets.append(planet)
+    return planets
+
+
+def make_solar_system(planet_count, max_moons=4, seed=0, with_orbits=False):
+    """
+    Build a solar system of randomly generated planets and moons.
+
+    Args:
+        planet_count (int): Number of planets to create
+        max_moons (int): Most moons given to a single planet
+        seed (int): Seed for the random generator, for repeatable runs
+        with_orbits (bool): Give each planet random orbital elements
+
+    Returns:
+        SolarSystem: The generated solar system
+    """
+    solar_system = SolarSystem()
+    for planet in make_planets(planet_count, max_moons, seed, with_orbits):
+        solar_system.add_planet(planet)
+    return solar_system
@@ -0,0 +1,461 @@
+import heapq
+import os
+import time
+import zlib
+from itertools import islice
+from operator import itemgetter
+
+import storage
+from intents import (
+    INTENT_MATCHER,
+    MOON_SUPERLATIVES,
+    SUPERLATIVES,
+    format_value,
+    requested_count,
+)
+from matcher import NameMatcher, tokenize
+from models import SolarSystem
+from query import QueryProcessor
+from stats import Stats
+
+# Data files a catalogue directory may hold, one system each
+_DATA_EXTENSIONS = (".json", ".bin", ".ssb", ".ssm")
+
+
+class Shard:
+    """
+    A group of systems answered together, in this process or a worker.
+
+    Each system gets its own QueryProcessor, built on its first query, so
+    its answer cache stays warm between queries. For global questions the
+    shard ranks all of its planets (or moons) by a field at once, so the
+    best few are read off the end of one sorted list however many systems
+    it holds. Rankings are rebuilt after any system in the shard changes.
+    """
+
+    def __init__(self, stats=None):
+        """
+        Args:
+            stats (Stats): Where the query processors record their
+                intents and latencies; each has its own when None
+        """
+        self.systems = {}
+        self.stats = stats
+        self._processors = {}
+        # Field -> [(value, system, row or moon)] in ascending order
+        self._rankings = {}
+        self._rankings_version = None
+
+    def __getstate__(self):
+        # A worker process can't record into this process's stats, so its
+        # copy of the shard builds processors with stats of their own
+        state = self.__dict__.copy()
+        state["stats"] = None
+        state["_processors"] = {}
+        return state
+
+    def add_system(self, name, solar_system):
+        self.systems[name] = solar_system
+        self._processors.pop(name, None)
+        self._rankings.clear()
+
+    def remove_system(self, name):
+        self.systems.pop(name, None)
+        self._processors.pop(name, None)
+        self._rankings.clear()
+
+    def answer(self, name, query):
+        """Answer a query about one system."""
+        processor = self._processors.get(name)
+        if processor is None:
+            processor = QueryProcessor(self.systems[name], stats=self.stats)
+            self._processors[name] = processor
+        return processor.process_query(query)
+
+    def answer_many(self, requests):
+        """Answer (system name, query) pairs, in order."""
+        return [self.answer(name, query) for name, query in requests]
+
+    def top_planets(self, field, count, largest):
+        """
+        Find the shard's planets with the largest or smallest field.
+
+        Returns:
+            list: Up to count (value, system, planet name, formatted value)
+                tuples, best first
+        """
+        found = []
+        for value, system, row in _ends(self._ranking(field), count, largest):
+            planet = self.systems[system].planets[row]
+            found.append((value, system, planet.name, format_value(planet, field)))
+        return found
+
+    def top_moons(self, count, largest):
+        """
+        Find the shard's largest or smallest moons of known diameter.
+
+        Returns:
+            list: Up to count (diameter, system, moon name, planet name)
+                tuples, best first
+        """
+        return [
+            (diameter, system, moon.name, planet.name)
+            for diameter, system, (planet, moon) in _ends(
+                self._ranking("diameter"), count, largest
+            )
+        ]
+
+    def _ranking(self, field):
+        version = tuple(solar_system.version for solar_system in self.systems.values())
+        if version != self._rankings_version:
+            self._rankings.clear()
+            self._rankings_version = version
+        ranking = self._rankings.get(field)
+        if ranking is None:
+            ranking = []
+            for system, solar_system in self.systems.items():
+                if field == "diameter":
+                    _, moons = solar_system.moons_in_range()
+                    ranking.extend(
+                        (moon.diameter, system, (planet, moon)) for planet, moon in moons
+                    )
+                else:
+                    column = getattr(solar_system.get_columns(), field)
+                    ranking.extend(
+                        (value, system, row) for row, value in enumerate(column)
+                    )
+            ranking.sort(key=itemgetter(0))
+            self._rankings[field] = ranking
+        return ranking
+
+
+class Catalogue:
+    """
+    Many solar systems, partitioned into shards and queried as one.
+
+    Each system lives in exactly one shard, chosen from a hash of its name
+    so the assignment is stable across runs. A query naming systems, or
+    bodies that only some systems have, is routed to the shards holding
+    them; other shards are not touched, so the cost of such a query does
+    not grow with the catalogue. Global questions such as "the most
+    massive planet" are scattered to every shard, each answers for its own
+    systems, and the partial answers are merged.
+
+    After start() each shard is served by its own worker process, holding
+    its systems and warm caches between queries. Until then, or after
+    close(), shards are answered in this process.
+    """
+
+    def __init__(self, shard_count=4):
+        """
+        Args:
+            shard_count (int): Number of shards, and of worker processes
+                once started
+        """
+        self.stats = Stats(enabled=True)
+        # Shards answered in this process record their queries here too
+        self.shards = [Shard(self.stats) for _ in range(max(shard_count, 1))]
+        # Lower-cased system name -> system name, and shard of each system
+        self._systems = {}
+        self._shard_of = {}
+        self._system_matcher = NameMatcher()
+        # Body names -> the systems with a body of that name. The list is
+        # the matcher's payload, so it grows in place as systems are added.
+        self._body_systems = {}
+        self._body_matcher = NameMatcher()
+        # System name -> the body names it was routed by
+        self._system_bodies = {}
+        self._pools = None
+
+    @classmethod
+    def load_directory(cls, directory, shard_count=4):
+        """
+        Build a catalogue from a directory of data files, one per system.
+
+        Each system is named after its file, e.g. "Kepler-90.json" holds
+        the Kepler-90 system. Files that fail to load are skipped.
+
+        Returns:
+            Catalogue: The systems that loaded
+        """
+        catalogue = cls(shard_count)
+        for entry in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(entry)
+            if extension.lower() not in _DATA_EXTENSIONS or name.startswith("."):
+                continue
+            if name.endswith(".snapshot"):
+                continue
+            solar_system = SolarSystem()
+            if solar_system.load_from_file(
+                os.path.join(directory, entry), storage.detect_format(entry)
+            ):
+                catalogue.add_system(name, solar_system)
+        return catalogue
+
+    def __len__(self):
+        return len(self._systems)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def system_names(self):
+        """Return the names of the systems, in the order they were added."""
+        return list(self._systems.values())
+
+    def shard_for(self, name):
+        """Return the index of the shard a system name belongs in."""
+        return zlib.crc32(name.casefold().encode("utf-8")) % len(self.shards)
+
+    def add_system(self, name, solar_system):
+        """
+        Add a system, or replace the one with the same name.
+
+        The system's body names are read once, here, for routing; bodies
+        added to it later are still answered when the system is named,
+        but a query naming only them is not routed to it. A replaced
+        system's old bodies no longer route to it.
+
+        Args:
+            name (str): The system's name, e.g. "Kepler-90"
+            solar_system (SolarSystem): Its planets and moons
+        """
+        index = self.shard_for(name)
+        key = name.casefold()
+        old = self._systems.get(key)
+        if old is not None:
+            self._remove_bodies(old)
+            if old != name:
+                # Renamed in case only, e.g. "kepler-90" to "Kepler-90"
+                self._system_matcher.remove(old, old)
+                del self._shard_of[old]
+                self.shards[index].remove_system(old)
+                if self._pools is not None:
+                    self._pools[index].submit(_call_shard, "remove_system", old).result()
+        self._systems[key] = name
+        self._shard_of[name] = index
+        self._system_matcher.add(name, name)
+        body_keys = self._system_bodies[name] = set()
+        for body in set(solar_system.body_names()):
+            body_key = " ".join(tokenize(body))
+            body_keys.add(body_key)
+            systems = self._body_systems.get(body_key)
+            if systems is None:
+                systems = self._body_systems[body_key] = []
+                self._body_matcher.add(body, systems)
+            if name not in systems:
+                systems.append(name)
+        self.shards[index].add_system(name, solar_system)
+        if self._pools is not None:
+            self._pools[index].submit(_call_shard, "add_system", name, solar_system).result()
+
+    def _remove_bodies(self, name):
+        """Stop routing queries to a system by its body names."""
+        for body_key in self._system_bodies.pop(name, ()):
+            systems = self._body_systems[body_key]
+            systems.remove(name)
+            if not systems:
+                del self._body_systems[body_key]
+                self._body_matcher.remove(body_key, systems)
+
+    def start(self):
+        """Serve each shard from its own worker process."""
+        if self._pools is not None:
+            return
+        # Imported here: it is slow to import and most runs never use it
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._pools = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_shard, initargs=(shard,))
+            for shard in self.shards
+        ]
+
+    def close(self):
+        """Stop the worker processes; later queries are answered in this process."""
+        if self._pools is None:
+            return
+        for pool in self._pools:
+            pool.shutdown()
+        self._pools = None
+
+    def route(self, query=None, tokens=None):
+        """
+        Work out which systems a query is about.
+
+        Systems named in the query win. Otherwise the systems having a
+        body the query names are used.
+
+        Returns:
+            tuple: (the systems, in order of mention, and the tokens of
+                the query with the system names removed); no systems means
+                the query is about the whole catalogue
+        """
+        if tokens is None:
+            tokens = tokenize(query)
+        systems = []
+        rest = []
+        i = 0
+        while i < len(tokens):
+            match = self._system_matcher.match_at(tokens, i)
+            if match is None:
+                rest.append(tokens[i])
+                i += 1
+                continue
+            name, i = match
+            if name not in systems:
+                systems.append(name)
+        if not systems:
+            for found in self._body_matcher.find_all(tokens=tokens):
+                systems.extend(name for name in found if name not in systems)
+        return systems, rest
+
+    def process_query(self, query):
+        """
+        Answer a query about one, several or all of the systems.
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            str: The answer; when several systems are asked about, one
+                line per system starting with its name
+        """
+        start = time.perf_counter()
+        systems, rest = self.route(query)
+        if systems:
+            kind = "routed"
+            answer = self._answer_systems(systems, " ".join(rest))
+        else:
+            kind = "scatter"
+            answer = self._answer_global(rest)
+        if self.stats.enabled:
+            self.stats.record("catalogue", kind, time.perf_counter() - start)
+        return answer
+
+    def process_many(self, queries, workers=None):
+        """
+        Answer a stream of queries, yielding the answers in order.
+
+        Shards run in worker processes once start() is called, so workers
+        is accepted only to match QueryProcessor.process_many.
+        """
+        for query in queries:
+            yield self.process_query(query)
+
+    def stats_snapshot(self):
+        """
+        Return the recorded routed and scatter-gather latencies, and the
+        intents answered by shards in this process.
+        """
+        return self.stats.snapshot()
+
+    def _answer_systems(self, systems, query):
+        """Answer query for each system, asking each shard once."""
+        requests = {}
+        for name in systems:
+            requests.setdefault(self._shard_of[name], []).append((name, query))
+        shards = list(requests)
+        results = self._scatter(shards, "answer_many", [(requests[i],) for i in shards])
+        answers = {}
+        for index, found in zip(shards, results):
+            for (name, _), answer in zip(requests[index], found):
+                answers[name] = answer
+        if len(systems) == 1:
+            return answers[systems[0]]
+        return "\n".join(f"{name}: {answers[name]}" for name in systems)
+
+    def _answer_global(self, tokens):
+        """Answer a question about every system by scatter-gather."""
+        if not self._systems:
+            return "There are no systems in the catalogue."
+        intents = set(INTENT_MATCHER.find_all(tokens=tokens))
+        count = requested_count(tokens)
+        shards = range(len(self.shards))
+
+        if "moons" in intents:
+            for intent, (largest, singular, plural) in MOON_SUPERLATIVES.items():
+                if intent not in intents:
+                    continue
+                found = self._gather(
+                    self._scatter(shards, "top_moons", [(count, largest)] * len(shards)),
+                    count,
+                    largest,
+                )
+                items = [
+                    f"{moon} ({diameter} km, {planet} in {system})"
+                    for diameter, system, moon, planet in found
+                ]
+                if not items:
+                    return "There are no moons of known size in the catalogue."
+                return _superlative(singular, plural, count, items)
+
+        for intent, (field, largest, singular, plural) in SUPERLATIVES.items():
+            if intent not in intents:
+                continue
+            found = self._gather(
+                self._scatter(
+                    shards, "top_planets", [(field, count, largest)] * len(shards)
+                ),
+                count,
+                largest,
+            )
+            items = [
+                f"{planet} in {system} ({text})" for _, system, planet, text in found
+            ]
+            if not items:
+                return "There are no planets in the catalogue."
+            return _superlative(singular, plural, count, items)
+
+        return (
+            f"The catalogue has {len(self._systems)} systems. Name a system or "
+            "a planet, or ask for the most massive, farthest or largest bodies."
+        )
+
+    def _scatter(self, shards, method, arguments):
+        """Call a Shard method on each shard with its own arguments, in parallel."""
+        if self._pools is None:
+            return [
+                getattr(self.shards[index], method)(*args)
+                for index, args in zip(shards, arguments)
+            ]
+        futures = [
+            self._pools[index].submit(_call_shard, method, *args)
+            for index, args in zip(shards, arguments)
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _gather(results, count, largest):
+        """Merge the shards' best-first lists into the overall best."""
+        merged = heapq.merge(*results, key=itemgetter(0), reverse=largest)
+        return list(islice(merged, count))
+
+
+def _ends(ranking, count, largest):
+    """Return the first or last count items of an ascending list, best first."""
+    if largest:
+        return ranking[: -count - 1 : -1] if count else []
+    return ranking[:count]
+
+
+def _superlative(singular, plural, count, items):
+    if count == 1:
+        return f"The {singular} in the catalogue is {items[0]}."
+    return f"The {len(items)} {plural} in the catalogue are: {', '.join(items)}."
+
+
+# Shard served by this worker process, set up by _init_shard.
+_worker_shard = None
+
+
+def _init_shard(shard):
+    """Hold a shard in a worker process."""
+    global _worker_shard
+    _worker_shard = shard
+
+
+def _call_shard(method, *args):
+    """Call a method of the worker process's shard."""
+    return getattr(_worker_shard, method)(*args)
@@ -0,0 +1,158 @@
+import heapq
+import math
+import operator
+from array import array
+
+from ephemeris import ELEMENT_FIELDS
+from lazy import lazy_import
+
+# NumPy is optional; plain loops are used without it. It is only loaded
+# when first used, keeping it off the startup path.
+np = lazy_import("numpy")
+
+FIELDS = ("mass", "distance_from_sun", "moon_count")
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class PlanetColumns:
+    """
+    Numeric columns describing every planet, row i being planets[i].
+
+    The columns are growable arrays, so appending a planet is cheap. With
+    NumPy installed, queries view them as NumPy arrays without copying and
+    run as vectorized operations; otherwise they fall back to Python loops.
+    """
+
+    def __init__(self):
+        self.mass = array("d")
+        self.distance_from_sun = array("d")
+        self.moon_count = array("q")
+        # One column per orbital element, NaN for planets without an orbit
+        self.orbit = {field: array("d") for field in ELEMENT_FIELDS}
+
+    @classmethod
+    def from_mapped(cls, catalogue):
+        """Copy the columns of a MappedCatalogue in bulk."""
+        columns = cls()
+        columns.mass.frombytes(catalogue.masses.cast("B"))
+        columns.distance_from_sun.frombytes(catalogue.distances.cast("B"))
+        first = catalogue.first_moon
+        if np is not None:
+            counts = np.diff(np.frombuffer(first, dtype=np.uint64)).astype(np.int64)
+            columns.moon_count.frombytes(counts.tobytes())
+        else:
+            columns.moon_count.extend(b - a for a, b in zip(first, first[1:]))
+        for field in ELEMENT_FIELDS:
+            if catalogue.orbits is None:
+                columns.orbit[field].extend([math.nan] * len(catalogue))
+            else:
+                columns.orbit[field].frombytes(catalogue.orbits[field].cast("B"))
+        return columns
+
+    def __len__(self):
+        return len(self.mass)
+
+    def copy(self):
+        """Return an independent copy of the columns."""
+        columns = PlanetColumns()
+        columns.mass = self.mass[:]
+        columns.distance_from_sun = self.distance_from_sun[:]
+        columns.moon_count = self.moon_count[:]
+        columns.orbit = {field: column[:] for field, column in self.orbit.items()}
+        return columns
+
+    def append(self, planet):
+        self.mass.append(planet.mass)
+        self.distance_from_sun.append(planet.distance_from_sun)
+        self.moon_count.append(planet.get_moon_count())
+        orbit = planet.orbit
+        for field in ELEMENT_FIELDS:
+            self.orbit[field].append(math.nan if orbit is None else getattr(orbit, field))
+
+    def update(self, row, planet):
+        """Overwrite a row with a planet's current values."""
+        self.mass[row] = planet.mass
+        self.distance_from_sun[row] = planet.distance_from_sun
+        self.moon_count[row] = planet.get_moon_count()
+        orbit = planet.orbit
+        for field in ELEMENT_FIELDS:
+            self.orbit[field][row] = math.nan if orbit is None else getattr(orbit, field)
+
+    def remove(self, row):
+        """Delete a row; the rows after it move up by one."""
+        del self.mass[row]
+        del self.distance_from_sun[row]
+        del self.moon_count[row]
+        for column in self.orbit.values():
+            del column[row]
+
+    def values(self, field):
+        """Return a column, as a NumPy array when NumPy is available."""
+        column = self.orbit[field] if field in self.orbit else getattr(self, field)
+        if np is not None:
+            return np.frombuffer(column, dtype=column.typecode, count=len(column))
+        return column
+
+    def select(self, field, low=None, high=None, include_low=True, include_high=True):
+        """
+        Find the rows whose field lies in a range.
+
+        Args:
+            field (str): One of FIELDS
+            low (float): Lower bound, or None for no bound
+            high (float): Upper bound, or None for no bound
+            include_low (bool): Whether values equal to low match
+            include_high (bool): Whether values equal to high match
+
+        Returns:
+            list: Matching row numbers in row order
+        """
+        tests = []
+        if low is not None:
+            tests.append((OPERATORS[">=" if include_low else ">"], low))
+        if high is not None:
+            tests.append((OPERATORS["<=" if include_high else "<"], high))
+        if not len(self):
+            return []
+        if np is not None:
+            column = self.values(field)
+            mask = np.ones(len(column), dtype=bool)
+            for compare, bound in tests:
+                mask &= compare(column, bound)
+            return np.flatnonzero(mask).tolist()
+        return [
+            row
+            for row, value in enumerate(getattr(self, field))
+            if all(compare(value, bound) for compare, bound in tests)
+        ]
+
+    def top(self, field, k, largest=True):
+        """
+        Find the k rows with the largest (or smallest) values of field.
+
+        Returns:
+            list: Row numbers, best first. Rows that tie at the cut-off
+                may be picked in any order.
+        """
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        if np is not None:
+            column = self.values(field)
+            keys = -column if largest else column
+            if k < n:
+                rows = np.argpartition(keys, k - 1)[:k]
+                rows.sort()
+            else:
+                rows = np.arange(n)
+            return rows[np.argsort(keys[rows], kind="stable")].tolist()
+        column = getattr(self, field)
+        pick = heapq.nlargest if largest else heapq.nsmallest
+        return pick(k, range(n), key=column.__getitem__)
@@ -0,0 +1,131 @@
+import math
+from array import array
+
+from columns import np
+from ephemeris import AU_MILLION_KM, MEAN_MOTION_1AU, SUN_MASS
+
+# Speed of light in km/s
+SPEED_OF_LIGHT = 299792.458
+# Masses in the planet mass unit of 10^24 kg
+EARTH_MASS = 5.9722
+JUPITER_MASS = 1898.125
+# Orbital period of a massless body 1 AU from the Sun, in days
+YEAR_1AU_DAYS = 360.0 / MEAN_MOTION_1AU
+DAYS_PER_YEAR = 365.25
+
+FIELDS = ("period_days", "distance_au", "light_seconds", "earth_masses", "jupiter_masses")
+
+
+class DerivedColumns:
+    """
+    Quantities worked out from the planet columns, for every planet at once.
+
+    Each is one vectorized pass over a stored column (plain loops without
+    NumPy), done when the DerivedColumns is built:
+
+    - period_days: orbital period by Kepler's third law, taking the
+      distance from the Sun as the semi-major axis
+    - distance_au: distance from the Sun in astronomical units
+    - light_seconds: time light takes to travel from the Sun
+    - earth_masses, jupiter_masses: the mass in those units
+
+    SolarSystem.get_derived() keeps one until the planets change. Phrases
+    describing a value are formatted on first request and kept too.
+    """
+
+    def __init__(self, columns, names):
+        """
+        Args:
+            columns (PlanetColumns): The stored values, row i for planet i
+            names (sequence): The planet names, in row order
+        """
+        # Case-folded name -> row; the first planet with a name wins, as
+        # in SolarSystem.get_planet_by_name
+        self._rows = {}
+        for row, name in enumerate(names):
+            self._rows.setdefault(name.casefold(), row)
+        mass = columns.values("mass")
+        distance = columns.values("distance_from_sun")
+        if np is not None:
+            au = distance / AU_MILLION_KM
+            self.distance_au = au
+            self.period_days = YEAR_1AU_DAYS * au**1.5 / np.sqrt(1 + mass / SUN_MASS)
+            self.light_seconds = distance * (1e6 / SPEED_OF_LIGHT)
+            self.earth_masses = mass / EARTH_MASS
+            self.jupiter_masses = mass / JUPITER_MASS
+        else:
+            self.distance_au = array("d", (d / AU_MILLION_KM for d in distance))
+            self.period_days = array(
+                "d",
+                (
+                    YEAR_1AU_DAYS * a**1.5 / math.sqrt(1 + m / SUN_MASS)
+                    for a, m in zip(self.distance_au, mass)
+                ),
+            )
+            self.light_seconds = array("d", (d * (1e6 / SPEED_OF_LIGHT) for d in distance))
+            self.earth_masses = array("d", (m / EARTH_MASS for m in mass))
+            self.jupiter_masses = array("d", (m / JUPITER_MASS for m in mass))
+        self._phrases = {}
+
+    def __len__(self):
+        return len(self.distance_au)
+
+    def value(self, field, name):
+        """
+        Return one planet's value of a derived field.
+
+        Returns:
+            float: The value, or None if no planet has that name
+        """
+        row = self._rows.get(name.casefold())
+        if row is None:
+            return None
+        return float(getattr(self, field)[row])
+
+    def phrase(self, field, name):
+        """
+        Describe one planet's value, completing "<planet name> ...".
+
+        Returns:
+            str: e.g. "takes 1.88 years (687.0 days) to orbit the Sun", or
+                None if no planet has that name
+        """
+        key = (field, name.casefold())
+        text = self._phrases.get(key)
+        if text is None:
+            value = self.value(field, name)
+            if value is None:
+                return None
+            text = _PHRASES[field](value)
+            self._phrases[key] = text
+        return text
+
+
+def format_duration(seconds):
+    """Format a duration as hours, minutes and seconds, e.g. "8 min 19 s"."""
+    seconds = round(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours} h {minutes} min"
+    if minutes:
+        return f"{minutes} min {seconds} s"
+    return f"{seconds} s"
+
+
+def _period_phrase(days):
+    years = days / DAYS_PER_YEAR
+    if years < 1:
+        return f"takes {days:,.1f} days ({years:.2f} years) to orbit the Sun"
+    return f"takes {years:,.2f} years ({days:,.1f} days) to orbit the Sun"
+
+
+_PHRASES = {
+    "period_days": _period_phrase,
+    "distance_au": lambda au: f"is {au:,.3f} AU from the Sun",
+    "light_seconds": lambda seconds: (
+        f"is {format_duration(seconds)} from the Sun at the speed of light"
+    ),
+    "earth_masses": lambda masses: f"has a mass of {masses:,.4g} Earth masses",
+    "jupiter_masses": lambda masses: f"has a mass of {masses:,.4g} Jupiter masses",
+}
@@ -0,0 +1,355 @@
+import math
+from datetime import datetime, timedelta
+
+from lazy import lazy_import
+
+# NumPy is optional; plain loops are used without it. It is only loaded
+# when first used, keeping it off the startup path.
+np = lazy_import("numpy")
+
+# Elements are given for this moment, and times are counted in days from it.
+J2000 = datetime(2000, 1, 1, 12)
+
+# Mean motion of a body 1 AU from the Sun, in degrees per day (the Gaussian
+# gravitational constant). A body a AU out moves at this / a ** 1.5.
+MEAN_MOTION_1AU = math.degrees(0.01720209895)
+
+# Kilometres in an astronomical unit, in millions
+AU_MILLION_KM = 149.5978707
+
+# Mass of the Sun in the planet mass unit of 10^24 kg
+SUN_MASS = 1988500.0
+
+# Body-times computed together by positions(); about what fits in cache.
+_BLOCK_SIZE = 1 << 15
+
+ELEMENT_FIELDS = (
+    "semi_major_axis",
+    "eccentricity",
+    "inclination",
+    "ascending_node",
+    "perihelion",
+    "mean_longitude",
+)
+
+
+class Orbit:
+    """
+    Keplerian orbital elements of a planet at J2000.
+
+    Distances are in AU and angles in degrees, measured in the ecliptic
+    frame. Perihelion is the longitude of perihelion, the sum of the
+    ascending node and the argument of perihelion.
+    """
+
+    __slots__ = ELEMENT_FIELDS
+
+    def __init__(
+        self,
+        semi_major_axis,
+        eccentricity,
+        inclination=0.0,
+        ascending_node=0.0,
+        perihelion=0.0,
+        mean_longitude=0.0,
+    ):
+        self.semi_major_axis = semi_major_axis
+        self.eccentricity = eccentricity
+        self.inclination = inclination
+        self.ascending_node = ascending_node
+        self.perihelion = perihelion
+        self.mean_longitude = mean_longitude
+
+    def elements(self):
+        """Return the elements as a tuple, in ELEMENT_FIELDS order."""
+        return tuple(getattr(self, field) for field in ELEMENT_FIELDS)
+
+    def __eq__(self, other):
+        if not isinstance(other, Orbit):
+            return NotImplemented
+        return self.elements() == other.elements()
+
+    def __hash__(self):
+        return hash(self.elements())
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in ELEMENT_FIELDS)
+        return f"Orbit({fields})"
+
+    def period_days(self):
+        """Return the orbital period in days."""
+        return 360.0 / (MEAN_MOTION_1AU / self.semi_major_axis**1.5)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in ELEMENT_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data[field] for field in ELEMENT_FIELDS))
+
+
+def to_days(moment):
+    """Return the days from J2000 to a date or datetime."""
+    if not isinstance(moment, datetime):
+        moment = datetime(moment.year, moment.month, moment.day)
+    return (moment - J2000) / timedelta(days=1)
+
+
+def from_days(days):
+    """Return the datetime a number of days after J2000."""
+    return J2000 + timedelta(days=float(days))
+
+
+def solve_kepler(mean_anomaly, eccentricity, tolerance=1e-12, max_iterations=50):
+    """
+    Solve Kepler's equation E - e sin E = M for the eccentric anomaly E.
+
+    Works on whole arrays at once with Danby's fourth-order extension of
+    Newton's method, stopping once the error left is below tolerance.
+    For planetary eccentricities that takes two steps. Mean anomalies
+    should be in radians in [-pi, pi].
+
+    Args:
+        mean_anomaly (ndarray): Mean anomalies M, in radians
+        eccentricity (ndarray): Eccentricities, broadcast against M
+
+    Returns:
+        ndarray: Eccentric anomalies, in radians
+    """
+    return _solve_kepler(mean_anomaly, eccentricity, tolerance, max_iterations)[0]
+
+
+def _solve_kepler(mean_anomaly, eccentricity, tolerance=1e-12, max_iterations=50):
+    """As solve_kepler, also returning the sine and cosine of the result."""
+    sin_m = np.sin(mean_anomaly)
+    anomaly = np.where(
+        eccentricity < 0.8,
+        mean_anomaly + eccentricity * sin_m,
+        mean_anomaly + 0.85 * eccentricity * np.sign(sin_m),
+    )
+    sin_e = np.sin(anomaly)
+    cos_e = np.cos(anomaly)
+    for _ in range(max_iterations):
+        # f(E) = E - e sin E - M has derivatives 1 - e cos E, e sin E and
+        # e cos E. Each line refines the step using one more of them.
+        e_sin = eccentricity * sin_e
+        e_cos = eccentricity * cos_e
+        residual = anomaly - e_sin
+        residual -= mean_anomaly
+        slope = 1 - e_cos
+        e_sin *= 0.5
+        e_cos *= 1 / 6
+        step = residual / slope
+        step = residual / (slope - step * e_sin)
+        step = residual / (slope - step * (e_sin - step * e_cos))
+        anomaly = anomaly - step
+        if not np.nanmax(np.abs(step), initial=0.0) ** 4 > tolerance:
+            # The error left is around step ** 4. Turn the sine and cosine
+            # back through the small last step by series rather than
+            # evaluating them again over the whole array.
+            step2 = step * step
+            cos_step = 1 - step2 / 2 + step2 * step2 / 24
+            sin_step = step * (1 - step2 / 6 + step2 * step2 / 120)
+            sin_e, cos_e = (
+                sin_e * cos_step - cos_e * sin_step,
+                cos_e * cos_step + sin_e * sin_step,
+            )
+            break
+        sin_e = np.sin(anomaly)
+        cos_e = np.cos(anomaly)
+    return anomaly, sin_e, cos_e
+
+
+def _solve_kepler_scalar(mean_anomaly, eccentricity, tolerance=1e-12, max_iterations=50):
+    anomaly = mean_anomaly if eccentricity < 0.8 else math.copysign(math.pi, mean_anomaly)
+    for _ in range(max_iterations):
+        step = (anomaly - eccentricity * math.sin(anomaly) - mean_anomaly) / (
+            1 - eccentricity * math.cos(anomaly)
+        )
+        anomaly -= step
+        if abs(step) <= tolerance:
+            break
+    return anomaly
+
+
+def positions(elements, days):
+    """
+    Compute heliocentric ecliptic positions for many bodies and times.
+
+    Args:
+        elements (sequence): Six equal-length sequences, one per entry of
+            ELEMENT_FIELDS, describing N bodies. Bodies with a NaN
+            semi-major axis get NaN positions.
+        days (sequence): T times, in days from J2000
+
+    Returns:
+        ndarray: (T, N, 3) x, y, z positions in AU. Without NumPy, a list
+            of T lists of N (x, y, z) tuples.
+    """
+    if np is None:
+        return [
+            [_position(body, day) for body in zip(*elements)]
+            for day in days
+        ]
+
+    columns = [np.asarray(column, dtype=float) for column in elements]
+    days = np.asarray(days, dtype=float)
+    result = np.empty((len(days), len(columns[0]), 3))
+    # Work through blocks of bodies, then of times, small enough for the
+    # temporaries to stay in cache.
+    width = min(len(columns[0]), _BLOCK_SIZE) or 1
+    rows = _BLOCK_SIZE // width
+    for left in range(0, len(columns[0]), width):
+        bodies = slice(left, left + width)
+        a, e, start_anomaly, mean_motion, minor_axis, rotation = _orbit_frames(
+            *(column[bodies] for column in columns)
+        )
+        for first in range(0, len(days), rows):
+            block = days[first : first + rows, np.newaxis]
+            mean_anomaly = np.radians(start_anomaly + mean_motion * block)
+            mean_anomaly = np.remainder(mean_anomaly + np.pi, 2 * np.pi) - np.pi
+            _, sin_e, cos_e = _solve_kepler(mean_anomaly, e)
+            x_plane = a * (cos_e - e)
+            y_plane = minor_axis * sin_e
+            out = result[first : first + rows, bodies]
+            for axis, (from_x, from_y) in enumerate(rotation):
+                out[..., axis] = from_x * x_plane + from_y * y_plane
+    return result
+
+
+def state_vectors(elements, day):
+    """
+    Compute heliocentric positions and velocities of many bodies at once.
+
+    Needs NumPy.
+
+    Args:
+        elements (sequence): Six equal-length sequences, one per entry of
+            ELEMENT_FIELDS, describing N bodies
+        day (float): The time, in days from J2000
+
+    Returns:
+        tuple: (N, 3) positions in AU and (N, 3) velocities in AU per day
+    """
+    a, e, start_anomaly, mean_motion, minor_axis, rotation = _orbit_frames(
+        *(np.asarray(column, dtype=float) for column in elements)
+    )
+    mean_anomaly = np.radians(start_anomaly + mean_motion * day)
+    mean_anomaly = np.remainder(mean_anomaly + np.pi, 2 * np.pi) - np.pi
+    _, sin_e, cos_e = _solve_kepler(mean_anomaly, e)
+    # dE/dt from differentiating Kepler's equation
+    anomaly_rate = np.radians(mean_motion) / (1 - e * cos_e)
+    plane = (a * (cos_e - e), minor_axis * sin_e)
+    plane_velocity = (-a * sin_e * anomaly_rate, minor_axis * cos_e * anomaly_rate)
+    found = []
+    for x_plane, y_plane in (plane, plane_velocity):
+        found.append(
+            np.stack(
+                [from_x * x_plane + from_y * y_plane for from_x, from_y in rotation],
+                axis=1,
+            )
+        )
+    return found[0], found[1]
+
+
+def _orbit_frames(a, e, inclination, node, perihelion, longitude):
+    """Per-body constants of positions(), for a block of bodies."""
+    mean_motion = MEAN_MOTION_1AU / a**1.5
+    start_anomaly = longitude - perihelion
+    minor_axis = a * np.sqrt(1 - e * e)
+
+    # Rotation from the orbital plane (perihelion along x) to the
+    # ecliptic, by the argument of perihelion, inclination and node
+    argument = np.radians(perihelion - node)
+    node = np.radians(node)
+    inclination = np.radians(inclination)
+    cos_w, sin_w = np.cos(argument), np.sin(argument)
+    cos_n, sin_n = np.cos(node), np.sin(node)
+    cos_i, sin_i = np.cos(inclination), np.sin(inclination)
+    rotation = (
+        (cos_w * cos_n - sin_w * sin_n * cos_i, -sin_w * cos_n - cos_w * sin_n * cos_i),
+        (cos_w * sin_n + sin_w * cos_n * cos_i, -sin_w * sin_n + cos_w * cos_n * cos_i),
+        (sin_w * sin_i, cos_w * sin_i),
+    )
+    return a, e, start_anomaly, mean_motion, minor_axis, rotation
+
+
+def _position(body, day):
+    """Position of one body at one time, for use without NumPy."""
+    a, e, inclination, node, perihelion, longitude = body
+    if math.isnan(a):
+        return (math.nan, math.nan, math.nan)
+    mean_anomaly = math.radians(longitude - perihelion + MEAN_MOTION_1AU / a**1.5 * day)
+    mean_anomaly = math.remainder(mean_anomaly, 2 * math.pi)
+    anomaly = _solve_kepler_scalar(mean_anomaly, e)
+    x_plane = a * (math.cos(anomaly) - e)
+    y_plane = a * math.sqrt(1 - e * e) * math.sin(anomaly)
+    argument = math.radians(perihelion - node)
+    node = math.radians(node)
+    inclination = math.radians(inclination)
+    cos_w, sin_w = math.cos(argument), math.sin(argument)
+    cos_n, sin_n = math.cos(node), math.sin(node)
+    cos_i, sin_i = math.cos(inclination), math.sin(inclination)
+    return (
+        (cos_w * cos_n - sin_w * sin_n * cos_i) * x_plane
+        + (-sin_w * cos_n - cos_w * sin_n * cos_i) * y_plane,
+        (cos_w * sin_n + sin_w * cos_n * cos_i) * x_plane
+        + (-sin_w * sin_n + cos_w * cos_n * cos_i) * y_plane,
+        sin_w * sin_i * x_plane + cos_w * sin_i * y_plane,
+    )
+
+
+def position(orbit, day):
+    """Return the (x, y, z) position in AU of one orbit, days after J2000."""
+    return _position(orbit.elements(), day)
+
+
+def closest_approach(first, second=None, start=0.0, end=365.25, step=1.0, farthest=False):
+    """
+    Find when two bodies, or one body and the Sun, are closest together.
+
+    Distances are sampled every step days, then the best sample is refined
+    on a finer grid around it.
+
+    Args:
+        first (Orbit): One body
+        second (Orbit): The other body, or None for the Sun
+        start (float): Start of the search, in days from J2000
+        end (float): End of the search, in days from J2000
+        step (float): Sampling interval, in days
+        farthest (bool): Find the greatest separation instead
+
+    Returns:
+        tuple: (days from J2000, distance in AU)
+    """
+    for _ in range(2):
+        count = max(int((end - start) / step) + 1, 2)
+        days = [start + i * (end - start) / (count - 1) for i in range(count)]
+        separations = _separations(first, second, days)
+        pick = max if farthest else min
+        best = pick(range(count), key=separations.__getitem__)
+        found = days[best], separations[best]
+        # Look again, a hundred times finer, around the best sample
+        step = (end - start) / (count - 1)
+        start, end = max(start, found[0] - step), min(end, found[0] + step)
+        step /= 100
+    return found
+
+
+def _separations(first, second, days):
+    orbits = [first] if second is None else [first, second]
+    elements = list(zip(*(orbit.elements() for orbit in orbits)))
+    found = positions(elements, days)
+    if np is not None:
+        offsets = found[:, 0] if second is None else found[:, 0] - found[:, 1]
+        return np.sqrt((offsets**2).sum(axis=1)).tolist()
+    if second is None:
+        return [math.hypot(*bodies[0]) for bodies in found]
+    return [
+        math.dist(bodies[0], bodies[1]) for bodies in found
+    ]
+
+
+def ecliptic_longitude(x, y):
+    """Return the ecliptic longitude, in degrees from 0 to 360, of a position."""
+    return math.degrees(math.atan2(y, x)) % 360
@@ -1,17 +1,56 @@
-import tkinter as tk
-from tkinter import scrolledtext
-from tkinter import messagebox
 from main import PlanetApp
+from stats import format_snapshot
+from collections import deque
+import queue
+import threading
+import time
 import sys
 import io
 
+# tkinter is imported when the first window is created, so runs that end up
+# in the text interface never pay for it (or fail without it).
+tk = scrolledtext = messagebox = None
+
+# How often, in milliseconds, the GUI checks for finished queries.
+POLL_INTERVAL = 50
+# Quiet time after a keystroke, in milliseconds, before names are suggested.
+SUGGEST_DELAY = 150
+# Most names shown in the suggestion dropdown.
+SUGGESTION_LIMIT = 8
+
+
+def _import_tk():
+    """Import tkinter and its dialog modules on first use."""
+    global tk, scrolledtext, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import messagebox as dialogs
+        from tkinter import scrolledtext as scrolled
+
+        tk, scrolledtext, messagebox = tkinter, scrolled, dialogs
+
 
 class PlanetAppGUI:
     """GUI version of the Planet Information System using Tkinter."""
 
-    def __init__(self, planet_app):
-        """Initialize the GUI with a reference to the planet app."""
+    def __init__(self, planet_app, max_transcript_entries=200):
+        """
+        Initialize the GUI with a reference to the planet app.
+
+        Args:
+            planet_app (PlanetApp): The app whose queries are answered
+            max_transcript_entries (int): Most answers kept in the response
+                area; older ones are trimmed from the top
+        """
+        _import_tk()
         self.planet_app = planet_app
+        self.max_transcript_entries = max_transcript_entries
+        # Character length of each transcript entry, oldest first
+        self._entry_lengths = deque()
+        # Pending debounced suggestion lookup, and the word it is for
+        self._suggest_job = None
+        self._suggest_prefix = ""
+
         self.root = tk.Tk()
         self.root.title("Solar System Information System")
         self.root.geometry("700x500")
@@ -19,8 +58,24 @@ class PlanetAppGUI:
 
         self.create_widgets()
 
+        # Queries are answered on a worker thread so slow answers never
+        # freeze the window; results come back through a queue that the
+        # Tk main loop polls.
+        self._queries = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=self._answer_queries, daemon=True)
+        self._worker.start()
+        self.root.after(POLL_INTERVAL, self._poll_results)
+
     def create_widgets(self):
         """Create and arrange GUI widgets."""
+        # Menu bar
+        menu_bar = tk.Menu(self.root)
+        view_menu = tk.Menu(menu_bar, tearoff=0)
+        view_menu.add_command(label="Query Statistics", command=self.show_stats)
+        menu_bar.add_cascade(label="View", menu=view_menu)
+        self.root.config(menu=menu_bar)
+
         # Frame for the entire layout
         main_frame = tk.Frame(self.root, padx=10, pady=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -58,6 +113,15 @@ class PlanetAppGUI:
         self.query_entry = tk.Entry(input_frame)
         self.query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.query_entry.bind("<Return>", self.on_submit)
+        self.query_entry.bind("<KeyRelease>", self.on_key_release)
+        self.query_entry.bind("<Down>", self.focus_suggestions)
+        self.query_entry.bind("<Escape>", lambda event: self.hide_suggestions())
+
+        # Autocomplete dropdown, placed under the entry while it has names
+        self.suggestions = tk.Listbox(main_frame, height=SUGGESTION_LIMIT)
+        self.suggestions.bind("<Return>", self.accept_suggestion)
+        self.suggestions.bind("<Double-Button-1>", self.accept_suggestion)
+        self.suggestions.bind("<Escape>", lambda event: self.hide_suggestions())
 
         submit_button = tk.Button(input_frame, text="Ask", command=self.on_submit)
         submit_button.pack(side=tk.LEFT, padx=(5, 0))
@@ -97,6 +161,7 @@ class PlanetAppGUI:
     def on_submit(self, event=None):
         """Handle submission of a query."""
         query = self.query_entry.get().strip()
+        self.hide_suggestions()
 
         if not query:
             messagebox.showwarning("Empty Query", "Please enter a question.")
@@ -109,12 +174,128 @@ class PlanetAppGUI:
         self.query_entry.delete(0, tk.END)
 
     def process_query(self, query):
-        """Process a query and display the result."""
-        # Get the response from the query processor
-        response = self.planet_app.query_processor.process_query(query)
+        """Send a query to the worker thread; the answer is shown when ready."""
+        self._queries.put(("query", query))
 
-        # Display the query and response
-        self.update_response_text(f"Q: {query}\n\n{response}\n\n{'-' * 50}\n\n")
+    def on_key_release(self, event):
+        """Schedule a suggestion lookup once typing pauses."""
+        if event.keysym in ("Return", "Escape", "Down", "Up"):
+            return
+        if self._suggest_job is not None:
+            self.root.after_cancel(self._suggest_job)
+        self._suggest_job = self.root.after(SUGGEST_DELAY, self.request_suggestions)
+
+    def request_suggestions(self):
+        """Ask the worker for names starting with the word being typed."""
+        self._suggest_job = None
+        text = self.query_entry.get()
+        words = text.split()
+        prefix = words[-1] if words and not text[-1].isspace() else ""
+        self._suggest_prefix = prefix
+        if not prefix:
+            self.hide_suggestions()
+            return
+        self._queries.put(("complete", prefix))
+
+    def show_suggestions(self, names):
+        """Fill the dropdown with names, or hide it if there are none."""
+        self.suggestions.delete(0, tk.END)
+        if not names:
+            self.hide_suggestions()
+            return
+        for name in names:
+            self.suggestions.insert(tk.END, name)
+        self.suggestions.config(height=len(names))
+        self.suggestions.place(
+            in_=self.query_entry, relx=0, rely=1, relwidth=1, anchor="nw"
+        )
+        self.suggestions.lift()
+
+    def hide_suggestions(self):
+        """Hide the dropdown and drop any pending lookup."""
+        if self._suggest_job is not None:
+            self.root.after_cancel(self._suggest_job)
+            self._suggest_job = None
+        self._suggest_prefix = ""
+        self.suggestions.place_forget()
+
+    def focus_suggestions(self, event=None):
+        """Move the keyboard focus into the dropdown when it is showing."""
+        if self.suggestions.winfo_ismapped():
+            self.suggestions.focus_set()
+            self.suggestions.selection_clear(0, tk.END)
+            self.suggestions.selection_set(0)
+            self.suggestions.activate(0)
+        return "break"
+
+    def accept_suggestion(self, event=None):
+        """Replace the word being typed with the chosen name."""
+        selection = self.suggestions.curselection()
+        if selection:
+            name = self.suggestions.get(selection[0])
+            text = self.query_entry.get().rstrip()
+            words = text.split()
+            start = text.rfind(words[-1]) if words else len(text)
+            self.query_entry.delete(start, tk.END)
+            self.query_entry.insert(start, name)
+        self.hide_suggestions()
+        self.query_entry.focus_set()
+        self.query_entry.icursor(tk.END)
+        return "break"
+
+    def _answer_queries(self):
+        """
+        Answer queries and suggestion lookups on the worker thread.
+
+        Both go through this one thread, which owns the query processor.
+        Data file reloads publish a new version of the solar system
+        without waiting for it; each lookup reads the latest one.
+        """
+        processor = self.planet_app.query_processor
+        while True:
+            request = self._queries.get()
+            if request is None:
+                return
+            kind, text = request
+            if kind == "complete":
+                try:
+                    names = self.planet_app.solar_system.complete_names(
+                        text, limit=SUGGESTION_LIMIT
+                    )
+                except Exception:
+                    names = []
+                self._results.put((kind, text, names))
+                continue
+            try:
+                response = processor.process_query(text)
+            except Exception as error:
+                response = f"Sorry, something went wrong: {error}"
+            self._results.put((kind, text, response))
+
+    def _poll_results(self):
+        """Show any answers the worker has finished, then poll again."""
+        try:
+            while True:
+                kind, text, result = self._results.get_nowait()
+                if kind == "complete":
+                    # Suggestions for a word that has since changed are stale
+                    if text == self._suggest_prefix:
+                        self.show_suggestions(result)
+                    continue
+                # Display the query and response
+                self.update_response_text(
+                    f"Q: {text}\n\n{result}\n\n{'-' * 50}\n\n"
+                )
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL, self._poll_results)
+
+    def show_stats(self):
+        """Append the query statistics to the response area."""
+        snapshot = self.planet_app.query_processor.stats_snapshot()
+        self.update_response_text(
+            f"Query statistics:\n{format_snapshot(snapshot)}\n\n{'-' * 50}\n\n"
+        )
 
     def process_special_query(self, query):
         """Process a special query triggered by a button."""
@@ -123,9 +304,17 @@ class PlanetAppGUI:
         self.process_query(query)
 
     def update_response_text(self, text):
-        """Update the response text area with new text."""
+        """Append an entry to the response text area, trimming old ones."""
         self.response_text.config(state=tk.NORMAL)
         self.response_text.insert(tk.END, text)
+        self._entry_lengths.append(len(text))
+
+        # Keep the transcript bounded so long sessions stay responsive
+        excess = len(self._entry_lengths) - self.max_transcript_entries
+        if excess > 0:
+            trimmed = sum(self._entry_lengths.popleft() for _ in range(excess))
+            self.response_text.delete("1.0", f"1.0 + {trimmed} chars")
+
         self.response_text.see(tk.END)  # Scroll to the end
         self.response_text.config(state=tk.DISABLED)
 
@@ -134,10 +323,14 @@ class PlanetAppGUI:
         self.response_text.config(state=tk.NORMAL)
         self.response_text.delete(1.0, tk.END)
         self.response_text.config(state=tk.DISABLED)
+        self._entry_lengths.clear()
 
     def run(self):
         """Run the GUI application."""
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            self._queries.put(None)
 
 
 # This code should be added to main.py or in a separate file
@@ -159,10 +352,15 @@ if __name__ == "__main__":
     import sys
 
     app = PlanetApp()
+    load_start = time.perf_counter()
     app.load_data()
+    if "--startup-profile" in sys.argv[1:]:
+        print(app.startup_report(time.perf_counter() - load_start), file=sys.stderr)
+    if "--no-watch" not in sys.argv[1:]:
+        app.watch_data()
 
     # Check for command line arguments
-    if len(sys.argv) > 1 and sys.argv[1].lower() == "--gui":
+    if "--gui" in sys.argv[1:]:
         # Run GUI interface
         try:
             gui = PlanetAppGUI(app)
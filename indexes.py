@@ -0,0 +1,243 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+from lazy import lazy_import
+
+# NumPy is optional; it only speeds up bulk builds, and is loaded the
+# first time one needs it.
+np = lazy_import("numpy")
+
+# Below this many pending entries, merging inserts them one at a time.
+_INSERT_LIMIT = 64
+
+
+class SortedIndex:
+    """
+    Values kept in order of a numeric key, for range lookups with bisect.
+
+    New entries are buffered and merged in on the next lookup, so adding
+    many entries in a row costs one sort and merge rather than a list
+    insertion each. Entries with equal keys keep the order they were
+    added in.
+    """
+
+    def __init__(self, typecode=None):
+        """
+        Create an empty index.
+
+        Args:
+            typecode (str): Array type code for the values, such as "q"
+                for row numbers; None stores any Python objects
+        """
+        self._typecode = typecode
+        self.keys = array("d")
+        self.values = self._new_values()
+        self._pending = []
+
+    def _new_values(self, items=()):
+        if self._typecode is None:
+            return list(items)
+        return array(self._typecode, items)
+
+    @classmethod
+    def build_positions(cls, keys):
+        """
+        Build an index in bulk whose values are the positions of the keys.
+
+        Keys that are NaN (unknown values) are left out.
+        """
+        index = cls("q")
+        if np is not None:
+            key_array = np.asarray(keys, dtype=np.float64)
+            positions = np.flatnonzero(~np.isnan(key_array))
+            order = positions[np.argsort(key_array[positions], kind="stable")]
+            index.keys.frombytes(key_array[order].tobytes())
+            index.values.frombytes(order.astype(np.int64).tobytes())
+            return index
+        positions = [i for i in range(len(keys)) if not math.isnan(keys[i])]
+        positions.sort(key=keys.__getitem__)
+        index.keys = array("d", (keys[i] for i in positions))
+        index.values = array("q", positions)
+        return index
+
+    def __len__(self):
+        return len(self.keys) + len(self._pending)
+
+    def add(self, key, value):
+        self._pending.append((key, value))
+
+    def copy(self):
+        """Return an independent copy of the index."""
+        other = SortedIndex(self._typecode)
+        other.keys = self.keys[:]
+        other.values = self.values[:]
+        other._pending = list(self._pending)
+        return other
+
+    def flush(self):
+        """
+        Merge the buffered entries in now rather than on the next lookup.
+
+        Lookups on an index with nothing buffered never change it, so it
+        can then be read from several threads at once.
+        """
+        if not self._pending:
+            return
+        pending = sorted(self._pending, key=lambda item: item[0])
+        self._pending = []
+        if len(pending) <= _INSERT_LIMIT:
+            for key, value in pending:
+                position = bisect_right(self.keys, key)
+                self.keys.insert(position, key)
+                self.values.insert(position, value)
+            return
+        merged = list(
+            heapq.merge(zip(self.keys, self.values), pending, key=lambda item: item[0])
+        )
+        self.keys = array("d", (key for key, _ in merged))
+        self.values = self._new_values(value for _, value in merged)
+
+    def discard(self, key, value):
+        """
+        Remove one entry with this key and value, if there is one.
+
+        Returns:
+            bool: True if an entry was removed
+        """
+        self.flush()
+        start = bisect_left(self.keys, key)
+        stop = bisect_right(self.keys, key)
+        for position in range(start, stop):
+            if self.values[position] == value:
+                del self.keys[position]
+                del self.values[position]
+                return True
+        return False
+
+    def remove_row(self, row):
+        """
+        Renumber row values after row was removed from the table they index.
+
+        The entry for row itself must already have been discarded; every
+        value above it moves down by one. Only for indexes of row numbers.
+        """
+        self.flush()
+        if np is not None and len(self.values):
+            values = np.frombuffer(self.values, dtype=np.int64)
+            values[values > row] -= 1
+            return
+        self.values = array(
+            self._typecode, (value - 1 if value > row else value for value in self.values)
+        )
+
+    def remove_rows(self, rows):
+        """
+        Renumber row values after several rows were removed, as remove_row().
+
+        Args:
+            rows (list): The removed rows, sorted
+        """
+        self.flush()
+        if np is not None and len(self.values):
+            values = np.frombuffer(self.values, dtype=np.int64)
+            values -= np.searchsorted(np.asarray(rows, dtype=np.int64), values)
+            return
+        self.values = array(
+            self._typecode, (value - bisect_left(rows, value) for value in self.values)
+        )
+
+    def span(self, low=None, high=None, include_low=True, include_high=True):
+        """
+        Find the positions of the entries with keys inside a range.
+
+        Args:
+            low (float): Lower bound, or None for no bound
+            high (float): Upper bound, or None for no bound
+            include_low (bool): Whether keys equal to low are included
+            include_high (bool): Whether keys equal to high are included
+
+        Returns:
+            tuple: (start, stop) positions; stop - start entries match
+        """
+        self.flush()
+        start = 0
+        stop = len(self.keys)
+        if low is not None:
+            start = (bisect_left if include_low else bisect_right)(self.keys, low)
+        if high is not None:
+            stop = (bisect_right if include_high else bisect_left)(self.keys, high)
+        return start, max(start, stop)
+
+    def items(self, start, stop):
+        """Yield (key, value) pairs between two positions from span()."""
+        return zip(self.keys[start:stop], self.values[start:stop])
+
+
+class PrefixIndex:
+    """
+    Names kept in order of a normalized key, for prefix lookups with bisect.
+
+    Finding the names that start with a prefix costs a binary search plus
+    one step per name returned. As with SortedIndex, new names are buffered
+    and merged in on the next lookup.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.names = []
+        self._pending = []
+
+    def __len__(self):
+        return len(self.keys) + len(self._pending)
+
+    def add(self, key, name):
+        self._pending.append((key, name))
+
+    def copy(self):
+        """Return an independent copy of the index."""
+        other = PrefixIndex()
+        other.keys = list(self.keys)
+        other.names = list(self.names)
+        other._pending = list(self._pending)
+        return other
+
+    def flush(self):
+        """Merge the buffered names in now, as for SortedIndex.flush()."""
+        if not self._pending:
+            return
+        pending = sorted(self._pending)
+        self._pending = []
+        if len(pending) <= _INSERT_LIMIT:
+            for key, name in pending:
+                # Equal keys stay in order of name, as after a merge
+                position = bisect_left(self.keys, key)
+                stop = bisect_right(self.keys, key, position)
+                while position < stop and self.names[position] <= name:
+                    position += 1
+                self.keys.insert(position, key)
+                self.names.insert(position, name)
+            return
+        merged = list(heapq.merge(zip(self.keys, self.names), pending))
+        self.keys = [key for key, _ in merged]
+        self.names = [name for _, name in merged]
+
+    def discard(self, key, name):
+        """Remove one entry for this key and name, if there is one."""
+        self.flush()
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.names[position] == name:
+                del self.keys[position]
+                del self.names[position]
+                return
+            position += 1
+
+    def complete(self, prefix):
+        """Yield (key, name) for every entry whose key starts with prefix."""
+        self.flush()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            yield self.keys[position], self.names[position]
+            position += 1
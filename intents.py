@@ -0,0 +1,228 @@
+from matcher import NameMatcher
+
+# Phrase -> intent. Phrases are matched on whole words in a single pass.
+INTENT_KEYWORDS = {
+    "in the list": "membership",
+    "included": "membership",
+    "mass": "mass",
+    "massive": "mass",
+    "distance": "distance",
+    "far": "distance",
+    "from sun": "distance",
+    "from the sun": "distance",
+    "moon": "moons",
+    "moons": "moons",
+    "satellite": "moons",
+    "satellites": "moons",
+    "list": "list",
+    "planet": "planets",
+    "planets": "planets",
+    "heavier": "heavier",
+    "more massive": "heavier",
+    "lighter": "lighter",
+    "less massive": "lighter",
+    "farther": "farther",
+    "further": "farther",
+    "more distant": "farther",
+    "closer": "closer",
+    "nearer": "closer",
+    "more moons": "more_moons",
+    "fewer moons": "fewer_moons",
+    "less moons": "fewer_moons",
+    "heaviest": "heaviest",
+    "most massive": "heaviest",
+    "lightest": "lightest",
+    "least massive": "lightest",
+    "farthest": "farthest",
+    "furthest": "farthest",
+    "most distant": "farthest",
+    "closest": "closest",
+    "nearest": "closest",
+    "most moons": "most_moons",
+    "fewest moons": "fewest_moons",
+    "least moons": "fewest_moons",
+    "sort": "sort",
+    "sorted": "sort",
+    "order": "sort",
+    "ordered": "sort",
+    "rank": "sort",
+    "ranked": "sort",
+    "between": "between",
+    "larger": "larger",
+    "bigger": "larger",
+    "smaller": "smaller",
+    "more than": "above",
+    "greater than": "above",
+    "above": "above",
+    "less than": "below",
+    "fewer than": "below",
+    "below": "below",
+    "orbit": "orbit",
+    "orbits": "orbit",
+    "orbiting": "orbit",
+    "belong to": "orbit",
+    "belongs to": "orbit",
+    "parent": "orbit",
+    "largest": "largest",
+    "biggest": "largest",
+    "smallest": "smallest",
+    "tiniest": "smallest",
+    "where": "position",
+    "position": "position",
+    "located": "position",
+    "when": "when",
+    "year": "period",
+    "years": "period",
+    "period": "period",
+    "orbital period": "period",
+    "light": "light_time",
+    "au": "au",
+    "astronomical unit": "au",
+    "astronomical units": "au",
+    "earth masses": "earth_masses",
+    "jupiter masses": "jupiter_masses",
+}
+
+# Comparative intent -> (column, operator, list label, yes label, no label)
+COMPARISONS = {
+    "heavier": ("mass", ">", "heavier than", "is heavier than", "is not heavier than"),
+    "lighter": ("mass", "<", "lighter than", "is lighter than", "is not lighter than"),
+    "farther": (
+        "distance_from_sun",
+        ">",
+        "farther from the Sun than",
+        "is farther from the Sun than",
+        "is not farther from the Sun than",
+    ),
+    "closer": (
+        "distance_from_sun",
+        "<",
+        "closer to the Sun than",
+        "is closer to the Sun than",
+        "is not closer to the Sun than",
+    ),
+    "more_moons": (
+        "moon_count",
+        ">",
+        "with more moons than",
+        "has more moons than",
+        "does not have more moons than",
+    ),
+    "fewer_moons": (
+        "moon_count",
+        "<",
+        "with fewer moons than",
+        "has fewer moons than",
+        "does not have fewer moons than",
+    ),
+}
+
+# Range intent -> operator; numbers in the query are the bounds
+RANGES = {
+    "between": "between",
+    "larger": ">",
+    "smaller": "<",
+    "above": ">",
+    "below": "<",
+}
+
+# Column -> (bodies, above label, below label, between label)
+RANGE_LABELS = {
+    "mass": (
+        "planets",
+        "heavier than {} × 10^24 kg",
+        "lighter than {} × 10^24 kg",
+        "with a mass between {} and {} × 10^24 kg",
+    ),
+    "distance_from_sun": (
+        "planets",
+        "farther from the Sun than {} million km",
+        "closer to the Sun than {} million km",
+        "between {} and {} million km from the Sun",
+    ),
+    "moon_count": (
+        "planets",
+        "with more than {} moons",
+        "with fewer than {} moons",
+        "with between {} and {} moons",
+    ),
+    "diameter": (
+        "moons",
+        "larger than {} km",
+        "smaller than {} km",
+        "between {} and {} km across",
+    ),
+}
+
+# Superlative intent -> (column, largest first, singular, plural)
+SUPERLATIVES = {
+    "heaviest": ("mass", True, "most massive planet", "most massive planets"),
+    "lightest": ("mass", False, "least massive planet", "least massive planets"),
+    "farthest": (
+        "distance_from_sun",
+        True,
+        "planet farthest from the Sun",
+        "planets farthest from the Sun",
+    ),
+    "closest": (
+        "distance_from_sun",
+        False,
+        "planet closest to the Sun",
+        "planets closest to the Sun",
+    ),
+    "most_moons": (
+        "moon_count",
+        True,
+        "planet with the most moons",
+        "planets with the most moons",
+    ),
+    "fewest_moons": (
+        "moon_count",
+        False,
+        "planet with the fewest moons",
+        "planets with the fewest moons",
+    ),
+}
+
+# Moon superlative intent -> (largest first, singular, plural)
+MOON_SUPERLATIVES = {
+    "largest": (True, "largest moon", "largest moons"),
+    "smallest": (False, "smallest moon", "smallest moons"),
+}
+
+NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+}
+
+INTENT_MATCHER = NameMatcher()
+for _phrase, _intent in INTENT_KEYWORDS.items():
+    INTENT_MATCHER.add(_phrase, _intent)
+
+
+def format_value(planet, field):
+    """Format a planet's field the way the single-planet answers do."""
+    if field == "mass":
+        return f"{planet.mass} × 10^24 kg"
+    if field == "distance_from_sun":
+        return f"{planet.distance_from_sun} million km"
+    count = planet.get_moon_count()
+    return f"{count} moon{'s' if count != 1 else ''}"
+
+
+def requested_count(tokens):
+    """Return how many results a query asks for, e.g. "top 3"; 1 by default."""
+    for token in tokens:
+        if token.isdigit():
+            return max(int(token), 1)
+        if token in NUMBER_WORDS:
+            return NUMBER_WORDS[token]
+    return 1
@@ -0,0 +1,51 @@
+import importlib.util
+import sys
+import types
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access instead of straight away.
+
+    Heavy optional dependencies such as NumPy cost more to import than the
+    rest of the program takes to start, and many runs never touch them.
+    Whether the module is installed is still checked now, so callers can
+    test the result against None as with a guarded import.
+
+    Args:
+        name (str): A top-level module name
+
+    Returns:
+        module: The module, loaded when first used, or None if it is not
+            installed
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return _LazyModule(name)
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that imports it on first attribute access.
+
+    importlib.util.LazyLoader is not safe to use from several threads
+    before Python 3.12: a thread can see the module after loading starts
+    but before it ends. Here the import goes through import_module(),
+    whose import lock makes other threads wait for it to finish, and the
+    stand-in takes on the real module's attributes afterwards.
+    """
+
+    def __getattr__(self, attr):
+        # Only reached for attributes the stand-in does not have yet
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def is_loaded(name):
+    """Return whether a module has been imported, not just lazily."""
+    # The stand-in is never put in sys.modules; the real module is once used
+    return sys.modules.get(name) is not None
@@ -1,157 +1,157 @@
-from models import Moon, Planet, SolarSystem
+import time
 
-class QueryProcessor:
-    """Class for processing natural language queries about planets."""
+# Taken before the other imports, for --startup-profile
+_IMPORT_START = time.perf_counter()
 
-    def __init__(self, solar_system):
-        """
-        Initialize with a solar system.
+import argparse
+import json
+import sys
+from collections import deque
 
-        Args:
-            solar_system (SolarSystem): The solar system to query
-        """
-        self.solar_system = solar_system
+import storage
+from ephemeris import Orbit
+from lazy import is_loaded
+from models import Moon, Planet, SharedSolarSystem, SolarSystem
+from query import QueryProcessor
+from stats import Stats, format_snapshot
+from watcher import FileWatcher, diff_records, read_records
 
-    def process_query(self, query):
-        """
-        Process a natural language query and return the answer.
-
-        Args:
-            query (str): The query string
-
-        Returns:
-            str: The answer to the query
-        """
-        query = query.lower().strip()
-
-        # Check for planet name in query
-        planet_name = None
-        for name in self.solar_system.get_all_planet_names():
-            if name.lower() in query:
-                planet_name = name
-                break
-
-        # If planet found in query
-        if planet_name:
-            planet = self.solar_system.get_planet_by_name(planet_name)
-
-            # Check for specific attribute queries
-            if "mass" in query or "massive" in query:
-                return f"{planet_name} has a mass of {planet.mass} × 10^24 kg."
-
-            elif (
-                "distance" in query
-                or "far" in query
-                or "from sun" in query
-                or "from the sun" in query
-            ):
-                return f"{planet_name} is {planet.distance_from_sun} million km from the Sun."
-
-            elif (
-                "moon" in query
-                or "moons" in query
-                or "satellite" in query
-                or "satellites" in query
-            ):
-                count = planet.get_moon_count()
-                if count == 0:
-                    return f"{planet_name} doesn't have any moons in our database."
-                else:
-                    moon_names = [moon.name for moon in planet.moons]
-                    return f"{planet_name} has {count} moons in our database: {', '.join(moon_names)}."
-
-            else:
-                # Default to showing everything about the planet
-                return f"Information about {planet_name}:\n{planet}"
-
-        # Check for list presence queries
-        if "in the list" in query or "included" in query:
-            for name in self.solar_system.get_all_planet_names():
-                if name.lower() in query:
-                    return f"Yes, {name} is in the list of planets."
-
-            # Check if Pluto specifically is mentioned
-            if "pluto" in query:
-                if "Pluto" in self.solar_system.get_all_planet_names():
-                    return "Yes, Pluto is in the list of planets."
-                else:
-                    return "No, Pluto is not in the list of planets. It was reclassified as a dwarf planet in 2006."
-
-            # If no specific planet was found in the query
-            return "I couldn't identify which planet you're asking about."
-
-        # Check for moon count queries
-        if (
-            "how many moons" in query or "number of moons" in query
-        ) and "earth" in query:
-            planet = self.solar_system.get_planet_by_name("Earth")
-            if planet:
-                count = planet.get_moon_count()
-                return f"Earth has {count} moon{'s' if count != 1 else ''} in our database."
-
-        # List all planets
-        if "list" in query and "planet" in query:
-            planets = self.solar_system.get_all_planet_names()
-            return f"The planets in our solar system are: {', '.join(planets)}."
-
-        return "I'm not sure how to answer that question. Try asking about a specific planet or attribute."
+_IMPORT_END = time.perf_counter()
 
 
 class PlanetApp:
     """Main application class for the planet information system."""
 
-    def __init__(self, data_file="planet_data.json"):
-        """Initialize the application with data file path."""
-        self.solar_system = SolarSystem()
+    def __init__(self, data_file="planet_data.json", snapshot=True):
+        """
+        Initialize the application with data file path.
+
+        Args:
+            data_file (str): The planet data file
+            snapshot (bool): Keep a snapshot of the data next to it, which
+                loads in constant time, and load from it while it is
+                up to date
+        """
+        # Published versions of the planets; queries read the latest one
+        # while reloads build the next
+        self.shared = SharedSolarSystem()
         self.data_file = data_file
-        self.query_processor = QueryProcessor(self.solar_system)
+        self.snapshot_file = None
+        if snapshot and storage.detect_format(data_file) != "mapped":
+            self.snapshot_file = storage.snapshot_path(data_file)
+        # Where load_data() found the planets: "snapshot", "data file" or
+        # "defaults"
+        self.loaded_from = None
+        # source_stamp() of the data file as loaded, and its records as of
+        # the last reload_data(), by name and by line of the file; read
+        # from the solar system on first use
+        self.data_stamp = None
+        self._records = None
+        self._record_lines = {}
+        self.stats = Stats(enabled=True)
+        self.query_processor = QueryProcessor(self.shared, stats=self.stats)
+
+    @property
+    def solar_system(self):
+        """The latest version of the planets, a frozen SolarSystem."""
+        return self.shared.current()
 
     def initialize_default_data(self):
         """Create default planet data if no file exists."""
+        # Orbital elements are the J2000 mean elements from JPL's
+        # "Approximate Positions of the Planets" (Standish), in
+        # Orbit(a AU, e, i, node, perihelion, mean longitude) order.
+
         # Mercury
-        mercury = Planet("Mercury", 0.330, 57.9)
+        mercury = Planet(
+            "Mercury",
+            0.330,
+            57.9,
+            Orbit(0.38709927, 0.20563593, 7.00497902, 48.33076593, 77.45779628, 252.25032350),
+        )
 
         # Venus
-        venus = Planet("Venus", 4.87, 108.2)
+        venus = Planet(
+            "Venus",
+            4.87,
+            108.2,
+            Orbit(0.72333566, 0.00677672, 3.39467605, 76.67984255, 131.60246718, 181.97909950),
+        )
 
         # Earth
-        earth = Planet("Earth", 5.97, 149.6)
+        earth = Planet(
+            "Earth",
+            5.97,
+            149.6,
+            Orbit(1.00000261, 0.01671123, -0.00001531, 0.0, 102.93768193, 100.46457166),
+        )
         earth.add_moon(Moon("Moon", 3474))
 
         # Mars
-        mars = Planet("Mars", 0.642, 227.9)
+        mars = Planet(
+            "Mars",
+            0.642,
+            227.9,
+            Orbit(1.52371034, 0.09339410, 1.84969142, 49.55953891, -23.94362959, -4.55343205),
+        )
         mars.add_moon(Moon("Phobos", 22))
         mars.add_moon(Moon("Deimos", 12))
 
         # Jupiter
-        jupiter = Planet("Jupiter", 1898, 778.5)
+        jupiter = Planet(
+            "Jupiter",
+            1898,
+            778.5,
+            Orbit(5.20288700, 0.04838624, 1.30439695, 100.47390909, 14.72847983, 34.39644051),
+        )
         jupiter.add_moon(Moon("Io", 3643))
         jupiter.add_moon(Moon("Europa", 3122))
         jupiter.add_moon(Moon("Ganymede", 5262))
         jupiter.add_moon(Moon("Callisto", 4821))
 
         # Saturn
-        saturn = Planet("Saturn", 568, 1434)
+        saturn = Planet(
+            "Saturn",
+            568,
+            1434,
+            Orbit(9.53667594, 0.05386179, 2.48599187, 113.66242448, 92.59887831, 49.95424423),
+        )
         saturn.add_moon(Moon("Titan", 5150))
         saturn.add_moon(Moon("Enceladus", 504))
         saturn.add_moon(Moon("Mimas", 396))
 
         # Uranus
-        uranus = Planet("Uranus", 86.8, 2871)
+        uranus = Planet(
+            "Uranus",
+            86.8,
+            2871,
+            Orbit(19.18916464, 0.04725744, 0.77263783, 74.01692503, 170.95427630, 313.23810451),
+        )
         uranus.add_moon(Moon("Miranda", 472))
         uranus.add_moon(Moon("Ariel", 1158))
         uranus.add_moon(Moon("Umbriel", 1169))
 
         # Neptune
-        neptune = Planet("Neptune", 102, 4495)
+        neptune = Planet(
+            "Neptune",
+            102,
+            4495,
+            Orbit(30.06992276, 0.00859048, 1.77004347, 131.78422574, 44.96476227, -55.12002969),
+        )
         neptune.add_moon(Moon("Triton", 2707))
         neptune.add_moon(Moon("Nereid", 340))
 
         # Pluto (dwarf planet, included for completeness)
-        pluto = Planet("Pluto", 0.0130, 5906)
+        pluto = Planet(
+            "Pluto",
+            0.0130,
+            5906,
+            Orbit(39.48211675, 0.24882730, 17.14001206, 110.30393684, 224.06891629, 238.92903833),
+        )
         pluto.add_moon(Moon("Charon", 1212))
 
         # Add planets to solar system
+        solar_system = SolarSystem()
         for planet in [
             mercury,
             venus,
@@ -163,16 +163,120 @@ class PlanetApp:
             neptune,
             pluto,
         ]:
-            self.solar_system.add_planet(planet)
+            solar_system.add_planet(planet)
+        self.shared.publish(solar_system)
 
         # Save to file
-        self.solar_system.save_to_file(self.data_file)
+        with self.stats.timed("storage", "save"):
+            solar_system.save_to_file(self.data_file)
 
     def load_data(self):
-        """Load planet data from file or initialize default data."""
-        if not self.solar_system.load_from_file(self.data_file):
+        """
+        Load planet data from file or initialize default data.
+
+        An up-to-date snapshot is mapped instead of reading the data file.
+        Otherwise the data file is read and the snapshot rebuilt from it.
+        """
+        snapshot = self.snapshot_file
+        if snapshot and storage.snapshot_is_current(snapshot, self.data_file):
+            solar_system = SolarSystem()
+            with self.stats.timed("storage", "snapshot"):
+                loaded = solar_system.load_from_file(snapshot, "mapped")
+            if loaded:
+                self.shared.publish(solar_system)
+                self.loaded_from = "snapshot"
+                self.data_stamp = storage.source_stamp(self.data_file)
+                return
+
+        # Stamped before reading, so a change made meanwhile is noticed
+        stamp = storage.source_stamp(self.data_file)
+        solar_system = SolarSystem()
+        with self.stats.timed("storage", "load"):
+            loaded = solar_system.load_from_file(self.data_file)
+        self.loaded_from = "data file"
+        if loaded:
+            self.shared.publish(solar_system)
+        else:
             print("Creating default planet data...")
             self.initialize_default_data()
+            stamp = storage.source_stamp(self.data_file)
+            self.loaded_from = "defaults"
+        if snapshot and stamp is not None:
+            self.solar_system.save_snapshot(snapshot, stamp)
+        self.data_stamp = stamp
+
+    def reload_data(self):
+        """
+        Apply the changes made to the data file since it was last read.
+
+        The file is read into records and compared with the previous
+        read; lines of the file seen last time are not decoded again, and
+        only records that are new or differ become planets. They are
+        applied to a copy of the current version with
+        SolarSystem.update_planet() and remove_planet(), so the indexes
+        are patched rather than rebuilt, and the copy is then published.
+        Queries keep being answered from the previous version meanwhile.
+
+        Returns:
+            DataDiff: What changed, or None if the file could not be read
+        """
+        with self.stats.timed("storage", "reload"):
+            records = read_records(self.data_file, lines=self._record_lines)
+            if records is None:
+                return None
+            if self._records is None:
+                self._records = {
+                    record["name"]: record for record in self.solar_system.records()
+                }
+            try:
+                diff = diff_records(self._records, records)
+            except (KeyError, TypeError, ValueError):
+                return None
+            with self.shared.edit() as solar_system:
+                for planet in diff.updated:
+                    solar_system.update_planet(planet)
+                for name in diff.removed:
+                    solar_system.remove_planet(name)
+            self._records = records
+        return diff
+
+    def watch_data(self, interval=0.5):
+        """
+        Reload the data file in the background whenever it changes.
+
+        Args:
+            interval (float): Seconds between checks of the file
+
+        Returns:
+            FileWatcher: The running watcher; stop() it when done
+        """
+        watcher = FileWatcher(self.data_file, self.reload_data, interval, self.data_stamp)
+        watcher.start()
+        return watcher
+
+    def startup_report(self, load_seconds):
+        """
+        Describe how long starting up took, for --startup-profile.
+
+        Args:
+            load_seconds (float): Time spent in load_data()
+        """
+        imports = (_IMPORT_END - _IMPORT_START) * 1000
+        load = load_seconds * 1000
+        source = {
+            "snapshot": f"the snapshot {self.snapshot_file}",
+            "data file": f"{self.data_file}",
+            "defaults": "the built-in defaults",
+        }.get(self.loaded_from, "nowhere")
+        deferred = [name for name in ("numpy", "tkinter") if not is_loaded(name)]
+        lines = [
+            f"Imports: {imports:.1f} ms",
+            f"Loading: {load:.1f} ms, from {source}",
+            f"Total:   {imports + load:.1f} ms",
+        ]
+        if deferred:
+            lines.append(f"Not loaded yet: {', '.join(deferred)}")
+        return "\n".join(lines)
 
     def text_interface(self):
         """Run the text-based user interface."""
@@ -184,7 +288,7 @@ class PlanetApp:
         print("- How massive is Neptune?")
         print("- Is Pluto in the list of planets?")
         print("- How many moons does Earth have?")
-        print("\nType 'exit' to quit the program.")
+        print("\nType ':stats' for query statistics, 'exit' to quit the program.")
         print("=" * 50)
 
         while True:
@@ -197,15 +301,165 @@ class PlanetApp:
             if not query:
                 continue
 
+            if query.lower().startswith(":stats"):
+                print("\n" + self.stats_command(query))
+                continue
+
             answer = self.query_processor.process_query(query)
             print("\n" + answer)
 
+    def stats_command(self, command):
+        """
+        Handle a ":stats" command and return the text to show.
+
+        ":stats" shows the statistics, ":stats reset" clears them and
+        ":stats on" / ":stats off" switch recording.
+        """
+        action = command[len(":stats"):].strip().lower()
+        # The stats of whatever answers queries, which is a Catalogue
+        # with --catalogue
+        stats = self.query_processor.stats
+        if action == "reset":
+            stats.reset()
+            return "Statistics cleared."
+        if action in ("on", "off"):
+            stats.enabled = action == "on"
+            return f"Statistics switched {action}."
+        return format_snapshot(self.query_processor.stats_snapshot())
+
+    def batch_interface(self, input_file, output_file=None, workers=None):
+        """
+        Answer every line of a file, writing one JSON object per line.
+
+        Args:
+            input_file (str): File with one query per line
+            output_file (str): File for the answers; stdout when None
+            workers (int): Number of worker processes
+        """
+        with open(input_file, encoding="utf-8") as infile:
+            queries = (line.strip() for line in infile)
+            queries = (query for query in queries if query)
+            # Tee the queries so each answer can be written with its question
+            pending = deque()
+
+            def remember(stream):
+                for query in stream:
+                    pending.append(query)
+                    yield query
+
+            answers = self.query_processor.process_many(remember(queries), workers)
+            outfile = (
+                open(output_file, "w", encoding="utf-8") if output_file else sys.stdout
+            )
+            try:
+                for answer in answers:
+                    record = {"query": pending.popleft(), "answer": answer}
+                    outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+            finally:
+                if output_file:
+                    outfile.close()
+
     def run(self):
         """Run the application."""
         self.load_data()
         self.text_interface()
 
 
+def parse_args(argv=None):
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Solar System Information Program")
+    parser.add_argument(
+        "--batch", metavar="FILE", help="answer every line of FILE and exit"
+    )
+    parser.add_argument(
+        "--out", metavar="FILE", help="write batch answers to FILE as NDJSON"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="worker processes for --batch"
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="answer NDJSON queries over the network"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve")
+    parser.add_argument("--port", type=int, default=8765, help="port for --serve")
+    parser.add_argument(
+        "--socket", metavar="PATH", help="serve on a Unix socket instead of TCP"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="most requests --serve answers at once",
+    )
+    parser.add_argument(
+        "--catalogue",
+        metavar="DIR",
+        help="answer queries about every system in DIR, one data file each",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=4,
+        help="shards for --catalogue, each in its own process with --workers > 1",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="report how long imports and loading the data took",
+    )
+    parser.add_argument(
+        "--no-watch",
+        action="store_true",
+        help="do not pick up edits to the data file while running",
+    )
+    parser.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="always read the data file rather than its snapshot",
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    app = PlanetApp()
-    app.run()
+    args = parse_args()
+    app = PlanetApp(snapshot=not args.no_snapshot)
+    catalogue = None
+    if args.catalogue:
+        from catalogue import Catalogue
+
+        # The catalogue answers in place of the single solar system.
+        catalogue = Catalogue.load_directory(args.catalogue, args.shards)
+        if args.workers > 1:
+            catalogue.start()
+        app.query_processor = catalogue
+        args.workers = None
+    else:
+        load_start = time.perf_counter()
+        app.load_data()
+        if args.startup_profile:
+            print(app.startup_report(time.perf_counter() - load_start), file=sys.stderr)
+        if not args.batch and not args.no_watch:
+            app.watch_data()
+    if args.batch:
+        app.batch_interface(args.batch, args.out, args.workers)
+    elif args.serve:
+        import asyncio
+
+        from server import serve
+
+        try:
+            asyncio.run(
+                serve(
+                    app.query_processor,
+                    args.host,
+                    args.port,
+                    args.socket,
+                    max_concurrency=args.max_concurrency,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+    else:
+        app.text_interface()
+    if catalogue is not None:
+        catalogue.close()
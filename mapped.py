@@ -0,0 +1,394 @@
+import heapq
+import mmap
+import math
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from ephemeris import ELEMENT_FIELDS
+from matcher import gram_code, tokenize, trigrams
+
+# Memory-mapped catalogue. After a fixed header come 8-byte columns:
+#   planet mass (f64 x P), planet distance (f64 x P),
+#   planet orbital elements (f64 x P for each of ELEMENT_FIELDS, NaN
+#   when unknown; not in SSM1 files),
+#   planet first moon (u64 x P+1), moon diameter (f64 x M, NaN if unknown),
+#   name offsets (u64 x P+M+1; planets first, then moons),
+#   planet order and moon order (u64 x P, u64 x M; ids sorted by name key),
+#   trigram postings of the name keys, for FuzzyIndex (not in SSM1 or SSM2
+#   files): trigram count of each key (u64 x P+M), first trigram of each
+#   key length (u64 x L+1), trigram codes sorted within each length
+#   (u64 x G), first posting of each trigram (u64 x G+1), and postings
+#   (u64 x N; the ids having the trigram, in order),
+# followed by the UTF-8 string table. Ids count planets first, then moons.
+# Columns use native little-endian layout so they can be viewed in place
+# without copying.
+MAPPED_MAGIC = b"SSM3"
+# Earlier versions without trigram postings, and also without orbital
+# elements, still readable
+_MAPPED_MAGIC_V2 = b"SSM2"
+_MAPPED_MAGIC_V1 = b"SSM1"
+MAPPED_EXTENSIONS = (".ssm",)
+
+# magic, planet count, moon count, most tokens in a planet / moon name
+_HEADER = struct.Struct("<4s4xQQII")
+# Sizes of the trigram columns: key lengths + 1, trigrams, postings
+_FUZZY_HEADER = struct.Struct("<QQQ")
+
+
+def name_key(name):
+    """Return the key names are sorted and matched by: their word tokens."""
+    return " ".join(tokenize(name))
+
+
+def _number(value):
+    """Give whole numbers back their int form, as they were written in JSON."""
+    return int(value) if value.is_integer() else value
+
+
+def write_mapped(planets, outfile):
+    """
+    Write planets as a memory-mappable catalogue.
+
+    Unlike the streaming formats this builds every column in memory
+    first, since the name indexes need all names to be sorted.
+    """
+    if sys.byteorder != "little":
+        raise ValueError("Mapped catalogues need a little-endian machine")
+
+    masses = array("d")
+    distances = array("d")
+    orbits = [array("d") for _ in ELEMENT_FIELDS]
+    first_moon = array("Q", [0])
+    diameters = array("d")
+    planet_names = []
+    moon_names = []
+    for planet in planets:
+        masses.append(planet.mass)
+        distances.append(planet.distance_from_sun)
+        elements = (
+            planet.orbit.elements()
+            if planet.orbit is not None
+            else (math.nan,) * len(ELEMENT_FIELDS)
+        )
+        for column, value in zip(orbits, elements):
+            column.append(value)
+        planet_names.append(planet.name)
+        for moon in planet.moons:
+            diameters.append(math.nan if moon.diameter is None else moon.diameter)
+            moon_names.append(moon.name)
+        first_moon.append(len(moon_names))
+
+    strings = [name.encode("utf-8") for name in planet_names + moon_names]
+    name_offsets = array("Q", [0])
+    for data in strings:
+        name_offsets.append(name_offsets[-1] + len(data))
+
+    # Stable sorts, so the first body with a given key comes first.
+    planet_keys = [name_key(name) for name in planet_names]
+    moon_keys = [name_key(name) for name in moon_names]
+    planet_order = array("Q", sorted(range(len(planet_keys)), key=planet_keys.__getitem__))
+    moon_order = array("Q", sorted(range(len(moon_keys)), key=moon_keys.__getitem__))
+
+    # (key length, trigram code) -> ids, so a fuzzy search needs no index
+    # built in memory. Empty keys are never matched, so have no trigrams.
+    # Only the distinct trigrams are encoded, once the postings are known.
+    gram_counts = array("Q")
+    postings_of = {}
+    for body, key in enumerate(planet_keys + moon_keys):
+        grams = trigrams(key) if key else ()
+        gram_counts.append(len(grams))
+        length = len(key)
+        for gram in grams:
+            found = postings_of.get((length, gram))
+            if found is None:
+                found = postings_of[length, gram] = array("Q")
+            found.append(body)
+    longest = max((length for length, _ in postings_of), default=-1)
+    length_starts = array("Q", [0] * (longest + 2))
+    gram_codes = array("Q")
+    gram_starts = array("Q", [0])
+    postings = array("Q")
+    for length, code, gram in sorted(
+        (length, gram_code(gram), gram) for length, gram in postings_of
+    ):
+        length_starts[length + 1] += 1
+        gram_codes.append(code)
+        postings.extend(postings_of[length, gram])
+        gram_starts.append(len(postings))
+    for length in range(longest + 1):
+        length_starts[length + 1] += length_starts[length]
+
+    outfile.write(
+        _HEADER.pack(
+            MAPPED_MAGIC,
+            len(planet_names),
+            len(moon_names),
+            max((key.count(" ") + 1 for key in planet_keys if key), default=0),
+            max((key.count(" ") + 1 for key in moon_keys if key), default=0),
+        )
+    )
+    outfile.write(_FUZZY_HEADER.pack(len(length_starts), len(gram_codes), len(postings)))
+    for column in (
+        masses,
+        distances,
+        *orbits,
+        first_moon,
+        diameters,
+        name_offsets,
+        planet_order,
+        moon_order,
+        gram_counts,
+        length_starts,
+        gram_codes,
+        gram_starts,
+        postings,
+    ):
+        column.tofile(outfile)
+    for data in strings:
+        outfile.write(data)
+
+
+class MappedCatalogue:
+    """
+    Read-only view of a mapped catalogue file.
+
+    Opening only maps the file and reads the header; pages are read by the
+    operating system as bodies are looked up. Planets and moons are
+    addressed by their position in the file.
+    """
+
+    def __init__(self, file_path):
+        """
+        Map a catalogue file.
+
+        Raises:
+            OSError: If the file cannot be opened
+            ValueError: If the file is not a complete mapped catalogue
+        """
+        self.file_path = file_path
+        self._open()
+
+    def _open(self):
+        if sys.byteorder != "little":
+            raise ValueError("Mapped catalogues need a little-endian machine")
+        with open(self.file_path, "rb") as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError("Not a mapped planet catalogue")
+        magic, planets, moons, self._planet_tokens, self._moon_tokens = (
+            _HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic not in (MAPPED_MAGIC, _MAPPED_MAGIC_V2, _MAPPED_MAGIC_V1):
+            raise ValueError("Not a mapped planet catalogue")
+        self.planet_count = planets
+        self.moon_count = moons
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        # Whether the file has trigram postings for FuzzyIndex
+        self.has_fuzzy_index = magic == MAPPED_MAGIC
+        if self.has_fuzzy_index:
+            if len(view) < offset + _FUZZY_HEADER.size:
+                raise ValueError("Truncated mapped catalogue")
+            lengths, grams, postings = _FUZZY_HEADER.unpack_from(view, offset)
+            offset += _FUZZY_HEADER.size
+
+        def column(code, count):
+            nonlocal offset
+            end = offset + 8 * count
+            if end > len(view):
+                raise ValueError("Truncated mapped catalogue")
+            data = view[offset:end].cast(code)
+            offset = end
+            return data
+
+        self.masses = column("d", planets)
+        self.distances = column("d", planets)
+        # Orbital element columns by field, or None for SSM1 files
+        self.orbits = None
+        if magic != _MAPPED_MAGIC_V1:
+            self.orbits = {field: column("d", planets) for field in ELEMENT_FIELDS}
+        self.first_moon = column("Q", planets + 1)
+        self.diameters = column("d", moons)
+        self._name_offsets = column("Q", planets + moons + 1)
+        self._planet_order = column("Q", planets)
+        self._moon_order = column("Q", moons)
+        self.fuzzy_sizes = None
+        if self.has_fuzzy_index:
+            self.fuzzy_sizes = column("Q", planets + moons)
+            self._fuzzy_length_starts = column("Q", lengths)
+            self._fuzzy_grams = column("Q", grams)
+            self._fuzzy_gram_starts = column("Q", grams + 1)
+            self._fuzzy_postings = column("Q", postings)
+        self._strings = offset
+        if offset + self._name_offsets[-1] > len(view):
+            raise ValueError("Truncated mapped catalogue")
+
+    def __getstate__(self):
+        # Mappings cannot be pickled; worker processes map the file again.
+        return {"file_path": self.file_path}
+
+    def __setstate__(self, state):
+        self.file_path = state["file_path"]
+        self._open()
+
+    def __len__(self):
+        return self.planet_count
+
+    def _name(self, index):
+        start = self._strings + self._name_offsets[index]
+        end = self._strings + self._name_offsets[index + 1]
+        return self._mmap[start:end].decode("utf-8")
+
+    def planet_name(self, index):
+        return self._name(index)
+
+    def moon_name(self, index):
+        return self._name(self.planet_count + index)
+
+    def planet(self, index):
+        """
+        Read one planet.
+
+        Returns:
+            tuple: (name, mass, distance_from_sun, [(moon name, diameter)],
+                orbital elements in ELEMENT_FIELDS order or None)
+        """
+        moons = []
+        for moon in range(self.first_moon[index], self.first_moon[index + 1]):
+            diameter = self.diameters[moon]
+            moons.append(
+                (
+                    self.moon_name(moon),
+                    None if math.isnan(diameter) else _number(diameter),
+                )
+            )
+        orbit = None
+        if self.orbits is not None and not math.isnan(
+            self.orbits["semi_major_axis"][index]
+        ):
+            orbit = tuple(self.orbits[field][index] for field in ELEMENT_FIELDS)
+        return (
+            self.planet_name(index),
+            _number(self.masses[index]),
+            _number(self.distances[index]),
+            moons,
+            orbit,
+        )
+
+    def moon_owner(self, moon):
+        """Return (planet index, position among its moons) for a moon."""
+        planet = bisect_right(self.first_moon, moon) - 1
+        return planet, moon - self.first_moon[planet]
+
+    def _with_key(self, order, name_of, key):
+        """Yield the ids whose name key equals key, in file order."""
+        position = bisect_left(order, key, key=lambda i: name_key(name_of(i)))
+        while position < len(order):
+            index = order[position]
+            name = name_of(index)
+            if name_key(name) != key:
+                return
+            yield index, name
+            position += 1
+
+    def find_planet(self, name):
+        """Return the index of the first planet with this name, or None."""
+        folded = name.casefold()
+        for index, found in self._with_key(
+            self._planet_order, self.planet_name, name_key(name)
+        ):
+            if found.casefold() == folded:
+                return index
+        return None
+
+    def find_moon(self, name):
+        """Return the index of the first moon with this name, or None."""
+        folded = name.casefold()
+        for index, found in self._with_key(
+            self._moon_order, self.moon_name, name_key(name)
+        ):
+            if found.casefold() == folded:
+                return index
+        return None
+
+    def complete(self, prefix):
+        """
+        Yield (key, name) for every body whose name key starts with prefix.
+
+        Planets and moons are merged in key order.
+        """
+        streams = []
+        for order, name_of in (
+            (self._planet_order, self.planet_name),
+            (self._moon_order, self.moon_name),
+        ):
+            streams.append(self._key_prefix(order, name_of, prefix))
+        return heapq.merge(*streams)
+
+    def _key_prefix(self, order, name_of, prefix):
+        position = bisect_left(order, prefix, key=lambda i: name_key(name_of(i)))
+        while position < len(order):
+            name = name_of(order[position])
+            key = name_key(name)
+            if not key.startswith(prefix):
+                return
+            yield key, name
+            position += 1
+
+    @property
+    def fuzzy_count(self):
+        """Number of bodies, planets and moons, addressed by id."""
+        return self.planet_count + self.moon_count
+
+    def body_name(self, body):
+        """Return the name of a planet or moon by id."""
+        return self._name(body)
+
+    def fuzzy_key(self, body):
+        return name_key(self._name(body))
+
+    def fuzzy_postings(self, gram, length):
+        """Return the sorted ids whose name key has length and trigram gram."""
+        if not 0 <= length < len(self._fuzzy_length_starts) - 1:
+            return ()
+        low = self._fuzzy_length_starts[length]
+        high = self._fuzzy_length_starts[length + 1]
+        code = gram_code(gram)
+        position = bisect_left(self._fuzzy_grams, code, low, high)
+        if position == high or self._fuzzy_grams[position] != code:
+            return ()
+        start = self._fuzzy_gram_starts[position]
+        return self._fuzzy_postings[start : self._fuzzy_gram_starts[position + 1]]
+
+    def fuzzy_ids(self, name):
+        """Yield the ids of the planets, then moons, named exactly name."""
+        key = name_key(name)
+        for index, found in self._with_key(self._planet_order, self.planet_name, key):
+            if found == name:
+                yield index
+        for index, found in self._with_key(self._moon_order, self.moon_name, key):
+            if found == name:
+                yield self.planet_count + index
+
+    def match_at(self, tokens, start):
+        """
+        Find the longest body name starting at tokens[start].
+
+        Returns:
+            tuple: (("planet", index) or ("moon", index), end) or None
+        """
+        longest = max(self._planet_tokens, self._moon_tokens)
+        for end in range(min(len(tokens), start + longest), start, -1):
+            key = " ".join(tokens[start:end])
+            if end - start <= self._planet_tokens:
+                for index, _ in self._with_key(
+                    self._planet_order, self.planet_name, key
+                ):
+                    return ("planet", index), end
+            if end - start <= self._moon_tokens:
+                for index, _ in self._with_key(self._moon_order, self.moon_name, key):
+                    return ("moon", index), end
+        return None
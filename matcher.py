@@ -0,0 +1,427 @@
+import re
+from array import array
+from bisect import bisect_left
+
+# Decimal numbers such as "1.5" or "1,000" are kept as one token.
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)+|\w+")
+
+
+def tokenize(text):
+    """Split text into case-folded word tokens."""
+    return _TOKEN_RE.findall(text.casefold())
+
+
+class NameMatcher:
+    """
+    Token trie that finds every known name mentioned in a piece of text.
+
+    Names are matched on whole words, so "Mars" is found in "mars?" but not
+    in "marshmallow", and a query is scanned once however many names exist.
+    """
+
+    # Tokens are never empty, so "" can safely mark the end of a name.
+    _END = ""
+
+    def __init__(self):
+        self._root = {}
+        # ids of the nodes this matcher may change in place; None when it
+        # shares no nodes with another matcher
+        self._owned = None
+
+    def copy(self):
+        """
+        Return an independent matcher with the same names.
+
+        The two share their trie nodes until one of them changes: a change
+        copies just the nodes on the path to the name it touches, so
+        copying costs nothing however many names there are.
+        """
+        other = NameMatcher()
+        other._root = self._root
+        other._owned = set()
+        self._owned = set()
+        return other
+
+    def _child(self, node, token, create):
+        """Return node's child for token, ready to change, or None."""
+        child = node.get(token)
+        if child is None:
+            if not create:
+                return None
+            child = node[token] = {}
+        elif self._owned is None or id(child) in self._owned:
+            return child
+        else:
+            child = node[token] = dict(child)
+        if self._owned is not None:
+            self._owned.add(id(child))
+        return child
+
+    def _writable_root(self):
+        if self._owned is not None and id(self._root) not in self._owned:
+            self._root = dict(self._root)
+            self._owned.add(id(self._root))
+        return self._root
+
+    def add(self, name, payload):
+        """
+        Register a name. The first payload added under a name is kept.
+
+        Args:
+            name (str): The name to match
+            payload: The value returned when the name is found
+        """
+        tokens = tokenize(name)
+        if not tokens:
+            return
+        node = self._writable_root()
+        for token in tokens:
+            node = self._child(node, token, True)
+        node.setdefault(self._END, payload)
+
+    def remove(self, name, payload):
+        """
+        Unregister a name, if it is registered with this payload.
+
+        Returns:
+            bool: True if the name was removed
+        """
+        tokens = tokenize(name)
+        node = self._root
+        for token in tokens:
+            node = node.get(token)
+            if node is None:
+                return False
+        if self._END not in node or node[self._END] != payload:
+            return False
+        node = self._writable_root()
+        for token in tokens:
+            node = self._child(node, token, False)
+        del node[self._END]
+        return True
+
+    def match_at(self, tokens, start):
+        """
+        Find the longest registered name starting at tokens[start].
+
+        Returns:
+            tuple: (payload, end) where end is the index after the name,
+                or None if no name starts there
+        """
+        node = self._root
+        match = None
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if self._END in node:
+                match = (node[self._END], end + 1)
+        return match
+
+    def find_all(self, text=None, tokens=None, spans=False):
+        """
+        Find every registered name in text, in order of appearance.
+
+        At each position the longest name wins, and matches never overlap.
+
+        Args:
+            text (str): The text to scan
+            tokens (list): Already tokenized text, used instead of text
+            spans (bool): Give (payload, start, end) for each name, where
+                tokens[start:end] is the name
+
+        Returns:
+            list: The payloads of the names found
+        """
+        if tokens is None:
+            tokens = tokenize(text)
+        found = []
+        i = 0
+        while i < len(tokens):
+            match = self.match_at(tokens, i)
+            if match:
+                found.append((match[0], i, match[1]) if spans else match[0])
+                i = match[1]
+            else:
+                i += 1
+        return found
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance between a and b, capped at limit + 1.
+
+    Insertions, deletions, substitutions and swaps of neighbouring
+    characters each cost one, so "satrun" is one edit from "saturn".
+    Only the band of cells within limit of the diagonal is filled in, and
+    it gives up as soon as the distance must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous2 = None
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        # Cells off the band are over the limit however they are reached
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = a[i - 1] != b[j - 1]
+            best = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                i > 1
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                best = min(best, previous2[j - 2] + 1)
+            current[j] = min(best, over)
+        if min(current) > limit:
+            return over
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(key):
+    """Return the set of trigrams of a name key, padded at both ends."""
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def gram_code(gram):
+    """Pack a trigram into one integer, 21 bits per character."""
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+
+class FuzzyIndex:
+    """
+    Trigram index for finding names within a few typos of some text.
+
+    Each edit changes at most four of a string's trigrams (a swap touches
+    four), so a name within d edits of the text shares all but 4 * d of
+    the text's trigrams, and all but 4 * d of its own. Postings are kept
+    per name length, so only names within d characters of the text's
+    length are read. Of those, only the postings of the text's rarest
+    4 * d + 1 trigrams are read in full; each name in them is looked up
+    in the other postings until it misses too many, and only names that
+    share enough trigrams are checked with edit_distance.
+
+    The index may sit on top of a read-only base, such as a mapped
+    catalogue that stores its postings in the file, so they are never
+    built in memory. Names added later go in memory; discarding a base
+    name hides it.
+    """
+
+    # Discarded names are rebuilt out of the index once they make up this
+    # fraction of it, and there are at least _COMPACT_MIN of them.
+    _COMPACT_FRACTION = 0.25
+    _COMPACT_MIN = 64
+
+    def __init__(self, base=None, hidden=()):
+        """
+        Args:
+            base: Names indexed already, with fuzzy_count and fuzzy_sizes
+                attributes and fuzzy_postings(gram, length), fuzzy_key(id),
+                fuzzy_ids(name) and body_name(id) methods; see
+                MappedCatalogue
+            hidden (iterable): ids of base names that are not matched
+        """
+        self.names = []
+        self._keys = []
+        # Number of distinct trigrams of each key
+        self._sizes = array("l")
+        # (trigram, key length) -> positions of the keys with the trigram
+        self._postings = {}
+        # Name -> tuple of the positions it is registered at
+        self._positions = {}
+        self._removed = 0
+        # Postings this index may append to in place; None when it shares
+        # no postings with another index
+        self._owned = None
+        self._base = base
+        # ids of the discarded base names, and how many base names there are
+        self._base_removed = set(hidden)
+        self._base_count = 0 if base is None else base.fuzzy_count
+
+    def __len__(self):
+        return (
+            len(self.names)
+            - self._removed
+            + self._base_count
+            - len(self._base_removed)
+        )
+
+    def copy(self):
+        """
+        Return an independent index with the same names.
+
+        Postings are shared until one of the two indexes adds a name to
+        them, which copies them first.
+        """
+        other = FuzzyIndex(self._base)
+        other.names = list(self.names)
+        other._keys = list(self._keys)
+        other._sizes = self._sizes[:]
+        other._postings = dict(self._postings)
+        other._positions = dict(self._positions)
+        other._removed = self._removed
+        other._base_removed = set(self._base_removed)
+        other._owned = set()
+        self._owned = set()
+        return other
+
+    def add(self, name):
+        """Register a name; it is matched on its tokens, ignoring case."""
+        key = " ".join(tokenize(name))
+        if not key:
+            return
+        position = len(self.names)
+        grams = trigrams(key)
+        self.names.append(name)
+        self._keys.append(key)
+        self._sizes.append(len(grams))
+        self._positions[name] = self._positions.get(name, ()) + (position,)
+        for gram in grams:
+            slot = (gram, len(key))
+            postings = self._postings.get(slot)
+            if postings is None:
+                postings = self._postings[slot] = array("l")
+            elif self._owned is not None and slot not in self._owned:
+                postings = self._postings[slot] = postings[:]
+            if self._owned is not None:
+                self._owned.add(slot)
+            postings.append(position)
+
+    def discard(self, name):
+        """
+        Unregister one occurrence of a name, if it is registered.
+
+        Its postings are left in place and skipped when searching, until
+        enough names have been discarded that the index is rebuilt
+        without them.
+        """
+        positions = self._positions.get(name)
+        if positions is None:
+            self._discard_base(name)
+            return
+        if len(positions) > 1:
+            self._positions[name] = positions[1:]
+        else:
+            del self._positions[name]
+        self._keys[positions[0]] = None
+        self._removed += 1
+        if self._removed >= max(
+            self._COMPACT_MIN, self._COMPACT_FRACTION * len(self.names)
+        ):
+            self._compact()
+
+    def _discard_base(self, name):
+        if self._base is None:
+            return
+        for body in self._base.fuzzy_ids(name):
+            if body not in self._base_removed:
+                self._base_removed.add(body)
+                return
+
+    def _compact(self):
+        """Rebuild the in-memory names from those still registered."""
+        live = [
+            name for name, key in zip(self.names, self._keys) if key is not None
+        ]
+        self.__init__(self._base, self._base_removed)
+        for name in live:
+            self.add(name)
+
+    def search(self, text, max_distance):
+        """
+        Find the closest names within max_distance edits of text.
+
+        Exact matches are looked for first, then names one edit away, and
+        so on, so a near match is found without reading the postings a
+        looser search needs. Short text has too few trigrams to filter on,
+        so the limit is lowered to what they allow: one edit for four to
+        seven characters, two for eight to eleven, and so on.
+
+        Args:
+            text (str): The possibly misspelt name
+            max_distance (int): Most edits allowed
+
+        Returns:
+            list: (distance, name) pairs for the names at the smallest
+                distance found, in name order
+        """
+        key = " ".join(tokenize(text))
+        if not key:
+            return []
+        grams = trigrams(key)
+        max_distance = min(max_distance, (len(grams) - 1) // 4)
+        # Nothing closer was found before distance, so whatever is found
+        # now is exactly that far away
+        for distance in range(max_distance + 1):
+            found = []
+            for length in range(len(key) - distance, len(key) + distance + 1):
+                postings = [self._postings.get((gram, length), ()) for gram in grams]
+                for position in _search_postings(
+                    key, postings, distance, self._keys.__getitem__, self._sizes
+                ):
+                    found.append((distance, self.names[position]))
+                if self._base is not None:
+                    postings = [self._base.fuzzy_postings(gram, length) for gram in grams]
+                    for body in _search_postings(
+                        key, postings, distance, self._base_key, self._base.fuzzy_sizes
+                    ):
+                        found.append((distance, self._base.body_name(body)))
+            if found:
+                found.sort()
+                return found
+        return []
+
+    def _base_key(self, body):
+        if body in self._base_removed:
+            return None
+        return self._base.fuzzy_key(body)
+
+
+def _search_postings(key, postings, max_distance, key_of, sizes):
+    """
+    Find the keys within max_distance edits of key, all of one length.
+
+    Args:
+        key (str): The tokenized text
+        postings (list): For each trigram of key, the sorted positions of
+            the keys having it
+        max_distance (int): Most edits allowed
+        key_of (callable): Position -> key, or None if discarded
+        sizes (sequence): Number of distinct trigrams of each key
+
+    Yields:
+        int: The position of each key found
+    """
+    postings.sort(key=len)
+    if not postings[-1]:
+        return
+    # Either side may be missing up to this many of the other's trigrams
+    slack = 4 * max_distance
+    rare = postings[: slack + 1]
+    common = postings[slack + 1 :]
+    counts = {}
+    for positions in rare:
+        for position in positions:
+            counts[position] = counts.get(position, 0) + 1
+    for position, count in counts.items():
+        name_key = key_of(position)
+        if name_key is None:
+            continue
+        # The rare postings already missed slack + 1 - count trigrams
+        misses = len(common) + slack + count - max(len(postings), sizes[position])
+        if misses < 0:
+            continue
+        for positions in common:
+            i = bisect_left(positions, position)
+            if i == len(positions) or positions[i] != position:
+                misses -= 1
+                if misses < 0:
+                    break
+        else:
+            if edit_distance(key, name_key, max_distance) <= max_distance:
+                yield position
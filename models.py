@@ -1,15 +1,216 @@
+import heapq
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableSequence, Sequence
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+
+import storage
+from columns import PlanetColumns
+from derived import DerivedColumns
+from ephemeris import ELEMENT_FIELDS, Orbit, positions
+from indexes import PrefixIndex, SortedIndex
+from mapped import MappedCatalogue, name_key, write_mapped
+from matcher import FuzzyIndex, NameMatcher, tokenize
+
+
 class Moon:
-    def __init__(self, name, diameter):
+    __slots__ = ("name", "diameter")
+
+    def __init__(self, name, diameter=None):
         self.name = name
         self.diameter = diameter
 
+    def __eq__(self, other):
+        if not isinstance(other, Moon):
+            return NotImplemented
+        return self.name == other.name and self.diameter == other.diameter
+
+    def __hash__(self):
+        return hash((self.name, self.diameter))
+
+    def to_dict(self):
+        return {"name": self.name, "diameter": self.diameter}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data.get("diameter"))
+
+    def __str__(self):
+        if self.diameter is None:
+            return self.name
+        return f"{self.name} (diameter: {self.diameter} km)"
+
+
+class _StoredMoon(Moon):
+    """A moon read from a MoonTable: a copy of its values, so read-only."""
+
+    __slots__ = ()
+
+    def __init__(self, name, diameter=None):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "diameter", diameter)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError(
+            "A moon read from a planet cannot be changed; "
+            "assign planet.moons[i] = Moon(...) instead"
+        )
+
+    def __reduce__(self):
+        return Moon, (self.name, self.diameter)
+
+
+class MoonTable(MutableSequence):
+    """
+    Compact, list-like store of a planet's moons.
+
+    Names and diameters are kept in parallel columns rather than as one
+    object per moon. Indexing returns a read-only Moon holding the stored
+    values, so moons compare by value; assign to an index to change one.
+    Changes to the table of a planet in a solar system are passed on to
+    its indexes. A table equals a list of the same moons.
+    """
+
+    __slots__ = ("names", "diameters", "_ints", "planet")
+
+    def __init__(self, moons=()):
+        self.names = []
+        # NaN marks an unknown diameter.
+        self.diameters = array("d")
+        # 1 where the diameter was given as an int, so it reads back as one
+        self._ints = array("b")
+        # The planet whose moons these are; set by Planet
+        self.planet = None
+        for moon in moons:
+            self.append(moon)
+
+    def _solar_system(self):
+        return None if self.planet is None else self.planet.solar_system
+
+    @staticmethod
+    def _columns(moon):
+        diameter = moon.diameter
+        if diameter is None:
+            return math.nan, 0
+        return diameter, isinstance(diameter, int)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        diameter = self.diameters[index]
+        if math.isnan(diameter):
+            diameter = None
+        elif self._ints[index]:
+            diameter = int(diameter)
+        return _StoredMoon(self.names[index], diameter)
+
+    @contextmanager
+    def _moving(self):
+        """Take the moons out of their solar system's indexes while they move."""
+        solar_system = self._solar_system()
+        if solar_system is None:
+            yield
+            return
+        solar_system._moons_changing(self.planet)
+        try:
+            yield
+        finally:
+            solar_system._moons_changed(self.planet)
+
+    def __setitem__(self, index, moon):
+        if isinstance(index, slice):
+            moons = list(moon)
+            columns = [self._columns(moon) for moon in moons]
+            with self._moving():
+                self.names[index] = [moon.name for moon in moons]
+                self.diameters[index] = array("d", [diameter for diameter, _ in columns])
+                self._ints[index] = array("b", [is_int for _, is_int in columns])
+            return
+        diameter, is_int = self._columns(moon)
+        with self._moving():
+            self.names[index] = moon.name
+            self.diameters[index] = diameter
+            self._ints[index] = is_int
+
+    def __delitem__(self, index):
+        with self._moving():
+            del self.names[index]
+            del self.diameters[index]
+            del self._ints[index]
+
+    def __iter__(self):
+        for index in range(len(self.names)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, (MoonTable, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MoonTable({list(self)!r})"
+
+    def insert(self, index, moon):
+        if index >= len(self):
+            self.append(moon)
+            return
+        diameter, is_int = self._columns(moon)
+        with self._moving():
+            self.names.insert(index, moon.name)
+            self.diameters.insert(index, diameter)
+            self._ints.insert(index, is_int)
+
+    def append(self, moon):
+        # Moons before it keep their positions, so only it is indexed
+        solar_system = self._solar_system()
+        if solar_system is not None:
+            solar_system._check_writable()
+        diameter, is_int = self._columns(moon)
+        self.names.append(moon.name)
+        self.diameters.append(diameter)
+        self._ints.append(is_int)
+        if solar_system is not None:
+            solar_system._add_moon(self.planet, len(self) - 1)
+
+    def find(self, name):
+        """Return the position of the first moon with this name, or None."""
+        folded = name.casefold()
+        for position, moon_name in enumerate(self.names):
+            if moon_name.casefold() == folded:
+                return position
+        return None
+
 
 class Planet:
-    def __init__(self, name, mass, distance_from_sun):
+    __slots__ = ("name", "mass", "distance_from_sun", "_moons", "orbit", "solar_system")
+
+    def __init__(self, name, mass, distance_from_sun, orbit=None):
         self.name = name
         self.mass = mass
         self.distance_from_sun = distance_from_sun
-        self.moons = []
+        self.moons = MoonTable()
+        # Orbital elements for positional questions; None when unknown
+        self.orbit = orbit
+        # Set by SolarSystem.add_planet so new moons reach its indexes.
+        self.solar_system = None
+
+    @property
+    def moons(self):
+        return self._moons
+
+    @moons.setter
+    def moons(self, moons):
+        moons.planet = self
+        self._moons = moons
 
     def add_moon(self, moon):
         self.moons.append(moon)
@@ -17,10 +218,34 @@ class Planet:
     def get_moon_count(self):
         return len(self.moons)
 
+    def to_dict(self):
+        data = {
+            "name": self.name,
+            "mass": self.mass,
+            "distance_from_sun": self.distance_from_sun,
+            "moons": [moon.to_dict() for moon in self.moons],
+        }
+        if self.orbit is not None:
+            data["orbit"] = self.orbit.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        orbit = data.get("orbit")
+        planet = cls(
+            data["name"],
+            data["mass"],
+            data["distance_from_sun"],
+            None if orbit is None else Orbit.from_dict(orbit),
+        )
+        for moon_data in data.get("moons", []):
+            planet.add_moon(Moon.from_dict(moon_data))
+        return planet
+
     def __str__(self):
         """Provide a string representation of the planet."""
         moon_names = (
-            ", ".join([moon.name for moon in self.moons]) if self.moons else "No moons"
+            ", ".join(self.moons.names) if self.moons else "No moons"
         )
         return (
             f"Planet: {self.name}\n"
@@ -30,26 +255,1109 @@ class Planet:
         )
 
 
+class MappedPlanetList(Sequence):
+    """
+    List-like view of the planets in a MappedCatalogue.
+
+    Planet objects are only built when first accessed, then kept so the
+    same object is returned each time. The file cannot be changed, so
+    changes are laid over it: a changed planet is held in memory in place
+    of its file row, a removed one hides its row, and planets added
+    afterwards are held in memory after the mapped ones.
+    """
+
+    def __init__(self, catalogue, solar_system):
+        self.catalogue = catalogue
+        self.solar_system = solar_system
+        self._loaded = {}
+        self._added = []
+        # File rows of removed planets, sorted, and file row -> Planet for
+        # changed ones
+        self.removed = []
+        self.replaced = {}
+
+    def _mapped_count(self):
+        return len(self.catalogue) - len(self.removed)
+
+    def __len__(self):
+        return self._mapped_count() + len(self._added)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("planet index out of range")
+        if index >= self._mapped_count():
+            return self._added[index - self._mapped_count()]
+        return self.mapped(self.file_row(index))
+
+    def __setitem__(self, index, planet):
+        self._added[self._added_offset(index)] = planet
+
+    def __delitem__(self, index):
+        del self._added[self._added_offset(index)]
+
+    def _added_offset(self, index):
+        offset = index - self._mapped_count()
+        if not 0 <= offset < len(self._added):
+            raise IndexError("only planets added after loading can be set or deleted")
+        return offset
+
+    def mapped(self, file_row):
+        """Return the planet at a row of the file, building it if needed."""
+        planet = self.replaced.get(file_row)
+        if planet is not None:
+            return planet
+        planet = self._loaded.get(file_row)
+        if planet is None:
+            name, mass, distance, moons, orbit = self.catalogue.planet(file_row)
+            planet = Planet(name, mass, distance, orbit and Orbit(*orbit))
+            # Mapped moons are found through the catalogue, not the indexes.
+            planet.moons = MoonTable(Moon(*moon) for moon in moons)
+            planet.solar_system = self.solar_system
+            # Threads reading a frozen solar system may build the same
+            # planet at once; all of them get the one stored first.
+            planet = self._loaded.setdefault(file_row, planet)
+        return planet
+
+    def is_removed(self, file_row):
+        position = bisect_left(self.removed, file_row)
+        return position < len(self.removed) and self.removed[position] == file_row
+
+    def row_of(self, file_row):
+        """Return the row in this list of a file row that is not removed."""
+        return file_row - bisect_left(self.removed, file_row)
+
+    def file_row(self, row):
+        """Return the file row shown at a row of this list."""
+        file_row = row
+        while True:
+            # The row plus the removed rows up to here; stops at the first
+            # file row with exactly `row` rows shown before it
+            candidate = row + bisect_right(self.removed, file_row)
+            if candidate == file_row:
+                return file_row
+            file_row = candidate
+
+    def index(self, planet):
+        for offset, added in enumerate(self._added):
+            if added is planet:
+                return self._mapped_count() + offset
+        file_row = self.catalogue.find_planet(planet.name)
+        if (
+            file_row is not None
+            and not self.is_removed(file_row)
+            and self.mapped(file_row) is planet
+        ):
+            return self.row_of(file_row)
+        raise ValueError(f"{planet.name} is not in the list")
+
+    def append(self, planet):
+        self._added.append(planet)
+
+    def copy(self, solar_system):
+        """Return a list of the same planets, for a copy of the solar system."""
+        planets = MappedPlanetList(self.catalogue, solar_system)
+        planets._loaded = dict(self._loaded)
+        planets._added = list(self._added)
+        planets.removed = list(self.removed)
+        planets.replaced = dict(self.replaced)
+        return planets
+
+    def loaded_rows(self):
+        """Yield (row, planet) for every planet built so far."""
+        for file_row in self._loaded.keys() | self.replaced.keys():
+            if not self.is_removed(file_row):
+                yield self.row_of(file_row), self.mapped(file_row)
+        for offset, planet in enumerate(self._added):
+            yield self._mapped_count() + offset, planet
+
+    def records(self):
+        """
+        Yield every planet as Planet.to_dict() gives it.
+
+        Planets not built yet are read straight from the catalogue rather
+        than built.
+        """
+        removed = set(self.removed)
+        for file_row in range(len(self.catalogue)):
+            if file_row in removed:
+                continue
+            planet = self.replaced.get(file_row) or self._loaded.get(file_row)
+            if planet is not None:
+                yield planet.to_dict()
+                continue
+            name, mass, distance, moons, orbit = self.catalogue.planet(file_row)
+            record = {
+                "name": name,
+                "mass": mass,
+                "distance_from_sun": distance,
+                "moons": [
+                    {"name": moon, "diameter": diameter} for moon, diameter in moons
+                ],
+            }
+            if orbit is not None:
+                record["orbit"] = dict(zip(ELEMENT_FIELDS, orbit))
+            yield record
+        for planet in self._added:
+            yield planet.to_dict()
+
+    def names(self):
+        """Yield every planet name without building Planet objects."""
+        removed = set(self.removed)
+        for index in range(len(self.catalogue)):
+            if index not in removed:
+                yield self.catalogue.planet_name(index)
+        for planet in self._added:
+            yield planet.name
+
+
 class SolarSystem:
     def __init__(self):
+        # Bumped on every change so derived data (caches) can tell it is stale.
+        self.version = 0
+        # Set by freeze(); a frozen solar system is never changed again
+        self.frozen = False
+        self._reset()
+
+    def _reset(self):
         self.planets = []
+        # Case-folded name -> Planet, and moon name -> (Planet, position).
+        # The first body added under a name wins, matching a linear scan.
+        self._planet_index = {}
+        self._moon_index = {}
+        self._planet_names = None
+        self._name_matcher = NameMatcher()
+        # Set when planets come from a memory-mapped catalogue.
+        self._mapped = None
+        # Names in the mapped catalogue of bodies since changed or removed,
+        # left out of its completions
+        self._hidden_names = set()
+        # Numeric columns, built on first use for mapped catalogues, and
+        # the planets whose moon count changed since they were last read.
+        self._columns = PlanetColumns()
+        self._columns_dirty = set()
+        # (version, DerivedColumns) from the last get_derived() call
+        self._derived = None
+        # Sorted indexes for range lookups: planet rows by mass and distance,
+        # (planet, position) moon entries by diameter. Mapped catalogues get
+        # their own indexes, built on first use.
+        self._range_indexes = {
+            "mass": SortedIndex("q"),
+            "distance_from_sun": SortedIndex("q"),
+            "diameter": SortedIndex(),
+        }
+        self._mapped_range_indexes = {}
+        # Planet and moon names by name key, for completion; built on first use
+        self._prefix_index = None
+        # Trigram index of every name, for typo-tolerant lookups; built on first use
+        self._fuzzy_index = None
+        self.version += 1
+
+    def _check_writable(self):
+        if self.frozen:
+            raise RuntimeError(
+                "A frozen solar system cannot be changed; change a copy() of it"
+            )
+
+    def copy(self):
+        """
+        Return a solar system with the same planets that can be changed.
+
+        Planet objects are shared rather than copied, and the copy never
+        changes them: update_planet() replaces a shared planet instead of
+        changing it in place. Index arrays and columns are copied whole,
+        which is a memory copy per array; the name trie and trigram
+        postings are shared until the copy changes them. Copying therefore
+        costs a small fraction of building the indexes again.
+
+        Returns:
+            SolarSystem: The copy, with the same version
+        """
+        other = SolarSystem.__new__(SolarSystem)
+        other.__dict__.update(self.__dict__)
+        other.frozen = False
+        if self._mapped is not None:
+            other.planets = self.planets.copy(other)
+        else:
+            other.planets = list(self.planets)
+        other._planet_index = dict(self._planet_index)
+        other._moon_index = dict(self._moon_index)
+        other._name_matcher = self._name_matcher.copy()
+        if self._columns is not None:
+            other._columns = self._columns.copy()
+        other._columns_dirty = set(self._columns_dirty)
+        other._range_indexes = {
+            field: index.copy() for field, index in self._range_indexes.items()
+        }
+        other._mapped_range_indexes = dict(self._mapped_range_indexes)
+        other._hidden_names = set(self._hidden_names)
+        if self._prefix_index is not None:
+            other._prefix_index = self._prefix_index.copy()
+        if self._fuzzy_index is not None:
+            other._fuzzy_index = self._fuzzy_index.copy()
+        return other
+
+    def freeze(self):
+        """
+        Make the solar system read-only, so threads can share it.
+
+        Buffered index entries are merged in and pending column updates
+        applied now. After that, reading never changes anything another
+        thread may be reading: indexes built on first use are built whole
+        and then stored in one step. Changing a frozen solar system or one
+        of its planets raises RuntimeError; copy() it instead.
+        """
+        if self._columns is not None:
+            self.get_columns()
+        for index in self._range_indexes.values():
+            index.flush()
+        if self._prefix_index is not None:
+            self._prefix_index.flush()
+        # Planets shared with the versions this one was copied from now
+        # point here, so those versions are freed once no thread reads them.
+        if self._mapped is not None:
+            planets = (planet for _, planet in self.planets.loaded_rows())
+        else:
+            planets = self.planets
+        for planet in planets:
+            planet.solar_system = self
+        self.frozen = True
 
     def add_planet(self, planet):
+        self._check_writable()
         self.planets.append(planet)
+        planet.solar_system = self
+        self._planet_index.setdefault(planet.name.casefold(), planet)
+        self._name_matcher.add(planet.name, ("planet", planet))
+        self._planet_names = None
+        if self._columns is not None:
+            self._columns.append(planet)
+        if self._prefix_index is not None:
+            self._prefix_index.add(name_key(planet.name), planet.name)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add(planet.name)
+        row = len(self.planets) - 1
+        self._range_indexes["mass"].add(planet.mass, row)
+        self._range_indexes["distance_from_sun"].add(planet.distance_from_sun, row)
+        for position in range(len(planet.moons)):
+            self._index_moon(planet, position)
+        self.version += 1
+
+    def _add_moon(self, planet, position):
+        self._index_moon(planet, position)
+        self._columns_dirty.add(planet)
+
+    def _index_moon(self, planet, position):
+        name = planet.moons.names[position]
+        # Positions rather than Moon objects, so moons stay in the table.
+        entry = (planet, position)
+        self._moon_index.setdefault(name.casefold(), entry)
+        self._name_matcher.add(name, ("moon", entry))
+        if self._prefix_index is not None:
+            self._prefix_index.add(name_key(name), name)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add(name)
+        diameter = planet.moons.diameters[position]
+        if not math.isnan(diameter):
+            self._range_indexes["diameter"].add(diameter, entry)
+        self.version += 1
+
+    def _unindex_moon(self, planet, position):
+        name = planet.moons.names[position]
+        entry = (planet, position)
+        key = name.casefold()
+        if self._moon_index.get(key) == entry:
+            del self._moon_index[key]
+        self._name_matcher.remove(name, ("moon", entry))
+        if self._prefix_index is not None:
+            self._prefix_index.discard(name_key(name), name)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.discard(name)
+        diameter = planet.moons.diameters[position]
+        if not math.isnan(diameter):
+            self._range_indexes["diameter"].discard(diameter, entry)
+
+    def _moons_changing(self, planet):
+        """Take a planet's moons out of the indexes before they move."""
+        self._check_writable()
+        file_row = self._mapped_row(planet.name)
+        if (
+            file_row is not None
+            and file_row not in self.planets.replaced
+            and self.planets.mapped(file_row) is planet
+        ):
+            # Moons read from the file cannot move; hold the planet in memory
+            self._replace_mapped(file_row, planet, planet)
+        for position in range(len(planet.moons)):
+            self._unindex_moon(planet, position)
+
+    def _moons_changed(self, planet):
+        """Index a planet's moons again at their new positions."""
+        for position in range(len(planet.moons)):
+            self._index_moon(planet, position)
+        self._columns_dirty.add(planet)
+        self.version += 1
+
+    def update_planet(self, planet):
+        """
+        Bring the planet with the same name up to date, in place.
+
+        The existing Planet object is kept, so references to it see the
+        new values, and only its own entries in the name, range and moon
+        indexes and its row of the columns are changed. A planet shared
+        with a frozen solar system (see copy()) is replaced by the new one
+        instead, leaving the frozen one as it was. A planet with a name
+        not yet known is added. A planet from a mapped catalogue is laid
+        over its row of the file, which is left as it is.
+
+        Args:
+            planet (Planet): The new values, e.g. freshly read from a file
+
+        Returns:
+            Planet: The planet now in the solar system
+        """
+        self._check_writable()
+        current = self.get_planet_by_name(planet.name)
+        if current is None or current.name != planet.name:
+            if current is not None:
+                self.remove_planet(current.name)
+            self.add_planet(planet)
+            return planet
+        file_row = self._mapped_row(planet.name)
+        if file_row is not None and file_row not in self.planets.replaced:
+            return self._replace_mapped(file_row, current, planet)
+        row = self.planets.index(current)
+        for field in ("mass", "distance_from_sun"):
+            old, new = getattr(current, field), getattr(planet, field)
+            if old != new:
+                self._range_indexes[field].discard(old, row)
+                self._range_indexes[field].add(new, row)
+        for position in range(len(current.moons)):
+            self._unindex_moon(current, position)
+        if current.solar_system is self:
+            current.mass = planet.mass
+            current.distance_from_sun = planet.distance_from_sun
+            current.orbit = planet.orbit
+            current.moons = planet.moons
+        else:
+            if file_row is not None:
+                self.planets.replaced[file_row] = planet
+            else:
+                self._name_matcher.remove(current.name, ("planet", current))
+                self._name_matcher.add(planet.name, ("planet", planet))
+                self._planet_index[planet.name.casefold()] = planet
+                self.planets[row] = planet
+            planet.solar_system = self
+            self._columns_dirty.discard(current)
+            current = planet
+        for position in range(len(current.moons)):
+            self._index_moon(current, position)
+        if self._columns is not None:
+            self._columns.update(row, current)
+        self._columns_dirty.discard(current)
+        self.version += 1
+        return current
+
+    def remove_planet(self, name):
+        """
+        Remove a planet and its moons, updating the indexes in place.
+
+        Planets after it move up a row. A planet from a mapped catalogue
+        is hidden rather than removed from the file.
+
+        Returns:
+            Planet: The removed planet, or None if there is none by that name
+        """
+        self._check_writable()
+        file_row = self._mapped_row(name)
+        if file_row is not None:
+            return self._remove_mapped(file_row)
+        key = name.casefold()
+        planet = self._planet_index.get(key)
+        if planet is None:
+            return None
+        row = self.planets.index(planet)
+        for position in range(len(planet.moons)):
+            self._unindex_moon(planet, position)
+        del self.planets[row]
+        del self._planet_index[key]
+        self._name_matcher.remove(planet.name, ("planet", planet))
+        if self._prefix_index is not None:
+            self._prefix_index.discard(name_key(planet.name), planet.name)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.discard(planet.name)
+        for field in ("mass", "distance_from_sun"):
+            index = self._range_indexes[field]
+            index.discard(getattr(planet, field), row)
+            index.remove_row(row)
+        if self._columns is not None:
+            self._columns.remove(row)
+        self._columns_dirty.discard(planet)
+        self._planet_names = None
+        if planet.solar_system is self:
+            planet.solar_system = None
+        self.version += 1
+        return planet
+
+    def _mapped_row(self, name):
+        """Return the file row of the mapped planet shown under a name, or None."""
+        if self._mapped is None:
+            return None
+        file_row = self._mapped.find_planet(name)
+        if file_row is None or self.planets.is_removed(file_row):
+            return None
+        return file_row
+
+    def _shows_mapped_moon(self, index):
+        """Whether a mapped moon's planet is still as read from the file."""
+        file_row, _ = self._mapped.moon_owner(index)
+        return file_row not in self.planets.replaced and not self.planets.is_removed(
+            file_row
+        )
+
+    def _hide_mapped_moons(self, file_row, planet):
+        """Take the moons of a mapped planet out of the name lookups."""
+        first = self._mapped.first_moon
+        for index in range(first[file_row], first[file_row + 1]):
+            name = self._mapped.moon_name(index)
+            self._hidden_names.add(name)
+            if self._fuzzy_index is not None:
+                self._fuzzy_index.discard(name)
+        # Moons added since loading are in the in-memory indexes
+        mapped_moons = first[file_row + 1] - first[file_row]
+        for position in range(mapped_moons, len(planet.moons)):
+            self._unindex_moon(planet, position)
+
+    def _replace_mapped(self, file_row, current, planet):
+        """Lay a changed planet over its row of the mapped catalogue."""
+        row = self.planets.row_of(file_row)
+        self._hide_mapped_moons(file_row, current)
+        if current.solar_system is self:
+            current.mass = planet.mass
+            current.distance_from_sun = planet.distance_from_sun
+            current.orbit = planet.orbit
+            current.moons = planet.moons
+            planet = current
+        else:
+            planet.solar_system = self
+        self.planets.replaced[file_row] = planet
+        # The mapped range indexes are rebuilt without the row; its new
+        # values go in the in-memory ones.
+        self._mapped_range_indexes = {}
+        self._range_indexes["mass"].add(planet.mass, row)
+        self._range_indexes["distance_from_sun"].add(planet.distance_from_sun, row)
+        for position in range(len(planet.moons)):
+            self._index_moon(planet, position)
+        if self._columns is not None:
+            self._columns.update(row, planet)
+        self._columns_dirty.discard(current)
+        self.version += 1
+        return planet
+
+    def _remove_mapped(self, file_row):
+        """Hide a planet's row of the mapped catalogue."""
+        planet = self.planets.mapped(file_row)
+        row = self.planets.row_of(file_row)
+        if file_row in self.planets.replaced:
+            for position in range(len(planet.moons)):
+                self._unindex_moon(planet, position)
+            for field in ("mass", "distance_from_sun"):
+                self._range_indexes[field].discard(getattr(planet, field), row)
+            del self.planets.replaced[file_row]
+        else:
+            self._hide_mapped_moons(file_row, planet)
+        insort(self.planets.removed, file_row)
+        self._hidden_names.add(planet.name)
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.discard(planet.name)
+        for field in ("mass", "distance_from_sun"):
+            self._range_indexes[field].remove_row(row)
+        self._mapped_range_indexes = {}
+        if self._columns is not None:
+            self._columns.remove(row)
+        self._columns_dirty.discard(planet)
+        self._planet_names = None
+        if planet.solar_system is self:
+            planet.solar_system = None
+        self.version += 1
+        return planet
+
+    def get_columns(self):
+        """Return up-to-date PlanetColumns, row i describing planets[i]."""
+        if self._columns is None:
+            columns = PlanetColumns.from_mapped(self._mapped)
+            for file_row, planet in self.planets.replaced.items():
+                columns.update(file_row, planet)
+            for file_row in reversed(self.planets.removed):
+                columns.remove(file_row)
+            for planet in self.planets._added:
+                columns.append(planet)
+            self._columns = columns
+        if self._columns_dirty:
+            if self._mapped is not None:
+                rows = self.planets.loaded_rows()
+            else:
+                rows = enumerate(self.planets)
+            for row, planet in rows:
+                if planet in self._columns_dirty:
+                    self._columns.moon_count[row] = planet.get_moon_count()
+            self._columns_dirty.clear()
+        return self._columns
+
+    def get_derived(self):
+        """
+        Return the derived quantities of every planet, as DerivedColumns.
+
+        They are worked out in one vectorized pass over the columns and
+        kept until the planets next change.
+        """
+        if self._derived is None or self._derived[0] != self.version:
+            derived = DerivedColumns(self.get_columns(), self._cached_planet_names())
+            self._derived = (self.version, derived)
+        return self._derived[1]
+
+    def positions(self, days):
+        """
+        Compute where every planet is at each of a set of times.
+
+        All planets and times are solved together over the orbital element
+        columns, so a million planet-times take a fraction of a second.
+
+        Args:
+            days (sequence): Times, in days from J2000
+
+        Returns:
+            ndarray: (times, planets, 3) heliocentric ecliptic x, y, z in
+                AU, row order matching planets. Planets without an orbit
+                are NaN. Without NumPy, nested lists of (x, y, z) tuples.
+        """
+        columns = self.get_columns()
+        return positions([columns.values(field) for field in ELEMENT_FIELDS], days)
+
+    def planets_in_range(
+        self,
+        field,
+        low=None,
+        high=None,
+        include_low=True,
+        include_high=True,
+        limit=None,
+    ):
+        """
+        Find the planets whose mass or distance from the Sun is in a range.
+
+        Args:
+            field (str): "mass" or "distance_from_sun"
+            low (float): Lower bound, or None for no bound
+            high (float): Upper bound, or None for no bound
+            include_low (bool): Whether values equal to low match
+            include_high (bool): Whether values equal to high match
+            limit (int): Most planets to return, or None for all
+
+        Returns:
+            tuple: (number of matching planets, the first `limit` of them
+                ordered by the field)
+        """
+        total, rows = self._search_range(
+            field, low, high, include_low, include_high, limit
+        )
+        return total, [self.planets[row] for row in rows]
+
+    def moons_in_range(
+        self,
+        low=None,
+        high=None,
+        include_low=True,
+        include_high=True,
+        limit=None,
+        largest=False,
+    ):
+        """
+        Find the moons whose diameter is in a range.
+
+        Moons of unknown diameter never match. With no bounds this gives
+        the largest or smallest moons, read straight off the diameter
+        index. Other arguments are as for planets_in_range.
+
+        Args:
+            largest (bool): Order the moons largest first
+
+        Returns:
+            tuple: (number of matching moons, the first `limit` of them
+                as (planet, moon) pairs ordered by diameter)
+        """
+        total, entries = self._search_range(
+            "diameter", low, high, include_low, include_high, limit, largest
+        )
+        moons = []
+        for entry in entries:
+            if isinstance(entry, tuple):
+                planet, position = entry
+                moons.append((planet, planet.moons[position]))
+            else:
+                moons.append(self._mapped_moon(entry))
+        return total, moons
+
+    def _search_range(
+        self, field, low, high, include_low, include_high, limit, reverse=False
+    ):
+        indexes = [self._range_indexes[field]]
+        if self._mapped is not None:
+            indexes.insert(0, self._mapped_range_index(field))
+        total = 0
+        streams = []
+        for index in indexes:
+            start, stop = index.span(low, high, include_low, include_high)
+            total += stop - start
+            if reverse:
+                if limit is not None:
+                    start = max(start, stop - limit)
+                streams.append(reversed(list(index.items(start, stop))))
+                continue
+            if limit is not None:
+                stop = min(stop, start + limit)
+            streams.append(index.items(start, stop))
+        found = heapq.merge(*streams, key=itemgetter(0), reverse=reverse)
+        return total, [value for _, value in islice(found, limit)]
+
+    def complete_names(self, prefix, limit=10):
+        """
+        Suggest planet and moon names that start with what has been typed.
+
+        Matching ignores case and punctuation, so "kepler-2" suggests
+        "Kepler-22b". Each call costs a binary search plus one step per
+        name returned, however many names there are.
+
+        Args:
+            prefix (str): The text typed so far
+            limit (int): Most names to return
+
+        Returns:
+            list: Matching names, in alphabetical order of their key
+        """
+        key = name_key(prefix)
+        if not key:
+            return []
+        if self._prefix_index is None:
+            index = PrefixIndex()
+            for planet in self._planet_index.values():
+                index.add(name_key(planet.name), planet.name)
+            for planet, position in self._moon_index.values():
+                name = planet.moons.names[position]
+                index.add(name_key(name), name)
+            index.flush()
+            self._prefix_index = index
+        streams = [self._prefix_index.complete(key)]
+        if self._mapped is not None:
+            hidden = self._hidden_names
+            streams.append(
+                item for item in self._mapped.complete(key) if item[1] not in hidden
+            )
+        names = []
+        for _, name in heapq.merge(*streams):
+            if name not in names:
+                names.append(name)
+                if len(names) == limit:
+                    break
+        return names
+
+    def _mapped_range_index(self, field):
+        index = self._mapped_range_indexes.get(field)
+        if index is None:
+            keys = {
+                "mass": self._mapped.masses,
+                "distance_from_sun": self._mapped.distances,
+                "diameter": self._mapped.diameters,
+            }[field]
+            changed = self.planets.removed + list(self.planets.replaced)
+            if changed:
+                # Rows changed or removed since loading are left out, as
+                # unknown values
+                keys = array("d", keys.cast("B").tobytes())
+                first = self._mapped.first_moon
+                for file_row in changed:
+                    if field == "diameter":
+                        for moon in range(first[file_row], first[file_row + 1]):
+                            keys[moon] = math.nan
+                    else:
+                        keys[file_row] = math.nan
+            index = SortedIndex.build_positions(keys)
+            if field != "diameter" and self.planets.removed:
+                index.remove_rows(self.planets.removed)
+            self._mapped_range_indexes[field] = index
+        return index
+
+    def records(self):
+        """Yield every planet as a dict, as Planet.to_dict() gives it."""
+        if self._mapped is not None:
+            return self.planets.records()
+        return (planet.to_dict() for planet in self.planets)
 
     def get_all_planet_names(self):
-        return [planet.name for planet in self.planets]
+        return list(self._cached_planet_names())
+
+    def _cached_planet_names(self):
+        """Return the planet names as a tuple, kept until the planets change."""
+        if self._planet_names is None:
+            if self._mapped is not None:
+                self._planet_names = tuple(self.planets.names())
+            else:
+                self._planet_names = tuple(planet.name for planet in self.planets)
+        return self._planet_names
 
     def get_planet_by_name(self, name):
-        for planet in self.planets:
-            if planet.name.lower() == name.lower():
-                return planet
-        return None
+        file_row = self._mapped_row(name)
+        if file_row is not None:
+            return self.planets.mapped(file_row)
+        return self._planet_index.get(name.casefold())
+
+    def get_moon_by_name(self, name):
+        """Return a (planet, moon) pair for the named moon, or None."""
+        if self._mapped is not None:
+            index = self._mapped.find_moon(name)
+            if index is not None and self._shows_mapped_moon(index):
+                return self._mapped_moon(index)
+        found = self._moon_index.get(name.casefold())
+        if found is None:
+            return None
+        planet, position = found
+        return planet, planet.moons[position]
+
+    def _mapped_moon(self, index):
+        file_row, position = self._mapped.moon_owner(index)
+        planet = self.planets.mapped(file_row)
+        return planet, planet.moons[position]
+
+    def find_mentions(self, text=None, tokens=None, spans=False):
+        """
+        Find every planet and moon named in text, in order of appearance.
+
+        Args:
+            text (str): The text to scan
+            tokens (list): Already tokenized text, used instead of text
+            spans (bool): Give (mention, start, end) for each one, where
+                tokens[start:end] is the name
+
+        Returns:
+            list: ("planet", planet) and ("moon", (planet, moon)) pairs
+        """
+        if tokens is None:
+            tokens = tokenize(text)
+        found = []
+        i = 0
+        while i < len(tokens):
+            match = self._name_matcher.match_at(tokens, i)
+            if match and match[0][0] == "moon":
+                (kind, (planet, position)), end = match
+                match = ("moon", (planet, planet.moons[position])), end
+            mapped = self._mapped.match_at(tokens, i) if self._mapped else None
+            if mapped:
+                (kind, index), end = mapped
+                if kind == "planet":
+                    shown = not self.planets.is_removed(index)
+                else:
+                    shown = self._shows_mapped_moon(index)
+                if not shown:
+                    mapped = None
+            if mapped and (match is None or mapped[1] >= match[1]):
+                if kind == "planet":
+                    match = ("planet", self.planets.mapped(index)), end
+                else:
+                    match = ("moon", self._mapped_moon(index)), end
+            if match:
+                found.append((match[0], i, match[1]) if spans else match[0])
+                i = match[1]
+            else:
+                i += 1
+        return found
+
+    def find_fuzzy_mentions(
+        self,
+        text=None,
+        tokens=None,
+        max_distance=2,
+        ignore=frozenset(),
+        attached=frozenset(),
+    ):
+        """
+        Find planets and moons named in text, allowing for typos.
+
+        Each word, and each pair of neighbouring words, is looked up in a
+        trigram index of every name, so "Jupyter" finds Jupiter without
+        comparing against every name. The index is built on the first call.
+
+        Args:
+            text (str): The text to scan
+            tokens (list): Already tokenized text, used instead of text
+            max_distance (int): Most typos allowed in one name; short words
+                allow fewer (see FuzzyIndex.search)
+            ignore (set): Tokens that are never part of a name, such as
+                question words
+            attached (set): Tokens tried only together with a neighbouring
+                word, such as the number in "Keplr-90"
+
+        Returns:
+            list: ("planet", planet) and ("moon", (planet, moon)) pairs
+        """
+        if tokens is None:
+            tokens = tokenize(text)
+        if ignore.union(attached).issuperset(tokens):
+            # Nothing to look up, so don't build the index for it
+            return []
+        index = self._get_fuzzy_index()
+        found = []
+        i = 0
+        while i < len(tokens):
+            for width in (2, 1):
+                window = tokens[i : i + width]
+                if (
+                    len(window) < width
+                    or not ignore.isdisjoint(window)
+                    or attached.issuperset(window)
+                ):
+                    continue
+                matches = index.search(" ".join(window), max_distance)
+                if matches:
+                    found.append(self._body_named(matches[0][1]))
+                    i += width
+                    break
+            else:
+                i += 1
+        return found
+
+    def _get_fuzzy_index(self):
+        """
+        Return the trigram name index, building it if needed.
+
+        A mapped catalogue with trigram postings in the file serves its
+        own names; only bodies held in memory are indexed.
+        """
+        if self._fuzzy_index is None:
+            mapped = self._mapped
+            if mapped is not None and mapped.has_fuzzy_index:
+                removed, hidden = self._hidden_mapped_bodies()
+                index = FuzzyIndex(
+                    mapped, removed | {mapped.planet_count + moon for moon in hidden}
+                )
+                names = self._memory_body_names()
+            else:
+                index = FuzzyIndex()
+                names = self.body_names()
+            for name in names:
+                index.add(name)
+            self._fuzzy_index = index
+        return self._fuzzy_index
+
+    def body_names(self):
+        """
+        Yield the name of every planet and moon.
+
+        Mapped names are read straight from the catalogue, without building
+        the bodies. A name shared by several bodies may be yielded more
+        than once.
+        """
+        if self._mapped is not None:
+            removed, hidden = self._hidden_mapped_bodies()
+            for i in range(self._mapped.planet_count):
+                if i not in removed:
+                    yield self._mapped.planet_name(i)
+            for i in range(self._mapped.moon_count):
+                if i not in hidden:
+                    yield self._mapped.moon_name(i)
+        yield from self._memory_body_names()
+
+    def _hidden_mapped_bodies(self):
+        """
+        Find the mapped bodies no longer shown.
+
+        Returns:
+            tuple: (file rows of the removed planets, moons of the removed
+                and replaced planets), as sets
+        """
+        removed = set(self.planets.removed)
+        first = self._mapped.first_moon
+        hidden = {
+            moon
+            for file_row in removed | self.planets.replaced.keys()
+            for moon in range(first[file_row], first[file_row + 1])
+        }
+        return removed, hidden
+
+    def _memory_body_names(self):
+        """Yield the names of the planets and moons indexed in memory."""
+        for planet in self._planet_index.values():
+            yield planet.name
+        for planet, position in self._moon_index.values():
+            yield planet.moons.names[position]
+
+    def _body_named(self, name):
+        """Return ("planet", planet) or ("moon", (planet, moon)) for a name."""
+        planet = self.get_planet_by_name(name)
+        if planet is not None:
+            return "planet", planet
+        return "moon", self.get_moon_by_name(name)
+
+    def find_planets(self, text=None, tokens=None):
+        """Return the planets named in text, in order of appearance."""
+        return [
+            body
+            for kind, body in self.find_mentions(text, tokens)
+            if kind == "planet"
+        ]
+
+    def save_to_file(self, file_path, file_format=None):
+        """
+        Save every planet to a file, replacing it atomically.
+
+        Args:
+            file_path (str): The file to write
+            file_format (str): "json", "binary" or "mapped"; guessed from
+                the extension when None
+
+        Returns:
+            bool: True if the file was written
+        """
+        file_format = file_format or storage.detect_format(file_path)
+        try:
+            if file_format == "mapped":
+                with storage.atomic_write(file_path, "wb") as outfile:
+                    write_mapped(self.planets, outfile)
+            elif file_format == "binary":
+                with storage.atomic_write(file_path, "wb") as outfile:
+                    storage.write_binary(self.planets, outfile)
+            else:
+                with storage.atomic_write(file_path) as outfile:
+                    storage.write_json(self.planets, outfile)
+        except OSError:
+            return False
+        return True
+
+    def save_snapshot(self, file_path, stamp):
+        """
+        Save a snapshot: a mapped catalogue tagged with its source's stamp.
+
+        Args:
+            file_path (str): The file to write
+            stamp (tuple): storage.source_stamp() of the data file the
+                planets were read from
+
+        Returns:
+            bool: True if the file was written
+        """
+        try:
+            with storage.atomic_write(file_path, "wb") as outfile:
+                storage.write_snapshot(self.planets, outfile, stamp)
+        except OSError:
+            return False
+        return True
+
+    def load_from_file(self, file_path, file_format=None):
+        """
+        Replace the planets with those stored in a file.
+
+        Planets are read one at a time, so the file is never held in
+        memory alongside the loaded objects. A mapped catalogue is not read
+        at all: planets are built from it as they are first accessed. If
+        the file is missing or corrupted the solar system is left empty.
+
+        Args:
+            file_path (str): The file to read
+            file_format (str): "json", "binary" or "mapped"; guessed from
+                the extension when None
+
+        Returns:
+            bool: True if the file was loaded
+        """
+        self._check_writable()
+        file_format = file_format or storage.detect_format(file_path)
+        self._reset()
+        try:
+            if file_format == "mapped":
+                self._mapped = MappedCatalogue(file_path)
+                self.planets = MappedPlanetList(self._mapped, self)
+                self._columns = None
+                self.version += 1
+            elif file_format == "binary":
+                with open(file_path, "rb") as infile:
+                    for data in storage.iter_binary(infile):
+                        self.add_planet(Planet.from_dict(data))
+            else:
+                with open(file_path, encoding="utf-8") as infile:
+                    for data in storage.iter_json(infile):
+                        self.add_planet(Planet.from_dict(data))
+        except (OSError, ValueError, KeyError, TypeError):
+            self._reset()
+            return False
+        return True
+
+
+class SharedSolarSystem:
+    """
+    A solar system that many threads read while others change it.
+
+    Readers call current() for the latest published version: a frozen
+    SolarSystem that never changes, so reading it takes no lock and a
+    question is answered from one version throughout. Writers change a
+    copy of the current version inside edit(), which is published as the
+    new version by swapping one reference. Readers holding an older
+    version carry on with it; it is freed once they let go. Writers take
+    turns, so no change is lost.
+    """
+
+    def __init__(self, solar_system=None):
+        """
+        Args:
+            solar_system (SolarSystem): The first version, frozen here; an
+                empty solar system when None
+        """
+        self._write_lock = threading.Lock()
+        self._current = None
+        self.publish(SolarSystem() if solar_system is None else solar_system)
+
+    def current(self):
+        """Return the latest published version, a frozen SolarSystem."""
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    @contextmanager
+    def edit(self):
+        """
+        Change the solar system, publishing the changes as one version.
+
+        Yields a copy of the current version to change. It is published
+        when the block ends; if the block raises, it is dropped and
+        readers never see any of its changes. Edits may not be nested.
+
+        Yields:
+            SolarSystem: The copy to change
+        """
+        with self._write_lock:
+            draft = self._current.copy()
+            yield draft
+            self._publish(draft)
+
+    def publish(self, solar_system):
+        """
+        Replace the current version with another solar system.
+
+        It is frozen, so it must not be changed afterwards.
 
-    def save_to_file(self, file_path):
-        # Placeholder for saving to file
-        pass
+        Args:
+            solar_system (SolarSystem): The new version
+        """
+        with self._write_lock:
+            self._publish(solar_system)
 
-    def load_from_file(self, file_path):
-        # Placeholder for loading from file
-        return False
+    def _publish(self, solar_system):
+        current = self._current
+        if current is not None and solar_system.version <= current.version:
+            # Versions only go up, so caches keyed on them see every change
+            solar_system.version = current.version + 1
+        solar_system.freeze()
+        self._current = solar_system
@@ -0,0 +1,775 @@
+import math
+import re
+import time
+from collections import deque, namedtuple
+from datetime import date, timedelta
+from functools import partial
+from itertools import islice
+
+from cache import LRUCache
+from columns import OPERATORS
+from ephemeris import (
+    AU_MILLION_KM,
+    closest_approach,
+    ecliptic_longitude,
+    from_days,
+    position,
+    to_days,
+)
+from intents import (
+    COMPARISONS,
+    INTENT_KEYWORDS,
+    INTENT_MATCHER,
+    MOON_SUPERLATIVES,
+    NUMBER_WORDS,
+    RANGE_LABELS,
+    RANGES,
+    SUPERLATIVES,
+    format_value,
+    requested_count,
+)
+from matcher import tokenize
+from models import SharedSolarSystem
+from stats import Stats
+
+
+# Attribute intent -> (column, label) for sorting
+SORT_FIELDS = {
+    "mass": ("mass", "mass"),
+    "distance": ("distance_from_sun", "distance from the Sun"),
+    "moons": ("moon_count", "number of moons"),
+}
+
+# Derived attribute intent -> (DerivedColumns field, label)
+DERIVED_ATTRIBUTES = {
+    "period": ("period_days", "orbital period"),
+    "light_time": ("light_seconds", "light travel time from the Sun"),
+    "au": ("distance_au", "distance in AU"),
+    "earth_masses": ("earth_masses", "mass in Earth masses"),
+    "jupiter_masses": ("jupiter_masses", "mass in Jupiter masses"),
+}
+
+# Unit intent -> the planet in its name, which is not a planet asked about
+UNIT_PLANETS = {"earth_masses": "earth", "jupiter_masses": "jupiter"}
+
+# Unit intent -> the attribute it gives in other units, and so replaces
+UNIT_ATTRIBUTES = {"au": "distance", "earth_masses": "mass", "jupiter_masses": "mass"}
+
+# Attribute intent -> phrase completing "<planet name> ..." with its value
+ATTRIBUTES = {
+    "mass": lambda planet: f"has a mass of {planet.mass} × 10^24 kg",
+    "distance": lambda planet: f"is {planet.distance_from_sun} million km from the Sun",
+    "moons": lambda planet: _moons_phrase(planet),
+}
+# Derived attributes are read from the solar system being queried; see
+# QueryProcessor._phrase
+ATTRIBUTES.update(dict.fromkeys(DERIVED_ATTRIBUTES))
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Years a query may ask about; a year's search runs into the next one
+MIN_YEAR = 1
+MAX_YEAR = 9998
+_BAD_DATE = (
+    f"That's not a date I can use. Give a real date between the years "
+    f"{MIN_YEAR} and {MAX_YEAR}, such as 2030-01-01."
+)
+
+# Words of the question itself, never tried as misspelt names
+_FUZZY_IGNORE = frozenset(
+    token for phrase in INTENT_KEYWORDS for token in tokenize(phrase)
+) | frozenset(NUMBER_WORDS) | frozenset(
+    """
+    a about all an and any are ascending big by decreasing descending do
+    does everything give has have how in increasing info information is it
+    its kg km large many me million much of on or please show small sun tell
+    than that the there to top what which who with
+    """.split()
+)
+
+ParsedQuery = namedtuple(
+    "ParsedQuery", ["tokens", "intents", "planets", "moons", "numbers", "attributes"]
+)
+
+# A question about several planets and/or attributes, answered together:
+# every planet named, and the attributes asked for in order of mention
+# (empty for "tell me about Mars and Venus").
+QueryPlan = namedtuple("QueryPlan", ["planets", "attributes"])
+
+# Intents that only say what to list, and so fit in a query plan
+_PLAN_INTENTS = frozenset(ATTRIBUTES) | {"planets", "list", "compound"}
+
+
+class QueryProcessor:
+    """
+    Class for processing natural language queries about planets.
+
+    A QueryProcessor answers one query at a time. To answer from several
+    threads, give each its own QueryProcessor over one SharedSolarSystem.
+    """
+
+    def __init__(
+        self,
+        solar_system,
+        cache_size=1024,
+        list_limit=20,
+        stats=None,
+        max_edit_distance=2,
+    ):
+        """
+        Initialize with a solar system.
+
+        Args:
+            solar_system (SolarSystem): The solar system to query; for a
+                SharedSolarSystem, each query reads its latest version
+            cache_size (int): Number of answers to cache; 0 disables it
+            list_limit (int): Most planets named in a comparison or
+                sorted answer
+            stats (Stats): Where to record per-intent counts and latencies;
+                a disabled one is created when None
+            max_edit_distance (int): Most typos corrected in a planet name
+                when no name matches exactly; 0 turns correction off
+        """
+        self.shared = solar_system if isinstance(solar_system, SharedSolarSystem) else None
+        if self.shared is not None:
+            solar_system = self.shared.current()
+        self.solar_system = solar_system
+        self.stats = Stats() if stats is None else stats
+        self.cache = LRUCache(cache_size)
+        self._cache_version = solar_system.version
+        self._cache_day = date.today()
+        self.list_limit = list_limit
+        self.max_edit_distance = max_edit_distance
+
+        # Intent -> handler, tried in this order. A handler returns None
+        # to pass the query on to the next matching intent.
+        self.handlers = {
+            "compound": self._answer_compound,
+            "membership": self._answer_membership,
+            "orbit": self._answer_orbit,
+            "position": self._answer_position,
+            "when": self._answer_when,
+        }
+        for intent in DERIVED_ATTRIBUTES:
+            self.handlers[intent] = partial(self._answer_attribute, intent)
+        for intent in COMPARISONS:
+            self.handlers[intent] = partial(self._answer_comparison, intent)
+        for intent, op in RANGES.items():
+            self.handlers[intent] = partial(self._answer_range, op)
+        for intent in SUPERLATIVES:
+            self.handlers[intent] = partial(self._answer_superlative, intent)
+        for intent in MOON_SUPERLATIVES:
+            self.handlers[intent] = partial(self._answer_moon_superlative, intent)
+        self.handlers.update(
+            {
+                "sort": self._answer_sort,
+                "mass": self._answer_mass,
+                "distance": self._answer_distance,
+                "moons": self._answer_moons,
+                "list": self._answer_list,
+            }
+        )
+
+    def copy(self):
+        """
+        Return a QueryProcessor with the same settings and stats.
+
+        It has its own answer cache, so over a SharedSolarSystem the two
+        can answer queries on different threads.
+        """
+        return QueryProcessor(
+            self.shared or self.solar_system,
+            cache_size=self.cache.maxsize,
+            list_limit=self.list_limit,
+            stats=self.stats,
+            max_edit_distance=self.max_edit_distance,
+        )
+
+    def parse(self, query=None, tokens=None):
+        """
+        Tokenize a query once and find the intents and bodies it mentions.
+
+        Args:
+            query (str): The query string
+            tokens (list): Already tokenized query, used instead of query
+
+        Returns:
+            ParsedQuery: The tokens, intent set, planets, (planet, moon)
+                pairs, numbers and attribute intents (in order) of the query
+        """
+        if tokens is None:
+            tokens = tokenize(query)
+        mentions = self.solar_system.find_mentions(tokens=tokens, spans=True)
+        matches = INTENT_MATCHER.find_all(tokens=tokens, spans=True)
+        found = [intent for intent, _, _ in matches]
+        intents = set(found)
+        # A body's name asks for no attribute: "the Moon" is not a question
+        # about moons, though "Earth masses" still gives a unit.
+        in_names = set()
+        for _, start, end in mentions:
+            in_names.update(range(start, end))
+        attributes = list(
+            dict.fromkeys(
+                intent
+                for intent, start, end in matches
+                if intent in ATTRIBUTES and not in_names.issuperset(range(start, end))
+            )
+        )
+        # "How far is Mars in AU?" asks for the distance once, in AU
+        replaced = {UNIT_ATTRIBUTES.get(intent) for intent in attributes}
+        attributes = [intent for intent in attributes if intent not in replaced]
+        planets = []
+        moons = []
+        for (kind, body), _, _ in mentions:
+            (planets if kind == "planet" else moons).append(body)
+        for intent in found:
+            # "Mars in Earth masses": drop the Earth of the unit
+            unit = UNIT_PLANETS.get(intent)
+            for i, planet in enumerate(planets if unit else ()):
+                if planet.name.casefold() == unit:
+                    del planets[i]
+                    break
+        numbers = [
+            float(token.replace(",", ""))
+            for token in tokens
+            if _NUMBER_RE.fullmatch(token)
+        ]
+        if not planets and self.max_edit_distance:
+            # "Jupyter", "Neptun": fall back to the closest known name
+            # Numbers only count as part of a name, as in "Keplr-90"
+            attached = {t for t in tokens if _NUMBER_RE.fullmatch(t)}
+            fuzzy_moons = []
+            for kind, body in self.solar_system.find_fuzzy_mentions(
+                tokens=tokens,
+                max_distance=self.max_edit_distance,
+                ignore=_FUZZY_IGNORE,
+                attached=attached,
+            ):
+                (planets if kind == "planet" else fuzzy_moons).append(body)
+            moons = moons or fuzzy_moons
+        if len(attributes) > 1 or len(planets) > 1:
+            intents.add("compound")
+        return ParsedQuery(tokens, intents, planets, moons, numbers, attributes)
+
+    def process_query(self, query):
+        """
+        Process a natural language query and return the answer.
+
+        Args:
+            query (str): The query string
+
+        Returns:
+            str: The answer to the query
+        """
+        if not self.stats.enabled:
+            return self._lookup(query)[1]
+        start = time.perf_counter()
+        intent, answer = self._lookup(query)
+        self.stats.record("queries", intent, time.perf_counter() - start)
+        return answer
+
+    def _lookup(self, query):
+        """Return (intent, answer) for a query, from the cache if possible."""
+        tokens = tokenize(query)
+
+        # Answers depend only on the tokens, so equivalent phrasings share
+        # an entry. Any change to the solar system invalidates the cache,
+        # as does a new day, since undated position questions mean today.
+        today = date.today()
+        if self.shared is not None:
+            # One version throughout, however many changes land meanwhile
+            self.solar_system = self.shared.current()
+        if self._cache_version != self.solar_system.version or self._cache_day != today:
+            self.cache.clear()
+            self._cache_version = self.solar_system.version
+            self._cache_day = today
+        key = " ".join(tokens)
+        found = self.cache.get(key)
+        if found is None:
+            found = self._dispatch(self.parse(tokens=tokens))
+            self.cache.put(key, found)
+        return found
+
+    def stats_snapshot(self):
+        """
+        Return the recorded statistics along with the answer cache's.
+
+        Returns:
+            dict: A Stats.snapshot() with a "cache" entry of hits, misses
+                and size added
+        """
+        snapshot = self.stats.snapshot()
+        snapshot["cache"] = {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "size": len(self.cache),
+        }
+        return snapshot
+
+    def process_many(self, queries, workers=None, chunk_size=256):
+        """
+        Answer a stream of queries, yielding the answers in order.
+
+        Queries are read lazily, so memory stays bounded however long the
+        input is. With several workers, chunks of queries are answered in
+        a process pool that each receives a copy of the solar system.
+
+        Args:
+            queries (iterable): The query strings
+            workers (int): Number of worker processes; None or 1 runs inline
+            chunk_size (int): Queries sent to a worker at a time
+
+        Yields:
+            str: The answer to each query
+        """
+        if not workers or workers <= 1:
+            for query in queries:
+                yield self.process_query(query)
+            return
+
+        # Imported here: it is slow to import and most runs never use it
+        from concurrent.futures import ProcessPoolExecutor
+
+        queries = iter(queries)
+        if self.shared is not None:
+            self.solar_system = self.shared.current()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.solar_system,),
+        ) as pool:
+            # Keep a couple of chunks per worker in flight, no more.
+            pending = deque()
+            while True:
+                while len(pending) < workers * 2:
+                    chunk = list(islice(queries, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(pool.submit(_answer_chunk, chunk))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+
+    def _dispatch(self, parsed):
+        """Return (intent, answer) from the first handler that answers."""
+        for intent, handler in self.handlers.items():
+            if intent in parsed.intents:
+                answer = handler(parsed)
+                if answer is not None:
+                    return intent, answer
+
+        if parsed.planets:
+            # Default to showing everything about the planet
+            planet = parsed.planets[0]
+            return "everything", f"Information about {planet.name}:\n{planet}"
+
+        if parsed.moons:
+            planet, moon = parsed.moons[0]
+            return "everything", f"{moon}, a moon of {planet.name}."
+
+        return (
+            "unknown",
+            "I'm not sure how to answer that question. Try asking about a specific planet or attribute.",
+        )
+
+    def plan(self, parsed):
+        """
+        Turn a parsed query into a plan covering every planet and attribute.
+
+        Returns:
+            QueryPlan: The planets and attributes to report, or None if the
+                query asks for more than a list of values, such as a
+                comparison, or names only one planet and attribute
+        """
+        intents = parsed.intents
+        if not parsed.moons:
+            # "Which moons orbit Mars and Jupiter?" asks for the moons
+            intents = intents - {"orbit"}
+        if not parsed.planets or not intents <= _PLAN_INTENTS:
+            return None
+        if len(parsed.planets) < 2 and len(parsed.attributes) < 2:
+            return None
+        return QueryPlan(list(dict.fromkeys(parsed.planets)), parsed.attributes)
+
+    def _answer_compound(self, parsed):
+        """Answer "mass and moons of Saturn and Neptune", one line per planet."""
+        plan = self.plan(parsed)
+        if plan is None:
+            return None
+        if not plan.attributes:
+            return "\n\n".join(
+                f"Information about {planet.name}:\n{planet}" for planet in plan.planets
+            )
+        lines = []
+        for planet in plan.planets:
+            parts = [self._phrase(attribute, planet) for attribute in plan.attributes]
+            if len(parts) > 1:
+                parts[-2:] = [f"{parts[-2]} and {parts[-1]}"]
+            lines.append(f"{planet.name} {', '.join(parts)}.")
+        return "\n".join(lines)
+
+    def _answer_membership(self, parsed):
+        """Answer whether a planet is in the list."""
+        if parsed.planets:
+            return f"Yes, {parsed.planets[0].name} is in the list of planets."
+
+        # Pluto is in the list whenever it was matched as a planet above
+        if "pluto" in parsed.tokens:
+            return "No, Pluto is not in the list of planets. It was reclassified as a dwarf planet in 2006."
+
+        # If no specific planet was found in the query
+        return "I couldn't identify which planet you're asking about."
+
+    def _answer_orbit(self, parsed):
+        """Answer which planet a moon orbits."""
+        if not parsed.moons:
+            return None
+        return " ".join(
+            f"{moon.name} orbits {planet.name}." for planet, moon in parsed.moons
+        )
+
+    def _answer_position(self, parsed):
+        """Answer where a planet is on a date, today if none is given."""
+        if not parsed.planets:
+            return None
+        planet = parsed.planets[0]
+        if planet.orbit is None:
+            return f"I don't have orbital elements for {planet.name}."
+        try:
+            day = _query_date(parsed.tokens)[0] or date.today()
+        except ValueError:
+            return _BAD_DATE
+        days = to_days(day)
+        x, y, z = position(planet.orbit, days)
+        from_sun = math.hypot(x, y, z)
+        answer = (
+            f"On {day.isoformat()}, {planet.name} is {_format_au(from_sun)} "
+            f"from the Sun, at ecliptic longitude {ecliptic_longitude(x, y):.1f}°"
+        )
+        earth = self.solar_system.get_planet_by_name("Earth")
+        if earth is not None and earth.name != planet.name and earth.orbit is not None:
+            from_earth = math.dist((x, y, z), position(earth.orbit, days))
+            answer += f", and {_format_au(from_earth)} from Earth"
+        return answer + "."
+
+    def _answer_when(self, parsed):
+        """Answer when two planets, or a planet and the Sun, are closest."""
+        farthest = "farthest" in parsed.intents
+        if not parsed.planets or not (farthest or "closest" in parsed.intents):
+            return None
+        bodies = parsed.planets[:2]
+        for planet in bodies:
+            if planet.orbit is None:
+                return f"I don't have orbital elements for {planet.name}."
+
+        # A year is searched: the one asked about, or the one from a date
+        try:
+            day, whole_year = _query_date(parsed.tokens)
+        except ValueError:
+            return _BAD_DATE
+        if whole_year:
+            start, end = day, date(day.year + 1, 1, 1)
+            scope = f"In {day.year}"
+        else:
+            start = day or date.today()
+            end = start + timedelta(days=365)
+            scope = f"In the year from {start.isoformat()}"
+        days, distance = closest_approach(
+            bodies[0].orbit,
+            bodies[1].orbit if len(bodies) > 1 else None,
+            start=to_days(start),
+            end=to_days(end),
+            farthest=farthest,
+        )
+        when = from_days(days).date().isoformat()
+        if len(bodies) > 1:
+            extreme = "farthest apart" if farthest else "closest"
+            pair = f"{bodies[0].name} and {bodies[1].name}"
+            return f"{scope}, {pair} are {extreme} on {when}: {_format_au(distance)}."
+        extreme = "farthest from" if farthest else "closest to"
+        return (
+            f"{scope}, {bodies[0].name} is {extreme} the Sun on {when}: "
+            f"{_format_au(distance)}."
+        )
+
+    def _answer_attribute(self, attribute, parsed):
+        """Answer a derived attribute, such as the length of a year, of a planet."""
+        if not parsed.planets:
+            return None
+        planet = parsed.planets[0]
+        return f"{planet.name} {self._phrase(attribute, planet)}."
+
+    def _phrase(self, attribute, planet):
+        """
+        Describe one attribute of a planet, completing "<planet name> ...".
+
+        Derived attributes come from the derived columns of the solar
+        system this query is answered from, which may not be the one the
+        planet was added to.
+        """
+        if attribute not in DERIVED_ATTRIBUTES:
+            return ATTRIBUTES[attribute](planet)
+        field, label = DERIVED_ATTRIBUTES[attribute]
+        phrase = self.solar_system.get_derived().phrase(field, planet.name)
+        if phrase is None:
+            return f"has an unknown {label}"
+        return phrase
+
+    def _answer_mass(self, parsed):
+        """Answer the mass of a planet."""
+        if not parsed.planets:
+            return None
+        planet = parsed.planets[0]
+        return f"{planet.name} {ATTRIBUTES['mass'](planet)}."
+
+    def _answer_distance(self, parsed):
+        """Answer the distance of a planet from the Sun."""
+        if not parsed.planets:
+            return None
+        planet = parsed.planets[0]
+        return f"{planet.name} {ATTRIBUTES['distance'](planet)}."
+
+    def _answer_moons(self, parsed):
+        """Answer how many moons a planet has."""
+        if not parsed.planets:
+            return None
+        planet = parsed.planets[0]
+        return f"{planet.name} {ATTRIBUTES['moons'](planet)}."
+
+    def _answer_list(self, parsed):
+        """List all planets."""
+        if "planets" not in parsed.intents:
+            return None
+        planets = self.solar_system.get_all_planet_names()
+        return f"The planets in our solar system are: {', '.join(planets)}."
+
+    def _answer_comparison(self, intent, parsed):
+        """Answer which planets are heavier, closer, ... than another."""
+        field, op, list_label, yes_label, no_label = COMPARISONS[intent]
+        if not parsed.planets:
+            # "Which planets are closer than 200 million km?"
+            return self._answer_range(op, parsed)
+
+        # "Is Mars heavier than Earth?"
+        if len(parsed.planets) > 1:
+            subject, reference = parsed.planets[:2]
+            compare = OPERATORS[op]
+            if compare(_planet_value(subject, field), _planet_value(reference, field)):
+                return f"Yes, {subject.name} {yes_label} {reference.name}."
+            return f"No, {subject.name} {no_label} {reference.name}."
+
+        reference = parsed.planets[0]
+        total, planets = self._planets_in_range(
+            field, **_bounds(op, _planet_value(reference, field))
+        )
+        if not total:
+            return f"There are no planets {list_label} {reference.name}."
+        items = [f"{p.name} ({format_value(p, field)})" for p in planets]
+        return f"Planets {list_label} {reference.name}: {self._join(items, total)}."
+
+    def _answer_range(self, op, parsed):
+        """Answer which bodies have a value above, below or between numbers."""
+        field = _range_field(parsed)
+        numbers = parsed.numbers
+        if field is None or not numbers or (op == "between" and len(numbers) < 2):
+            return None
+        bodies, above_label, below_label, between_label = RANGE_LABELS[field]
+        if op == "between":
+            low, high = sorted(numbers[:2])
+            bounds = {"low": low, "high": high}
+            label = between_label.format(_format_number(low), _format_number(high))
+        else:
+            bounds = _bounds(op, numbers[0])
+            label = (above_label if op == ">" else below_label).format(
+                _format_number(numbers[0])
+            )
+
+        if field == "diameter":
+            total, moons = self.solar_system.moons_in_range(
+                limit=self.list_limit, **bounds
+            )
+            items = [
+                f"{moon.name} ({moon.diameter} km, {planet.name})"
+                for planet, moon in moons
+            ]
+        else:
+            total, planets = self._planets_in_range(field, **bounds)
+            items = [f"{p.name} ({format_value(p, field)})" for p in planets]
+        if not total:
+            return f"There are no {bodies} {label}."
+        return f"{bodies.capitalize()} {label}: {self._join(items, total)}."
+
+    def _planets_in_range(self, field, **bounds):
+        """Return (count, planets up to the list limit) with field in range."""
+        if field == "moon_count":
+            rows = self.solar_system.get_columns().select(field, **bounds)
+            planets = self.solar_system.planets
+            return len(rows), [planets[row] for row in rows[: self.list_limit]]
+        return self.solar_system.planets_in_range(
+            field, limit=self.list_limit, **bounds
+        )
+
+    def _answer_superlative(self, intent, parsed):
+        """Answer which planets are the heaviest, closest, ... ."""
+        field, largest, singular, plural = SUPERLATIVES[intent]
+        count = requested_count(parsed.tokens)
+        rows = self.solar_system.get_columns().top(field, count, largest)
+        if not rows:
+            return "There are no planets in our database."
+        if count == 1:
+            return f"The {singular} is {self._describe_rows(rows, field)}."
+        return f"The {len(rows)} {plural} are: {self._describe_rows(rows, field)}."
+
+    def _answer_moon_superlative(self, intent, parsed):
+        """Answer which moons are the largest or smallest, overall or of a planet."""
+        if "moons" not in parsed.intents:
+            return None
+        largest, singular, plural = MOON_SUPERLATIVES[intent]
+        count = requested_count(parsed.tokens)
+        if parsed.planets:
+            # "largest moon of Jupiter": a planet has few moons, so sort them
+            planet = parsed.planets[0]
+            moons = sorted(
+                (moon for moon in planet.moons if moon.diameter is not None),
+                key=lambda moon: moon.diameter,
+                reverse=largest,
+            )[:count]
+            scope = f" of {planet.name}"
+            items = [f"{moon.name} ({moon.diameter} km)" for moon in moons]
+        else:
+            _, found = self.solar_system.moons_in_range(limit=count, largest=largest)
+            scope = ""
+            items = [
+                f"{moon.name} ({moon.diameter} km, {planet.name})"
+                for planet, moon in found
+            ]
+        if not items:
+            if parsed.planets:
+                return f"{parsed.planets[0].name} has no moons of known size in our database."
+            return "There are no moons of known size in our database."
+        if count == 1:
+            return f"The {singular}{scope} is {items[0]}."
+        return f"The {len(items)} {plural}{scope} are: {self._join(items, len(items))}."
+
+    def _answer_sort(self, parsed):
+        """List the planets ordered by an attribute."""
+        for intent, (field, label) in SORT_FIELDS.items():
+            if intent in parsed.intents:
+                break
+        else:
+            return None
+        largest = "descending" in parsed.tokens or "decreasing" in parsed.tokens
+        columns = self.solar_system.get_columns()
+        # Only the planets that will be shown need to be put in order.
+        rows = columns.top(field, self.list_limit, largest)
+        if not rows:
+            return "There are no planets in our database."
+        text = self._describe_rows(rows, field, total=len(columns))
+        return f"Planets by {label}: {text}."
+
+    def _describe_rows(self, rows, field, total=None):
+        """Name the planets in rows with their field, up to the list limit."""
+        planets = self.solar_system.planets
+        items = [
+            f"{planets[row].name} ({format_value(planets[row], field)})"
+            for row in rows[: self.list_limit]
+        ]
+        return self._join(items, len(rows) if total is None else total)
+
+    def _join(self, items, total):
+        """Join listed items, noting how many more there are past the limit."""
+        text = ", ".join(items)
+        if total > len(items):
+            text += f", and {total - len(items)} more"
+        return text
+
+
+def _planet_value(planet, field):
+    """Return the value of a PlanetColumns field for one planet."""
+    if field == "moon_count":
+        return planet.get_moon_count()
+    return getattr(planet, field)
+
+
+def _moons_phrase(planet):
+    count = planet.get_moon_count()
+    if count == 0:
+        return "doesn't have any moons in our database"
+    return f"has {count} moons in our database: {', '.join(planet.moons.names)}"
+
+
+def _bounds(op, value):
+    """Turn an operator and value into range bounds, e.g. ">" -> low."""
+    if op == ">":
+        return {"low": value, "include_low": False}
+    return {"high": value, "include_high": False}
+
+
+def _format_number(value):
+    """Format a number from a query without a needless ".0"."""
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def _format_au(distance):
+    """Format a distance in AU, with the million km the rest of the app uses."""
+    return f"{distance:.3f} AU ({distance * AU_MILLION_KM:,.1f} million km)"
+
+
+def _query_date(tokens):
+    """
+    Find the date a query asks about.
+
+    "2030-01-01" tokenizes to "2030", "01", "01"; a year on its own means
+    the whole year. Numbers of five or more digits are years too, always
+    out of range, so "in 99999" is not answered for today.
+
+    Returns:
+        tuple: (date or None, whether only a year was given)
+
+    Raises:
+        ValueError: If the date does not exist, such as 2030-02-30, or
+            its year is outside MIN_YEAR to MAX_YEAR
+    """
+    for i, token in enumerate(tokens):
+        if len(token) < 4 or not token.isdigit():
+            continue
+        year = int(token)
+        if not MIN_YEAR <= year <= MAX_YEAR:
+            raise ValueError(f"year {year} is out of range")
+        parts = tokens[i + 1 : i + 3]
+        if len(parts) == 2 and all(part.isdigit() and len(part) <= 2 for part in parts):
+            return date(year, int(parts[0]), int(parts[1])), False
+        return date(year, 1, 1), True
+    return None, False
+
+
+def _range_field(parsed):
+    """Work out which value a range question is about."""
+    intents = parsed.intents
+    if intents & {"larger", "smaller"} or "diameter" in parsed.tokens:
+        return "diameter"
+    if intents & {"mass", "heavier", "lighter"}:
+        return "mass"
+    if intents & {"distance", "farther", "closer"}:
+        return "distance_from_sun"
+    if intents & {"more_moons", "fewer_moons"}:
+        return "moon_count"
+    if "moons" in intents:
+        # "planets with more than 2 moons" vs "moons above 1000 km"
+        return "moon_count" if "planets" in intents else "diameter"
+    return None
+
+
+# Per-process query processor used by QueryProcessor.process_many workers.
+_worker_processor = None
+
+
+def _init_worker(solar_system):
+    """Build the query processor for a worker process."""
+    global _worker_processor
+    _worker_processor = QueryProcessor(solar_system)
+
+
+def _answer_chunk(queries):
+    """Answer a chunk of queries in a worker process."""
+    return [_worker_processor.process_query(query) for query in queries]
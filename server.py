@@ -0,0 +1,155 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Longest request line accepted, in bytes.
+LINE_LIMIT = 64 * 1024
+
+
+class QueryServer:
+    """
+    Asyncio server answering newline-delimited JSON queries.
+
+    Each request line is either a JSON string or an object such as
+    {"id": 1, "query": "How massive is Jupiter?"}. Each response line is
+    {"id": ..., "answer": ..., "latency_ms": ...}, or has "error" in place
+    of "answer". Clients may pipeline requests; answers come back in
+    request order.
+
+    Queries run on worker threads, so a slow answer never stalls the
+    event loop. A QueryProcessor is not thread-safe, so when it reads a
+    SharedSolarSystem, each of up to max_concurrency worker threads
+    answers with its own copy of it; any other query processor answers
+    one query at a time on a single thread. At most max_pending requests
+    are buffered per connection; past that, the server stops reading from
+    the socket until it catches up.
+    """
+
+    def __init__(self, query_processor, max_concurrency=64, max_pending=32):
+        self.query_processor = query_processor
+        self.max_pending = max_pending
+        self._copies = getattr(query_processor, "shared", None) is not None
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency if self._copies else 1
+        )
+        # The query processor of each worker thread
+        self._local = threading.local()
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        """
+        Start listening on a TCP port, or on a Unix socket if path is given.
+
+        Returns:
+            asyncio.Server: The listening server
+        """
+        if path:
+            self._server = await asyncio.start_unix_server(
+                self.handle_connection, path=path, limit=LINE_LIMIT
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self.handle_connection, host, port, limit=LINE_LIMIT
+            )
+        return self._server
+
+    async def close(self):
+        """Stop listening and release the worker threads."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        """Read requests from one client and write the answers in order."""
+        pending = asyncio.Queue(self.max_pending)
+        responder = asyncio.create_task(self._respond(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    await pending.put((time.perf_counter(), None))
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    # Blocks while the queue is full, which stops reading
+                    # from the socket and pushes back on the client.
+                    await pending.put((time.perf_counter(), line))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def _respond(self, pending, writer):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            received, line = item
+            request_id, query, error = _parse_request(line)
+            response = {"id": request_id}
+            if error:
+                response["error"] = error
+            else:
+                try:
+                    response["answer"] = await loop.run_in_executor(
+                        self._executor, self._answer, query
+                    )
+                except Exception as error:
+                    # One failed query must not stall the rest of the pipeline
+                    response["error"] = str(error)
+            response["latency_ms"] = round((time.perf_counter() - received) * 1000, 3)
+            try:
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+            except ConnectionError:
+                # The client went away; drain the queue so the reader can finish.
+                while await pending.get() is not None:
+                    pass
+                return
+
+    def _answer(self, query):
+        """Answer a query with this worker thread's query processor."""
+        processor = getattr(self._local, "processor", None)
+        if processor is None:
+            if self._copies:
+                processor = self.query_processor.copy()
+            else:
+                processor = self.query_processor
+            self._local.processor = processor
+        return processor.process_query(query)
+
+
+def _parse_request(line):
+    """Return (id, query, error) for one request line."""
+    if line is None:
+        return None, None, "Request line too long"
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None, None, "Request is not valid JSON"
+    if isinstance(request, str):
+        return None, request, None
+    if isinstance(request, dict) and isinstance(request.get("query"), str):
+        return request.get("id"), request["query"], None
+    request_id = request.get("id") if isinstance(request, dict) else None
+    return request_id, None, 'Request needs a "query" string'
+
+
+async def serve(query_processor, host="127.0.0.1", port=8765, path=None, **options):
+    """Run a QueryServer until cancelled."""
+    server = QueryServer(query_processor, **options)
+    listener = await server.start(host, port, path)
+    where = path or ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+    print(f"Serving queries on {where}")
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
@@ -0,0 +1,592 @@
+import math
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from ephemeris import ELEMENT_FIELDS, MEAN_MOTION_1AU, SUN_MASS, state_vectors
+from lazy import lazy_import
+from storage import atomic_write, read_exact, read_name, write_name
+
+# Simulations need NumPy; the rest of the app does not. It is only loaded
+# when a simulation first uses it, keeping it off the startup path.
+np = lazy_import("numpy")
+
+# Simulations work in AU, days and the planet mass unit of 10^24 kg.
+# G in AU^3 / (10^24 kg day^2), from the Gaussian gravitational constant
+GRAVITATIONAL_CONSTANT = math.radians(MEAN_MOTION_1AU) ** 2 / SUN_MASS
+
+BACKENDS = ("direct", "barnes_hut")
+
+# Body pairs handled at once by the direct backend, to bound memory
+_PAIR_BLOCK = 1 << 18
+# Bodies whose forces are worked out together by the Barnes-Hut backend,
+# in groups that share one walk of the tree
+_TREE_CHUNK = 4096
+_GROUP_SIZE = 32
+# Opened cells with at most this many bodies are summed body by body
+_LEAF_SIZE = 8
+# Octree levels; cells at the deepest level are 2^-16 of the whole box
+_TREE_DEPTH = 16
+
+# Trajectory file: a magic header, the body count and names, then frames.
+#   header: magic, body count (u32), names (u16 byte length + UTF-8)
+#   frame:  time (f64), then x, y, z (f64) of every body in turn
+TRAJECTORY_MAGIC = b"SST1"
+_COUNT = struct.Struct("<I")
+_TIME = struct.Struct("<d")
+
+
+class Simulation:
+    """
+    Gravitational N-body simulation with a kick-drift-kick leapfrog.
+
+    Leapfrog is symplectic, so the energy error stays bounded over long
+    runs instead of growing steadily. Forces come from one of two
+    backends:
+
+    - "direct" sums every pair, exact and fastest for up to a few
+      thousand bodies.
+    - "barnes_hut" groups distant bodies with an octree, costing
+      O(N log N) per step with an error controlled by theta.
+
+    With several workers, force evaluation is split between processes.
+    Use the simulation as a context manager, or call close(), to shut
+    the workers down.
+    """
+
+    def __init__(
+        self,
+        masses,
+        positions,
+        velocities,
+        names=None,
+        time=0.0,
+        backend="direct",
+        theta=0.5,
+        softening=0.0,
+        workers=None,
+    ):
+        """
+        Args:
+            masses (sequence): N masses, in 10^24 kg
+            positions (sequence): (N, 3) positions, in AU
+            velocities (sequence): (N, 3) velocities, in AU per day
+            names (list): Body names, for trajectory files
+            time (float): Starting time, in days from J2000
+            backend (str): "direct" or "barnes_hut"
+            theta (float): Barnes-Hut opening angle; smaller is more exact
+            softening (float): Length in AU added to every separation, to
+                keep close encounters finite
+            workers (int): Processes to split force evaluation between;
+                None or 1 evaluates forces in this process
+        """
+        if np is None:
+            raise ImportError("NumPy is needed to run simulations")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.masses = np.array(masses, dtype=float)
+        self.positions = np.array(positions, dtype=float).reshape(-1, 3)
+        self.velocities = np.array(velocities, dtype=float).reshape(-1, 3)
+        self.names = list(names) if names is not None else [
+            f"Body-{i}" for i in range(len(self.masses))
+        ]
+        self.time = float(time)
+        self.backend = backend
+        self.theta = theta
+        self.softening = softening
+        self.workers = workers
+        self._pool = None
+        self._accelerations = None
+        # Reference for energy_drift(), measured when first needed since
+        # the exact energy costs O(N^2)
+        self.initial_energy = None
+
+    @classmethod
+    def from_solar_system(cls, solar_system, day=0.0, include_sun=True, **options):
+        """
+        Start a simulation from the planets that have orbits and masses.
+
+        Positions and velocities come from each planet's orbit at the
+        given day. The result is moved to the centre of mass frame so the
+        system does not drift.
+
+        Args:
+            solar_system (SolarSystem): Where the planets come from
+            day (float): Starting time, in days from J2000
+            include_sun (bool): Add the Sun as a body at the origin
+            **options: Passed on to Simulation, e.g. backend or workers
+
+        Returns:
+            Simulation: The new simulation
+        """
+        columns = solar_system.get_columns()
+        elements = [columns.values(field) for field in ELEMENT_FIELDS]
+        masses = np.asarray(columns.values("mass"), dtype=float)
+        keep = ~np.isnan(np.asarray(elements[0])) & (masses > 0)
+        rows = np.flatnonzero(keep)
+        positions, velocities = state_vectors(
+            [np.asarray(column)[rows] for column in elements], day
+        )
+        names = [solar_system.planets[row].name for row in rows.tolist()]
+        masses = masses[rows]
+        if include_sun:
+            names.insert(0, "Sun")
+            masses = np.concatenate([[SUN_MASS], masses])
+            positions = np.concatenate([np.zeros((1, 3)), positions])
+            velocities = np.concatenate([np.zeros((1, 3)), velocities])
+        total = masses.sum()
+        if total > 0:
+            positions = positions - masses @ positions / total
+            velocities = velocities - masses @ velocities / total
+        return cls(masses, positions, velocities, names, day, **options)
+
+    def __len__(self):
+        return len(self.masses)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def accelerations(self):
+        """
+        Return the gravitational acceleration of every body.
+
+        Returns:
+            ndarray: (N, 3) accelerations, in AU per day^2
+        """
+        softening2 = self.softening * self.softening
+        if self.backend == "direct":
+            data = (self.positions, self.masses)
+            chunks = _chunks(len(self), max(1, _PAIR_BLOCK // max(len(self), 1)))
+            tasks = [("direct", data, chunk, None, softening2) for chunk in chunks]
+            return np.concatenate(self._evaluate(tasks)) if tasks else np.zeros((0, 3))
+
+        tree = _Octree(self.positions, self.masses)
+        chunks = _chunks(len(self), _TREE_CHUNK)
+        tasks = [("barnes_hut", tree, chunk, self.theta, softening2) for chunk in chunks]
+        # The tree works on bodies in its own order; put them back
+        found = np.empty((len(self), 3))
+        if tasks:
+            found[tree.order] = np.concatenate(self._evaluate(tasks))
+        return found
+
+    def _evaluate(self, tasks):
+        """Run force tasks here, or across the worker pool."""
+        if not self.workers or self.workers <= 1 or len(tasks) < 2:
+            return [_chunk_accelerations(task) for task in tasks]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return list(self._pool.map(_chunk_accelerations, tasks))
+
+    def step(self, dt, steps=1):
+        """
+        Advance the simulation with kick-drift-kick leapfrog steps.
+
+        Args:
+            dt (float): Step length, in days
+            steps (int): Number of steps to take
+        """
+        if self._accelerations is None:
+            self._accelerations = self.accelerations()
+        half = 0.5 * dt
+        for _ in range(steps):
+            self.velocities += half * self._accelerations
+            self.positions += dt * self.velocities
+            self._accelerations = self.accelerations()
+            self.velocities += half * self._accelerations
+            self.time += dt
+
+    def run(
+        self,
+        dt,
+        steps,
+        trajectory=None,
+        every=1,
+        checkpoint=None,
+        checkpoint_every=None,
+        track_energy=True,
+    ):
+        """
+        Run for a number of steps, streaming output as it goes.
+
+        Args:
+            dt (float): Step length, in days
+            steps (int): Number of steps to take
+            trajectory (TrajectoryWriter): Receives the positions every
+                `every` steps, starting with the initial state
+            every (int): Steps between trajectory frames and energy samples
+            checkpoint (str): File the state is saved to every
+                `checkpoint_every` steps and at the end
+            checkpoint_every (int): Steps between checkpoints; None saves
+                only at the end
+            track_energy (bool): Sample the energy drift, which costs an
+                all-pairs sum each time
+
+        Returns:
+            list: (time, relative energy drift) samples, taken every
+                `every` steps, or empty when track_energy is False
+        """
+        drift = []
+
+        def sample():
+            if trajectory is not None:
+                trajectory.write(self.time, self.positions)
+            if track_energy:
+                drift.append((self.time, self.energy_drift()))
+
+        sample()
+        done = 0
+        while done < steps:
+            count = min(every - done % every, steps - done)
+            if checkpoint_every:
+                count = min(count, checkpoint_every - done % checkpoint_every)
+            self.step(dt, count)
+            done += count
+            if done % every == 0 or done == steps:
+                sample()
+            if checkpoint and checkpoint_every and done % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint)
+        if checkpoint:
+            self.save_checkpoint(checkpoint)
+        return drift
+
+    def energy(self):
+        """
+        Return the total kinetic plus potential energy.
+
+        The potential is an exact sum over every pair, done in blocks, so
+        it costs O(N^2) whichever backend moves the bodies.
+
+        Returns:
+            float: Energy, in 10^24 kg AU^2 per day^2
+        """
+        kinetic = 0.5 * float(self.masses @ (self.velocities**2).sum(axis=1))
+        softening2 = self.softening * self.softening
+        potential = 0.0
+        count = len(self)
+        rows = max(1, _PAIR_BLOCK // max(count, 1))
+        for start in range(0, count, rows):
+            stop = min(start + rows, count)
+            targets = self.positions[start:stop]
+            inverse = np.full((stop - start, count - start), softening2)
+            for axis in range(3):
+                offset = self.positions[start:, axis] - targets[:, axis, np.newaxis]
+                offset *= offset
+                inverse += offset
+            np.sqrt(inverse, out=inverse)
+            with np.errstate(divide="ignore"):
+                np.divide(1.0, inverse, out=inverse)
+            # Only pairs (i, j) with j > i, so each is counted once
+            inverse[np.tril_indices(stop - start, 0, count - start)] = 0.0
+            inverse[~np.isfinite(inverse)] = 0.0
+            potential -= float(self.masses[start:stop] @ (inverse @ self.masses[start:]))
+        return kinetic + GRAVITATIONAL_CONSTANT * potential
+
+    def energy_drift(self):
+        """
+        Return the energy change relative to the energy first measured.
+
+        The first call, made by run() when it starts, records the
+        reference energy and returns 0.
+        """
+        energy = self.energy()
+        if self.initial_energy is None:
+            self.initial_energy = energy
+        if self.initial_energy == 0:
+            return 0.0
+        return (energy - self.initial_energy) / abs(self.initial_energy)
+
+    def save_checkpoint(self, file_path):
+        """
+        Save the full state, replacing the file atomically.
+
+        Returns:
+            bool: True if the file was written
+        """
+        try:
+            with atomic_write(file_path, "wb") as outfile:
+                np.savez(
+                    outfile,
+                    masses=self.masses,
+                    positions=self.positions,
+                    velocities=self.velocities,
+                    names=np.array(self.names, dtype=str),
+                    time=self.time,
+                    initial_energy=np.nan
+                    if self.initial_energy is None
+                    else self.initial_energy,
+                )
+        except OSError:
+            return False
+        return True
+
+    @classmethod
+    def load_checkpoint(cls, file_path, **options):
+        """
+        Resume a simulation from a checkpoint.
+
+        Energy drift is still measured from the original start.
+
+        Args:
+            file_path (str): A file written by save_checkpoint
+            **options: Passed on to Simulation, e.g. backend or workers
+
+        Returns:
+            Simulation: The restored simulation, or None if the file is
+                missing or not a checkpoint
+        """
+        try:
+            with np.load(file_path) as data:
+                simulation = cls(
+                    data["masses"],
+                    data["positions"],
+                    data["velocities"],
+                    data["names"].tolist(),
+                    float(data["time"]),
+                    **options,
+                )
+                initial_energy = float(data["initial_energy"])
+                if not math.isnan(initial_energy):
+                    simulation.initial_energy = initial_energy
+        except (OSError, ValueError, KeyError):
+            return None
+        return simulation
+
+
+class TrajectoryWriter:
+    """
+    Stream simulation frames to a binary file as they are produced.
+
+    Frames are written straight out, so a long run never holds its
+    trajectory in memory. Read them back with read_trajectory.
+    """
+
+    def __init__(self, file_path, names):
+        """
+        Args:
+            file_path (str): The file to write
+            names (list): Body names, in simulation order
+        """
+        self.count = len(names)
+        self.frames = 0
+        self._file = open(file_path, "wb")
+        self._file.write(TRAJECTORY_MAGIC)
+        self._file.write(_COUNT.pack(self.count))
+        for name in names:
+            write_name(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, time, positions):
+        """Append one frame: a time and the (N, 3) positions."""
+        self._file.write(_TIME.pack(time))
+        self._file.write(np.ascontiguousarray(positions, dtype="<f8").tobytes())
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_trajectory(file_path):
+    """
+    Read a trajectory file one frame at a time.
+
+    Args:
+        file_path (str): A file written by TrajectoryWriter
+
+    Yields:
+        tuple: The body names first, then (time, (N, 3) positions) per frame
+    """
+    with open(file_path, "rb") as infile:
+        if infile.read(len(TRAJECTORY_MAGIC)) != TRAJECTORY_MAGIC:
+            raise ValueError("Not a trajectory file")
+        (count,) = _COUNT.unpack(read_exact(infile, _COUNT.size))
+        yield [read_name(infile) for _ in range(count)]
+        frame_size = count * 3 * 8
+        while True:
+            header = infile.read(_TIME.size)
+            if not header:
+                return
+            (time,) = _TIME.unpack(header)
+            data = read_exact(infile, frame_size)
+            yield time, np.frombuffer(data, dtype="<f8").reshape(count, 3)
+
+
+class _Octree:
+    """
+    Linear octree over bodies sorted by Morton code.
+
+    Each level is stored as arrays: the range of sorted bodies in each
+    cell, its mass and centre of mass, and the range of its children on
+    the next level. Cells on one level are in Morton order, so a cell's
+    children are contiguous and found by binary search.
+    """
+
+    def __init__(self, positions, masses, depth=_TREE_DEPTH):
+        low = positions.min(axis=0)
+        self.size = float((positions.max(axis=0) - low).max()) * (1 + 1e-9) or 1.0
+        cells = ((positions - low) * ((1 << depth) / self.size)).astype(np.int64)
+        np.clip(cells, 0, (1 << depth) - 1, out=cells)
+        codes = _morton(cells, depth)
+        self.order = np.argsort(codes, kind="stable")
+        codes = codes[self.order]
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+
+        weighted = self.positions * self.masses[:, np.newaxis]
+        count = len(codes)
+        self.levels = []
+        prefixes = []
+        for level in range(depth + 1):
+            prefix = codes >> (3 * (depth - level))
+            starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+            ends = np.r_[starts[1:], count]
+            mass = np.add.reduceat(self.masses, starts)
+            centre = self.positions[starts].copy()
+            massive = mass > 0
+            centre[massive] = (
+                np.add.reduceat(weighted, starts, axis=0)[massive]
+                / mass[massive, np.newaxis]
+            )
+            self.levels.append([starts, ends, mass, centre, None, None])
+            prefixes.append(prefix[starts])
+            # Once every cell holds one body, deeper levels add nothing
+            if len(starts) == count:
+                break
+        for level in range(len(self.levels) - 1):
+            parents = prefixes[level + 1] >> 3
+            self.levels[level][4] = np.searchsorted(parents, prefixes[level], "left")
+            self.levels[level][5] = np.searchsorted(parents, prefixes[level], "right")
+
+    def accelerations(self, chunk, theta, softening2):
+        """
+        Return G-less accelerations of the sorted bodies in a slice.
+
+        Bodies are taken in groups of neighbours in Morton order, and each
+        group walks the tree once (Barnes' group walk). A frontier of
+        (group, cell) pairs is worked through a level at a time: a cell
+        far enough from the whole group is accepted as a point mass,
+        a small cell is replaced by its bodies, and any other cell by its
+        children. Each group's accepted sources are then summed directly.
+        """
+        firsts = np.arange(chunk.start, chunk.stop, _GROUP_SIZE)
+        lasts = np.minimum(firsts + _GROUP_SIZE, chunk.stop)
+        targets = self.positions[chunk]
+        low = np.minimum.reduceat(targets, firsts - chunk.start)
+        high = np.maximum.reduceat(targets, firsts - chunk.start)
+
+        theta2 = theta * theta
+        groups = np.arange(len(firsts))
+        cells = np.zeros(len(firsts), dtype=np.int64)
+        owners, sources, source_masses = [], [], []
+        last = len(self.levels) - 1
+        for level, (starts, ends, mass, centre, first, stop) in enumerate(self.levels):
+            if not len(groups):
+                break
+            # Distance from each cell's centre of mass to the group's box
+            points = centre[cells]
+            gap = np.maximum(low[groups] - points, 0) + np.maximum(points - high[groups], 0)
+            size = self.size / (1 << level)
+            opened = size * size > theta2 * (gap * gap).sum(axis=1)
+
+            accepted = ~opened
+            owners.append(groups[accepted])
+            sources.append(points[accepted])
+            source_masses.append(mass[cells[accepted]])
+
+            counts = ends[cells] - starts[cells]
+            small = opened & ((counts <= _LEAF_SIZE) | (level == last))
+            if small.any():
+                owners.append(np.repeat(groups[small], counts[small]))
+                bodies = _expand(starts[cells[small]], counts[small])
+                sources.append(self.positions[bodies])
+                source_masses.append(self.masses[bodies])
+
+            deeper = opened & ~small
+            if not deeper.any():
+                break
+            parents = cells[deeper]
+            groups = np.repeat(groups[deeper], stop[parents] - first[parents])
+            cells = _expand(first[parents], stop[parents] - first[parents])
+
+        owners = np.concatenate(owners)
+        order = np.argsort(owners, kind="stable")
+        bounds = np.searchsorted(owners[order], np.arange(len(firsts) + 1))
+        sources = np.concatenate(sources)[order]
+        source_masses = np.concatenate(source_masses)[order]
+        found = np.empty((len(targets), 3))
+        for group, (begin, end) in enumerate(zip(firsts, lasts)):
+            pulled = slice(bounds[group], bounds[group + 1])
+            found[begin - chunk.start : end - chunk.start] = _pull(
+                self.positions[begin:end],
+                sources[pulled],
+                source_masses[pulled],
+                softening2,
+            )
+        return found
+
+
+def _expand(starts, counts):
+    """Concatenate range(start, start + count) for each pair, as one array."""
+    skip = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(len(skip)) - skip
+
+
+def _pull(targets, sources, masses, softening2):
+    """
+    Sum the G-less pull of every source on every target.
+
+    Sources at a target's own position are skipped, so a body can be
+    passed as a source of itself.
+    """
+    strength = np.full((len(targets), len(sources)), softening2)
+    for axis in range(3):
+        offset = sources[:, axis] - targets[:, axis, np.newaxis]
+        offset *= offset
+        strength += offset
+    # m / r^3, via a square root rather than the much slower power
+    distance = np.sqrt(strength)
+    strength *= distance
+    with np.errstate(divide="ignore"):
+        np.divide(masses, strength, out=strength)
+    strength[~np.isfinite(strength)] = 0.0
+    # sum_j s_ij (x_j - x_i), as matrix products
+    found = strength @ sources
+    found -= targets * strength.sum(axis=1)[:, np.newaxis]
+    return found
+
+
+def _morton(cells, depth):
+    """Interleave the bits of (N, 3) cell coordinates into Morton codes."""
+    codes = np.zeros(len(cells), dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + 2 - axis)
+    return codes
+
+
+def _chunks(count, size):
+    """Split range(count) into slices of at most size."""
+    return [slice(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def _chunk_accelerations(task):
+    """Accelerations for one slice of bodies; runs in worker processes too."""
+    backend, data, chunk, theta, softening2 = task
+    if backend == "barnes_hut":
+        found = data.accelerations(chunk, theta, softening2)
+    else:
+        positions, masses = data
+        found = _pull(positions[chunk], positions, masses, softening2)
+    return GRAVITATIONAL_CONSTANT * found
@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in milliseconds. Anything
+# slower lands in a final overflow bucket.
+BUCKET_BOUNDS_MS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class LatencyHistogram:
+    """Call count, total and maximum time, and a bucketed latency histogram."""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def record(self, seconds):
+        milliseconds = seconds * 1000
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+
+    def percentile(self, fraction):
+        """
+        Estimate a latency percentile from the buckets.
+
+        Returns the upper bound of the bucket holding the percentile, or the
+        maximum seen if that is smaller, so it never understates.
+        """
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max,
+            "buckets": list(self.buckets),
+        }
+
+
+class Stats:
+    """
+    Counters and latency histograms, grouped by kind (queries, storage, ...).
+
+    When disabled, record() and timed() return at once, so instrumented
+    code pays for one attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Args:
+            enabled (bool): Whether to start recording straight away
+        """
+        self.enabled = enabled
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def record(self, group, name, seconds):
+        """
+        Count one call of name and add its latency to the histogram.
+
+        Args:
+            group (str): Kind of call, e.g. "queries" or "storage"
+            name (str): What was called, e.g. the query intent or "load"
+            seconds (float): How long the call took
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histograms = self._groups.setdefault(group, {})
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timed(self, group, name):
+        """Record how long the body of a with block takes."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(group, name, time.perf_counter() - start)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._groups = {}
+
+    def snapshot(self):
+        """
+        Return a copy of everything recorded, safe to keep or serialise.
+
+        Returns:
+            dict: {"enabled": bool, "groups": {group: {name: histogram}}},
+                with each histogram as a dict of count, mean, percentiles,
+                maximum (all in milliseconds) and bucket counts
+        """
+        with self._lock:
+            groups = {
+                group: {name: h.snapshot() for name, h in sorted(histograms.items())}
+                for group, histograms in self._groups.items()
+            }
+        return {"enabled": self.enabled, "groups": groups}
+
+
+def format_snapshot(snapshot):
+    """
+    Lay out a snapshot as a plain text table.
+
+    Args:
+        snapshot (dict): A snapshot from Stats.snapshot, optionally with a
+            "cache" entry of hits, misses and size
+
+    Returns:
+        str: One line per recorded call, grouped by kind
+    """
+    lines = []
+    if not snapshot["enabled"]:
+        lines.append("Statistics are switched off.")
+    cache = snapshot.get("cache")
+    if cache is not None:
+        lookups = cache["hits"] + cache["misses"]
+        rate = cache["hits"] / lookups if lookups else 0.0
+        lines.append(
+            f"Answer cache: {cache['hits']} hits, {cache['misses']} misses "
+            f"({rate:.0%} hit rate), {cache['size']} entries"
+        )
+    for group, histograms in snapshot["groups"].items():
+        lines.append("")
+        lines.append(
+            f"{group:<16} {'calls':>8} {'mean ms':>9} {'p50':>8} "
+            f"{'p95':>8} {'p99':>8} {'max':>9}"
+        )
+        for name, h in histograms.items():
+            lines.append(
+                f"  {name:<14} {h['count']:>8} {h['mean_ms']:>9.3f} "
+                f"{h['p50_ms']:>8.3f} {h['p95_ms']:>8.3f} {h['p99_ms']:>8.3f} "
+                f"{h['max_ms']:>9.3f}"
+            )
+    if not snapshot["groups"] and snapshot["enabled"]:
+        lines.append("Nothing recorded yet.")
+    return "\n".join(lines)
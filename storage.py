@@ -0,0 +1,282 @@
+import json
+import math
+import os
+import struct
+from contextlib import contextmanager
+
+from ephemeris import ELEMENT_FIELDS
+from mapped import MAPPED_EXTENSIONS, write_mapped
+
+# Binary catalogue: a magic header followed by one record per planet.
+#   planet: name, mass (f64), distance_from_sun (f64), moon count (u32),
+#           orbital elements (f64 each, NaN when unknown; not in SSB1)
+#   moon:   name, diameter (f64, NaN when unknown)
+# Names are a u16 byte length followed by UTF-8 bytes.
+BINARY_MAGIC = b"SSB2"
+# Earlier version without orbital elements, still readable
+_BINARY_MAGIC_V1 = b"SSB1"
+BINARY_EXTENSIONS = (".bin", ".ssb")
+
+_NAME_LEN = struct.Struct("<H")
+_PLANET = struct.Struct("<ddI")
+_MOON = struct.Struct("<d")
+_ORBIT = struct.Struct("<" + "d" * len(ELEMENT_FIELDS))
+_NO_ORBIT = (math.nan,) * len(ELEMENT_FIELDS)
+
+_READ_SIZE = 1 << 16
+
+# Snapshot: a mapped catalogue followed by a trailer saying which source
+# file it was built from. Bump SNAPSHOT_VERSION whenever what is stored
+# changes, so older snapshots are rebuilt rather than misread.
+#   trailer: magic, version (u32), source size (u64), source mtime (ns, i64)
+SNAPSHOT_MAGIC = b"SSnp"
+SNAPSHOT_VERSION = 2
+_SNAPSHOT_TRAILER = struct.Struct("<4sIQq")
+
+
+def detect_format(file_path):
+    """Return "mapped", "binary" or "json" based on the file extension."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in MAPPED_EXTENSIONS:
+        return "mapped"
+    if extension in BINARY_EXTENSIONS:
+        return "binary"
+    return "json"
+
+
+@contextmanager
+def atomic_write(file_path, mode="w"):
+    """
+    Open a temporary file next to file_path and move it into place on success.
+
+    Readers see either the old file or the complete new one, never a
+    partial write. On error the temporary file is removed.
+    """
+    # Imported here: only writes need it, and it is slow to import
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+    kwargs = {"encoding": "utf-8", "newline": "\n"} if "b" not in mode else {}
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def snapshot_path(file_path):
+    """Return where the snapshot of a data file is kept."""
+    return os.path.splitext(file_path)[0] + ".snapshot.ssm"
+
+
+def source_stamp(file_path):
+    """
+    Identify the current contents of a file by its size and modification time.
+
+    Returns:
+        tuple: (size, mtime in nanoseconds), or None if the file is missing
+    """
+    try:
+        status = os.stat(file_path)
+    except OSError:
+        return None
+    return status.st_size, status.st_mtime_ns
+
+
+def write_snapshot(planets, outfile, stamp):
+    """Write planets as a mapped catalogue tagged with the source's stamp."""
+    write_mapped(planets, outfile)
+    outfile.write(_SNAPSHOT_TRAILER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, *stamp))
+
+
+def snapshot_is_current(file_path, source_path):
+    """
+    Check a snapshot was built by this version from the source as it is now.
+
+    Returns:
+        bool: False if the snapshot is missing, from another version, or
+            the source has changed since it was written
+    """
+    stamp = source_stamp(source_path)
+    if stamp is None:
+        return False
+    try:
+        with open(file_path, "rb") as infile:
+            infile.seek(-_SNAPSHOT_TRAILER.size, os.SEEK_END)
+            magic, version, size, mtime = _SNAPSHOT_TRAILER.unpack(
+                infile.read(_SNAPSHOT_TRAILER.size)
+            )
+    except (OSError, struct.error):
+        return False
+    return magic == SNAPSHOT_MAGIC and version == SNAPSHOT_VERSION and (size, mtime) == stamp
+
+
+def write_json(planets, outfile):
+    """Write planets as a JSON array, one planet at a time."""
+    outfile.write("[")
+    separator = "\n"
+    for planet in planets:
+        outfile.write(separator)
+        outfile.write(json.dumps(planet.to_dict(), ensure_ascii=False))
+        separator = ",\n"
+    outfile.write("\n]\n")
+
+
+def iter_json(infile):
+    """
+    Yield the items of a top-level JSON array without reading it all at once.
+
+    Raises:
+        ValueError: If the file is not a well-formed JSON array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = infile.read(_READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[pos : pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    first = True
+    while True:
+        skip_whitespace()
+        if buffer[pos : pos + 1] == "]":
+            return
+        if not first:
+            if buffer[pos : pos + 1] != ",":
+                raise ValueError("Expected ',' between array items")
+            pos += 1
+            skip_whitespace()
+        first = False
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A number may be cut short at the end of the buffer.
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        yield item
+
+
+def write_name(outfile, name):
+    """Write a name as a u16 byte length followed by its UTF-8 bytes."""
+    data = name.encode("utf-8")
+    outfile.write(_NAME_LEN.pack(len(data)))
+    outfile.write(data)
+
+
+def read_exact(infile, size):
+    """
+    Read exactly size bytes from a binary file.
+
+    Raises:
+        ValueError: If the file ends first
+    """
+    data = infile.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated binary file")
+    return data
+
+
+def read_name(infile):
+    """Read a name written by write_name()."""
+    (length,) = _NAME_LEN.unpack(read_exact(infile, _NAME_LEN.size))
+    return read_exact(infile, length).decode("utf-8")
+
+
+def _number(value):
+    """Give whole numbers back their int form, as they were written in JSON."""
+    return int(value) if value.is_integer() else value
+
+
+def write_binary(planets, outfile):
+    """Write planets in the compact binary format, one record at a time."""
+    outfile.write(BINARY_MAGIC)
+    for planet in planets:
+        write_name(outfile, planet.name)
+        outfile.write(
+            _PLANET.pack(planet.mass, planet.distance_from_sun, len(planet.moons))
+        )
+        orbit = planet.orbit
+        outfile.write(_ORBIT.pack(*(_NO_ORBIT if orbit is None else orbit.elements())))
+        for moon in planet.moons:
+            write_name(outfile, moon.name)
+            diameter = math.nan if moon.diameter is None else moon.diameter
+            outfile.write(_MOON.pack(diameter))
+
+
+def iter_binary(infile):
+    """
+    Yield planet dictionaries from a binary catalogue.
+
+    Raises:
+        ValueError: If the file is not a complete binary catalogue
+    """
+    magic = infile.read(len(BINARY_MAGIC))
+    if magic not in (BINARY_MAGIC, _BINARY_MAGIC_V1):
+        raise ValueError("Not a binary planet catalogue")
+    while True:
+        prefix = infile.read(_NAME_LEN.size)
+        if not prefix:
+            return
+        if len(prefix) != _NAME_LEN.size:
+            raise ValueError("Truncated binary catalogue")
+        (length,) = _NAME_LEN.unpack(prefix)
+        name = read_exact(infile, length).decode("utf-8")
+        mass, distance, moon_count = _PLANET.unpack(read_exact(infile, _PLANET.size))
+        orbit = None
+        if magic == BINARY_MAGIC:
+            elements = _ORBIT.unpack(read_exact(infile, _ORBIT.size))
+            if not math.isnan(elements[0]):
+                orbit = dict(zip(ELEMENT_FIELDS, elements))
+        moons = []
+        for _ in range(moon_count):
+            moon_name = read_name(infile)
+            (diameter,) = _MOON.unpack(read_exact(infile, _MOON.size))
+            moons.append(
+                {
+                    "name": moon_name,
+                    "diameter": None if math.isnan(diameter) else _number(diameter),
+                }
+            )
+        planet = {
+            "name": name,
+            "mass": _number(mass),
+            "distance_from_sun": _number(distance),
+            "moons": moons,
+        }
+        if orbit is not None:
+            planet["orbit"] = orbit
+        yield planet
@@ -1,8 +1,34 @@
 import unittest
 import os
+import time
 import json
+from datetime import date
 from tempfile import NamedTemporaryFile
-from main import Moon, Planet, SolarSystem, QueryProcessor
+from main import Moon, Planet, PlanetApp, SolarSystem, QueryProcessor
+from models import MoonTable, SharedSolarSystem
+from matcher import FuzzyIndex, NameMatcher, edit_distance
+from cache import LRUCache
+import pickle
+import asyncio
+import threading
+import tempfile
+import queue
+from server import QueryServer
+import gui
+from collections import deque
+from types import SimpleNamespace
+from unittest import mock
+import columns
+import derived
+from columns import PlanetColumns
+from indexes import PrefixIndex, SortedIndex
+from stats import Stats, format_snapshot
+from ephemeris import Orbit, closest_approach, from_days, positions, solve_kepler, to_days
+from simulation import SUN_MASS, Simulation, TrajectoryWriter, read_trajectory
+import storage
+from lazy import is_loaded, lazy_import
+from catalogue import Catalogue
+from watcher import FileWatcher, diff_records, read_records
 
 # Import the classes from the main program
 # Assuming they're in separate files, you would import like this:
@@ -36,6 +62,62 @@ class TestMoon(unittest.TestCase):
         self.assertEqual(str(moon2), "Deimos")
 
 
+class TestMoonTable(unittest.TestCase):
+    """Tests for the MoonTable class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.table = MoonTable([Moon("Io", 3643), Moon("Europa"), Moon("Ganymede", 5262.5)])
+
+    def test_moons_read_back_by_value(self):
+        """Test moons come back with the values they were stored with."""
+        self.assertEqual(len(self.table), 3)
+        self.assertEqual(self.table[0], Moon("Io", 3643))
+        self.assertIsNone(self.table[1].diameter)
+        self.assertEqual(self.table[-1].diameter, 5262.5)
+        self.assertEqual([moon.name for moon in self.table], ["Io", "Europa", "Ganymede"])
+
+    def test_list_behaviour(self):
+        """Test the table compares, changes and keeps diameter types like a list."""
+        moons = [Moon("Io", 3643), Moon("Europa"), Moon("Ganymede", 5262.5)]
+        self.assertEqual(self.table, moons)
+        self.assertNotEqual(self.table, moons[:2])
+        self.assertEqual(MoonTable([Moon("Metis", 43.0)])[0].diameter, 43.0)
+        self.assertIsInstance(MoonTable([Moon("Metis", 43.0)])[0].diameter, float)
+        self.assertIsInstance(self.table[0].diameter, int)
+
+        self.table[1] = Moon("Europa", 3121.6)
+        self.assertEqual(self.table[1].diameter, 3121.6)
+        self.table.remove(Moon("Io", 3643))
+        self.assertEqual(self.table.names, ["Europa", "Ganymede"])
+        self.table.insert(0, Moon("Callisto"))
+        del self.table[-1]
+        self.table[1:] = [Moon("Amalthea", 167), Moon("Thebe", 98.6)]
+        self.assertEqual(
+            self.table,
+            [Moon("Callisto"), Moon("Amalthea", 167), Moon("Thebe", 98.6)],
+        )
+        with self.assertRaises(ValueError):
+            self.table.remove(Moon("Titan"))
+
+    def test_moons_read_back_are_read_only(self):
+        """Test changing a moon read from the table raises rather than being lost."""
+        with self.assertRaises(AttributeError):
+            self.table[0].diameter = 99
+        self.assertEqual(self.table[0].diameter, 3643)
+        self.assertEqual(pickle.loads(pickle.dumps(self.table[0])), Moon("Io", 3643))
+
+    def test_find(self):
+        """Test finding a moon's position by name."""
+        self.assertEqual(self.table.find("europa"), 1)
+        self.assertIsNone(self.table.find("Titan"))
+
+    def test_slots(self):
+        """Test moons and planets carry no per-instance dictionary."""
+        self.assertFalse(hasattr(Moon("Io"), "__dict__"))
+        self.assertFalse(hasattr(Planet("Mars", 0.642, 227.9), "__dict__"))
+
+
 class TestPlanet(unittest.TestCase):
     """Tests for the Planet class."""
     
@@ -140,11 +222,69 @@ class TestSolarSystem(unittest.TestCase):
         """Test getting all planet names."""
         names = self.solar_system.get_all_planet_names()
         
+        self.assertIsInstance(names, list)
         self.assertEqual(len(names), 3)
         self.assertIn("Earth", names)
         self.assertIn("Mars", names)
         self.assertIn("Jupiter", names)
+        # Changing the list returned does not change the cached names
+        names.append("Pluto")
+        self.assertEqual(len(self.solar_system.get_all_planet_names()), 3)
         
+    def test_planet_index_tracks_add_planet(self):
+        """Test the name index picks up planets added later."""
+        venus = Planet("Venus", 4.87, 108.2)
+        self.solar_system.add_planet(venus)
+
+        self.assertIs(self.solar_system.get_planet_by_name("VENUS"), venus)
+        self.assertIn("Venus", self.solar_system.get_all_planet_names())
+
+    def test_get_moon_by_name(self):
+        """Test the moon index follows moons added before and after."""
+        mars = self.solar_system.get_planet_by_name("Mars")
+        phobos = Moon("Phobos", 22)
+        mars.add_moon(phobos)
+
+        saturn = Planet("Saturn", 568, 1434)
+        titan = Moon("Titan", 5150)
+        saturn.add_moon(titan)
+        self.solar_system.add_planet(saturn)
+
+        self.assertEqual(self.solar_system.get_moon_by_name("phobos"), (mars, phobos))
+        self.assertEqual(self.solar_system.get_moon_by_name("Titan"), (saturn, titan))
+        self.assertIsNone(self.solar_system.get_moon_by_name("Charon"))
+
+    def test_complete_names(self):
+        """Test name suggestions cover planets and moons, old and new."""
+        mars = self.solar_system.get_planet_by_name("Mars")
+        mars.add_moon(Moon("Phobos", 22))
+        self.assertEqual(self.solar_system.complete_names("ma"), ["Mars"])
+        self.assertEqual(self.solar_system.complete_names("PHO"), ["Phobos"])
+        self.assertEqual(self.solar_system.complete_names(" "), [])
+
+        self.solar_system.add_planet(Planet("Makemake", 0.0031, 6847))
+        mars.add_moon(Moon("Margaret"))
+        self.assertEqual(
+            self.solar_system.complete_names("ma"), ["Makemake", "Margaret", "Mars"]
+        )
+        self.assertEqual(self.solar_system.complete_names("ma", limit=1), ["Makemake"])
+
+    def test_find_fuzzy_mentions(self):
+        """Test misspelt names are found, including bodies added later."""
+        found = self.solar_system.find_fuzzy_mentions("is jupyter bigger than marz")
+        self.assertEqual(
+            [body.name for _, body in found], ["Jupiter", "Mars"]
+        )
+
+        saturn = Planet("Saturn", 568, 1434)
+        saturn.add_moon(Moon("Enceladus", 504))
+        self.solar_system.add_planet(saturn)
+        kind, (planet, moon) = self.solar_system.find_fuzzy_mentions("enceladas")[0]
+        self.assertEqual((kind, planet.name, moon.name), ("moon", "Saturn", "Enceladus"))
+        self.assertEqual(
+            self.solar_system.find_fuzzy_mentions("satrun", ignore={"satrun"}), []
+        )
+
     def test_save_and_load_from_file(self):
         """Test saving and loading from file."""
         # Create a temporary file
@@ -174,6 +314,841 @@ class TestSolarSystem(unittest.TestCase):
                 os.remove(temp_filename)
 
 
+class TestNameMatcher(unittest.TestCase):
+    """Tests for the NameMatcher class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.matcher = NameMatcher()
+        self.matcher.add("Mars", "mars")
+        self.matcher.add("Earth", "earth")
+        self.matcher.add("Van Maanen", "van maanen")
+
+    def test_finds_names_in_order(self):
+        """Test every name is found in order of appearance."""
+        self.assertEqual(
+            self.matcher.find_all("Is Earth bigger than MARS?"), ["earth", "mars"]
+        )
+
+    def test_respects_word_boundaries(self):
+        """Test names inside longer words are not matched."""
+        self.assertEqual(self.matcher.find_all("I ate a marshmallow"), [])
+
+    def test_multi_word_names(self):
+        """Test names spanning several words."""
+        self.assertEqual(self.matcher.find_all("where is van maanen"), ["van maanen"])
+        self.assertEqual(self.matcher.find_all("a van"), [])
+
+
+class TestFuzzyIndex(unittest.TestCase):
+    """Tests for the FuzzyIndex class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.index = FuzzyIndex()
+        for name in ["Jupiter", "Neptune", "Saturn", "Kepler-22b", "Io"]:
+            self.index.add(name)
+
+    def test_edit_distance(self):
+        """Test swaps cost one edit and the limit caps the result."""
+        self.assertEqual(edit_distance("satrun", "saturn", 2), 1)
+        self.assertEqual(edit_distance("neptun", "neptune", 2), 1)
+        self.assertEqual(edit_distance("mercury", "saturn", 2), 3)
+
+    def test_finds_misspelt_names(self):
+        """Test common typos resolve to the closest name."""
+        self.assertEqual(self.index.search("Jupyter", 2), [(1, "Jupiter")])
+        self.assertEqual(self.index.search("neptun", 2), [(1, "Neptune")])
+        self.assertEqual(self.index.search("Satrun", 2), [(1, "Saturn")])
+        self.assertEqual(self.index.search("keplr 22b", 2), [(1, "Kepler-22b")])
+
+    def test_short_text_allows_fewer_edits(self):
+        """Test short words are not matched loosely."""
+        self.assertEqual(self.index.search("io", 2), [(0, "Io")])
+        self.assertEqual(self.index.search("ia", 2), [])
+        self.assertEqual(self.index.search("jptr", 2), [])
+
+    def test_shared_prefixes_are_filtered(self):
+        """Test only names sharing nearly every trigram are compared in full."""
+        for i in range(1, 3000):
+            self.index.add(f"Planet-{i}")
+        with mock.patch("matcher.edit_distance", wraps=edit_distance) as compared:
+            self.assertEqual(self.index.search("Plamet-500", 2), [(1, "Planet-500")])
+        self.assertLess(compared.call_count, 10)
+        self.assertEqual(self.index.search("Planet-12", 2), [(0, "Planet-12")])
+
+    def test_discard_compacts_index(self):
+        """Test discarded names stop matching and are eventually dropped."""
+        self.index.add("Jupiter")
+        self.index.discard("Jupiter")
+        self.assertEqual(self.index.search("Jupyter", 2), [(1, "Jupiter")])
+        self.index.discard("Jupiter")
+        self.assertEqual(self.index.search("Jupyter", 2), [])
+        self.index.discard("Jupiter")
+        self.assertEqual(len(self.index), 4)
+
+        for i in range(200):
+            self.index.add(f"Body {i}")
+        for i in range(150):
+            self.index.discard(f"Body {i}")
+        self.assertEqual(len(self.index), 54)
+        self.assertLess(len(self.index.names), 100)
+        self.assertEqual(self.index.search("Satrun", 2), [(1, "Saturn")])
+        self.assertEqual(self.index.search("Body 199", 0), [(0, "Body 199")])
+
+
+class TestLRUCache(unittest.TestCase):
+    """Tests for the LRUCache class."""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest unused entry is evicted when full."""
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_zero_size_disables_cache(self):
+        """Test a cache of size 0 stores nothing."""
+        cache = LRUCache(0)
+        cache.put("a", 1)
+        self.assertEqual(len(cache), 0)
+
+
+class TestStorage(unittest.TestCase):
+    """Tests for saving and loading in each file format."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.solar_system = SolarSystem()
+        mars = Planet("Mars", 0.642, 227.9, Orbit(1.5237, 0.0934, 1.85, 49.56, -23.94, -4.55))
+        mars.add_moon(Moon("Phobos", 22))
+        mars.add_moon(Moon("Deimos"))
+        self.solar_system.add_planet(Planet("Jupiter", 1898, 778.5))
+        self.solar_system.add_planet(mars)
+
+        with NamedTemporaryFile(delete=False) as temp_file:
+            self.base_name = temp_file.name
+        self.paths = [self.base_name]
+
+    def tearDown(self):
+        """Remove the files written by the test."""
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def round_trip(self, suffix):
+        """Save and reload the solar system through a file."""
+        path = self.base_name + suffix
+        self.paths.append(path)
+        self.assertTrue(self.solar_system.save_to_file(path))
+        loaded = SolarSystem()
+        self.assertTrue(loaded.load_from_file(path))
+        return loaded
+
+    def test_json_round_trip(self):
+        """Test every field survives a JSON round trip."""
+        loaded = self.round_trip(".json")
+        self.assertEqual(
+            [p.to_dict() for p in loaded.planets],
+            [p.to_dict() for p in self.solar_system.planets],
+        )
+        with open(self.base_name + ".json", encoding="utf-8") as infile:
+            self.assertEqual(len(json.load(infile)), 2)
+
+    def test_binary_round_trip(self):
+        """Test every field survives a binary round trip."""
+        loaded = self.round_trip(".bin")
+        self.assertEqual(
+            [p.to_dict() for p in loaded.planets],
+            [p.to_dict() for p in self.solar_system.planets],
+        )
+        self.assertEqual(loaded.get_moon_by_name("Phobos")[0].name, "Mars")
+
+    def test_load_corrupted_file(self):
+        """Test a corrupted file is rejected and leaves no planets."""
+        with open(self.base_name, "w", encoding="utf-8") as outfile:
+            outfile.write('[{"name": "Mars", "mass": 0.642')
+
+        loaded = SolarSystem()
+        self.assertFalse(loaded.load_from_file(self.base_name, "json"))
+        self.assertEqual(loaded.planets, [])
+
+    def test_load_missing_file(self):
+        """Test a missing file is reported rather than raised."""
+        self.assertFalse(SolarSystem().load_from_file(self.base_name + ".missing"))
+
+    def test_snapshot_tracks_source(self):
+        """Test a snapshot is current until its source file changes."""
+        source = self.base_name + ".json"
+        snapshot = storage.snapshot_path(source)
+        self.paths += [source, snapshot]
+        self.assertTrue(self.solar_system.save_to_file(source))
+        self.assertFalse(storage.snapshot_is_current(snapshot, source))
+
+        stamp = storage.source_stamp(source)
+        self.assertTrue(self.solar_system.save_snapshot(snapshot, stamp))
+        self.assertTrue(storage.snapshot_is_current(snapshot, source))
+        loaded = SolarSystem()
+        self.assertTrue(loaded.load_from_file(snapshot, "mapped"))
+        self.assertEqual(
+            [p.to_dict() for p in loaded.planets],
+            [p.to_dict() for p in self.solar_system.planets],
+        )
+
+        _, mtime = stamp
+        os.utime(source, ns=(mtime + 1000, mtime + 1000))
+        self.assertFalse(storage.snapshot_is_current(snapshot, source))
+
+    def test_app_loads_from_snapshot(self):
+        """Test the app builds a snapshot once, then starts from it."""
+        source = self.base_name + ".json"
+        self.paths += [source, storage.snapshot_path(source)]
+        self.assertTrue(self.solar_system.save_to_file(source))
+
+        first = PlanetApp(source)
+        first.load_data()
+        self.assertEqual(first.loaded_from, "data file")
+        second = PlanetApp(source)
+        second.load_data()
+        self.assertEqual(second.loaded_from, "snapshot")
+        self.assertEqual(
+            second.query_processor.process_query("How many moons does Mars have?"),
+            first.query_processor.process_query("How many moons does Mars have?"),
+        )
+        third = PlanetApp(source, snapshot=False)
+        third.load_data()
+        self.assertEqual(third.loaded_from, "data file")
+
+    def edit_source(self, source, edit):
+        """Rewrite a JSON data file through edit(records), bumping its mtime."""
+        with open(source, encoding="utf-8") as infile:
+            records = json.load(infile)
+        edit(records)
+        _, mtime = storage.source_stamp(source)
+        with open(source, "w", encoding="utf-8") as outfile:
+            json.dump(records, outfile)
+        os.utime(source, ns=(mtime + 1000, mtime + 1000))
+
+    def test_reload_applies_diff_in_place(self):
+        """Test edits to the data file are patched into a new version's indexes."""
+        source = self.base_name + ".json"
+        self.paths += [source, storage.snapshot_path(source)]
+        self.assertTrue(self.solar_system.save_to_file(source))
+        for snapshot in (False, True):
+            if snapshot:
+                PlanetApp(source).load_data()
+            app = PlanetApp(source, snapshot=snapshot)
+            app.load_data()
+            self.assertEqual(app.loaded_from, "snapshot" if snapshot else "data file")
+            old = app.solar_system
+            # Build the lazily made indexes, so they must be patched too
+            old.complete_names("ph")
+            old.find_fuzzy_mentions("Jupyter")
+            old.get_columns()
+            mars = old.get_planet_by_name("Mars")
+
+            def edit(records):
+                records[:] = [r for r in records if r["name"] != "Jupiter"]
+                records[0]["mass"] = 0.7
+                records[0]["moons"][0] = {"name": "Phobos II", "diameter": 30}
+                records.append({"name": "Venus", "mass": 4.87, "distance_from_sun": 108.2, "moons": []})
+
+            self.edit_source(source, edit)
+            diff = app.reload_data()
+            self.assertEqual(sorted(p.name for p in diff.updated), ["Mars", "Venus"])
+            self.assertEqual(diff.removed, ["Jupiter"])
+
+            live = app.solar_system
+            self.assertIsNot(live, old)
+            self.assertEqual(live.get_planet_by_name("Mars").mass, 0.7)
+            self.assertIsNone(live.get_planet_by_name("Jupiter"))
+            self.assertEqual(live.complete_names("ph"), ["Phobos II"])
+            self.assertEqual(live.find_fuzzy_mentions("Venis")[0][1].name, "Venus")
+            self.assertEqual(live.find_fuzzy_mentions("Jupyter"), [])
+            self.assertEqual([p.name for p in live.planets_in_range("mass", low=0.5)[1]], ["Mars", "Venus"])
+            self.assertEqual(live.moons_in_range(largest=True)[1][0][1].name, "Phobos II")
+            self.assertEqual([live.planets[row].name for row in live.get_columns().top("mass", 2)], ["Venus", "Mars"])
+            self.assertIn("Phobos II", app.query_processor.process_query("Moons of Mars?"))
+
+            # The version read before the reload is unchanged
+            self.assertIs(old.get_planet_by_name("Mars"), mars)
+            self.assertEqual(mars.mass, 0.642)
+            self.assertEqual(old.get_planet_by_name("Jupiter").mass, 1898)
+            self.assertEqual(old.complete_names("ph"), ["Phobos"])
+            self.assertEqual(old.find_fuzzy_mentions("Jupyter")[0][1].name, "Jupiter")
+            self.assertEqual(old.moons_in_range(largest=True)[1][0][1].name, "Phobos")
+
+            # Reading it back from scratch gives the same catalogue
+            fresh = SolarSystem()
+            self.assertTrue(fresh.load_from_file(source))
+            self.assertEqual(
+                [p.to_dict() for p in live.planets],
+                [p.to_dict() for p in fresh.planets],
+            )
+            self.assertEqual(app.reload_data(), ([], []))
+            self.assertTrue(self.solar_system.save_to_file(source))
+
+    def test_diff_records(self):
+        """Test only new and changed records are built into planets."""
+        old = {"A": {"name": "A", "mass": 1, "distance_from_sun": 1}, "B": {"name": "B"}}
+        new = {"A": {"name": "A", "mass": 2, "distance_from_sun": 1}, "B": {"name": "B"}}
+        diff = diff_records(old, new)
+        self.assertEqual([p.mass for p in diff.updated], [2])
+        self.assertEqual(diff_records(new, {}).removed, ["A", "B"])
+        self.assertIsNone(read_records(self.base_name + ".missing"))
+
+    def test_file_watcher(self):
+        """Test the watcher reports changes, on request and in the background."""
+        source = self.base_name + ".json"
+        self.paths.append(source)
+        self.assertTrue(self.solar_system.save_to_file(source))
+        app = PlanetApp(source, snapshot=False)
+        app.load_data()
+
+        changes = []
+        watcher = FileWatcher(source, lambda: changes.append(1))
+        self.assertFalse(watcher.check())
+        self.edit_source(source, lambda records: records.pop())
+        self.assertTrue(watcher.check())
+        self.assertFalse(watcher.check())
+
+        watcher = app.watch_data(interval=0.01)
+        try:
+            self.edit_source(source, lambda records: records[0].update(mass=2000))
+            for _ in range(200):
+                if app.solar_system.get_planet_by_name("Jupiter").mass == 2000:
+                    break
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+        self.assertEqual(app.solar_system.get_planet_by_name("Jupiter").mass, 2000)
+        self.assertIsNone(app.solar_system.get_planet_by_name("Mars"))
+
+    def test_lazy_import(self):
+        """Test lazily imported modules load on first use."""
+        self.assertIsNone(lazy_import("no_such_module_here"))
+        with mock.patch.dict("sys.modules"):
+            import sys
+
+            sys.modules.pop("colorsys", None)
+            colorsys = lazy_import("colorsys")
+            self.assertFalse(is_loaded("colorsys"))
+            self.assertEqual(colorsys.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+            self.assertTrue(is_loaded("colorsys"))
+
+
+class TestMappedCatalogue(unittest.TestCase):
+    """Tests for loading planets lazily from a mapped catalogue."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        solar_system = SolarSystem()
+        earth = Planet("Earth", 5.97, 149.6)
+        earth.add_moon(Moon("Moon", 3474))
+        mars = Planet("Mars", 0.642, 227.9, Orbit(1.5237, 0.0934, 1.85, 49.56, -23.94, -4.55))
+        mars.add_moon(Moon("Phobos", 22))
+        mars.add_moon(Moon("Deimos"))
+        solar_system.add_planet(Planet("Mercury", 0.330, 57.9))
+        solar_system.add_planet(earth)
+        solar_system.add_planet(mars)
+        solar_system.add_planet(Planet("Kepler-22b", 36, 89.8))
+
+        with NamedTemporaryFile(delete=False, suffix=".ssm") as temp_file:
+            self.temp_filename = temp_file.name
+        self.assertTrue(solar_system.save_to_file(self.temp_filename))
+        self.expected = [p.to_dict() for p in solar_system.planets]
+
+        self.solar_system = SolarSystem()
+        self.assertTrue(self.solar_system.load_from_file(self.temp_filename))
+
+    def tearDown(self):
+        """Remove the catalogue file."""
+        os.remove(self.temp_filename)
+
+    def test_planets_built_on_demand(self):
+        """Test no planet is built until it is looked up."""
+        planets = self.solar_system.planets
+        self.assertEqual(len(planets), 4)
+        self.assertEqual(len(planets._loaded), 0)
+
+        mars = self.solar_system.get_planet_by_name("mars")
+        self.assertEqual(mars.to_dict(), self.expected[2])
+        self.assertIs(self.solar_system.get_planet_by_name("Mars"), mars)
+        self.assertEqual(len(planets._loaded), 1)
+
+    def test_round_trip(self):
+        """Test every field survives the mapped format."""
+        self.assertEqual([p.to_dict() for p in self.solar_system.planets], self.expected)
+        self.assertEqual(
+            self.solar_system.get_all_planet_names(),
+            ["Mercury", "Earth", "Mars", "Kepler-22b"],
+        )
+
+    def test_positions_use_orbit_columns(self):
+        """Test positions come from the mapped orbits, NaN without one."""
+        found = self.solar_system.positions([0.0, 100.0])
+        self.assertEqual(len(found), 2)
+        mars = self.solar_system.get_planet_by_name("Mars")
+        expected = positions([[value] for value in mars.orbit.elements()], [100.0])
+        for axis in range(3):
+            self.assertAlmostEqual(found[1][2][axis], expected[0][0][axis])
+        self.assertTrue(all(value != value for value in found[0][0]))
+
+    def test_moon_lookup(self):
+        """Test moons are found with the planet they orbit."""
+        planet, moon = self.solar_system.get_moon_by_name("Deimos")
+        self.assertEqual((planet.name, moon.name, moon.diameter), ("Mars", "Deimos", None))
+        self.assertIsNone(self.solar_system.get_moon_by_name("Titan"))
+
+    def test_removing_a_moon(self):
+        """Test a moon removed from a mapped planet is no longer found."""
+        mars = self.solar_system.get_planet_by_name("Mars")
+        del mars.moons[0]
+        self.assertIsNone(self.solar_system.get_moon_by_name("Phobos"))
+        planet, moon = self.solar_system.get_moon_by_name("Deimos")
+        self.assertIs(planet, mars)
+        self.assertEqual(moon.name, "Deimos")
+        self.assertEqual(self.solar_system.planets[2].moons, [Moon("Deimos")])
+
+    def test_queries_and_added_planets(self):
+        """Test queries see mapped planets and ones added after loading."""
+        self.solar_system.add_planet(Planet("Venus", 4.87, 108.2))
+        query_processor = QueryProcessor(self.solar_system)
+
+        self.assertIn("36", query_processor.process_query("How massive is Kepler-22b?"))
+        self.assertIn("108.2", query_processor.process_query("How far is Venus?"))
+        self.assertEqual(len(self.solar_system.planets), 5)
+
+    def test_range_lookups_include_added_bodies(self):
+        """Test range lookups merge the mapped file with later additions."""
+        self.solar_system.add_planet(Planet("Venus", 4.87, 108.2))
+        self.solar_system.get_planet_by_name("Earth").add_moon(Moon("Minimoon", 5))
+
+        total, planets = self.solar_system.planets_in_range("distance_from_sun", 80, 150)
+        self.assertEqual(total, 3)
+        self.assertEqual([p.name for p in planets], ["Kepler-22b", "Venus", "Earth"])
+
+        total, moons = self.solar_system.moons_in_range(high=25)
+        self.assertEqual([moon.name for _, moon in moons], ["Minimoon", "Phobos"])
+
+        total, moons = self.solar_system.moons_in_range(limit=2, largest=True)
+        self.assertEqual(total, 3)
+        self.assertEqual([moon.name for _, moon in moons], ["Moon", "Phobos"])
+        self.solar_system.get_planet_by_name("Mars").add_moon(Moon("Bigmoon", 9000))
+        _, moons = self.solar_system.moons_in_range(limit=1, largest=True)
+        self.assertEqual([(p.name, m.name) for p, m in moons], [("Mars", "Bigmoon")])
+
+    def test_complete_names(self):
+        """Test suggestions merge the mapped file with later additions."""
+        self.solar_system.add_planet(Planet("Kepler-16b", 0.33, 105))
+        self.assertEqual(
+            self.solar_system.complete_names("kepler-"), ["Kepler-16b", "Kepler-22b"]
+        )
+        self.assertEqual(self.solar_system.complete_names("m"), ["Mars", "Mercury", "Moon"])
+
+    def test_fuzzy_lookup(self):
+        """Test typo-tolerant lookups see the mapped file."""
+        kind, planet = self.solar_system.find_fuzzy_mentions("Mercuri")[0]
+        self.assertEqual((kind, planet.name), ("planet", "Mercury"))
+        kind, (planet, moon) = self.solar_system.find_fuzzy_mentions("Phobis")[0]
+        self.assertEqual((planet.name, moon.name), ("Mars", "Phobos"))
+        # The file's trigram postings are searched in place
+        self.assertEqual(self.solar_system._fuzzy_index.names, [])
+        self.assertEqual(len(self.solar_system._fuzzy_index), 7)
+        self.assertEqual(len(self.solar_system.planets._loaded), 2)
+
+    def test_fuzzy_lookup_sees_changes(self):
+        """Test typo-tolerant lookups skip hidden mapped bodies and find added ones."""
+        solar_system = self.solar_system
+        solar_system.remove_planet("Earth")
+        self.assertEqual(solar_system.find_fuzzy_mentions("Eatrh"), [])
+        solar_system.remove_planet("Kepler-22b")
+        self.assertEqual(solar_system.find_fuzzy_mentions("Keplr-22b"), [])
+        solar_system.add_planet(Planet("Venus", 4.87, 108.2))
+        self.assertEqual(solar_system.find_fuzzy_mentions("Venis")[0][1].name, "Venus")
+        self.assertEqual(solar_system._fuzzy_index.names, ["Venus"])
+
+    def test_changes_laid_over_file(self):
+        """Test updates and removals leave the file mapped and match a fresh load."""
+        solar_system = self.solar_system
+        # Build the lazily made indexes, so they must be patched too
+        solar_system.complete_names("m")
+        solar_system.find_fuzzy_mentions("Zzzzzz")
+        solar_system.get_columns()
+        solar_system.planets_in_range("mass", limit=0)
+        solar_system.moons_in_range(limit=0)
+
+        solar_system.add_planet(Planet("Venus", 4.87, 108.2))
+        self.assertEqual(solar_system.remove_planet("Earth").name, "Earth")
+        mars = Planet("Mars", 0.7, 227.9)
+        mars.add_moon(Moon("Phobos II", 30))
+        solar_system.update_planet(mars)
+        self.assertIsNone(solar_system.remove_planet("Earth"))
+
+        self.assertIsNotNone(solar_system._mapped)
+        # Only the two planets changed were built
+        self.assertEqual(sorted(solar_system.planets._loaded), [1, 2])
+        names = ["Mercury", "Mars", "Kepler-22b", "Venus"]
+        self.assertEqual([p.name for p in solar_system.planets], names)
+        self.assertEqual(solar_system.get_all_planet_names(), names)
+        self.assertIsNone(solar_system.get_planet_by_name("Earth"))
+        self.assertIsNone(solar_system.get_moon_by_name("Moon"))
+        self.assertIsNone(solar_system.get_moon_by_name("Deimos"))
+        self.assertEqual(solar_system.get_moon_by_name("Phobos II")[0].mass, 0.7)
+        self.assertEqual(solar_system.complete_names("m"), ["Mars", "Mercury"])
+        self.assertEqual(solar_system.complete_names("ph"), ["Phobos II"])
+        self.assertEqual(solar_system.find_fuzzy_mentions("Deimoss"), [])
+        self.assertEqual(
+            [(kind, body.name) for kind, body in solar_system.find_mentions("earth or mars")],
+            [("planet", "Mars")],
+        )
+        total, planets = solar_system.planets_in_range("mass", low=0.5)
+        self.assertEqual([p.name for p in planets], ["Mars", "Venus", "Kepler-22b"])
+        _, moons = solar_system.moons_in_range(largest=True)
+        self.assertEqual([moon.name for _, moon in moons], ["Phobos II"])
+        top = solar_system.get_columns().top("mass", 4)
+        self.assertEqual(
+            [solar_system.planets[row].name for row in top],
+            ["Kepler-22b", "Venus", "Mars", "Mercury"],
+        )
+
+        # Columns built after the changes match the ones patched in place
+        solar_system._columns = None
+        self.assertEqual(solar_system.get_columns().top("mass", 4), top)
+        path = self.temp_filename + ".json"
+        try:
+            self.assertTrue(solar_system.save_to_file(path))
+            fresh = SolarSystem()
+            self.assertTrue(fresh.load_from_file(path))
+        finally:
+            os.remove(path)
+        self.assertEqual(
+            [p.to_dict() for p in solar_system.planets],
+            [p.to_dict() for p in fresh.planets],
+        )
+        self.assertEqual(
+            list(solar_system.records()), [p.to_dict() for p in fresh.planets]
+        )
+
+    def test_pickle_maps_file_again(self):
+        """Test a pickled solar system reopens its catalogue."""
+        copy = pickle.loads(pickle.dumps(self.solar_system))
+        self.assertEqual(copy.get_planet_by_name("Earth").moons[0].name, "Moon")
+
+
+class TestPlanetColumns(unittest.TestCase):
+    """Tests for the PlanetColumns class, with and without NumPy."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.columns = PlanetColumns()
+        for name, mass, distance in [
+            ("Earth", 5.97, 149.6),
+            ("Mars", 0.642, 227.9),
+            ("Jupiter", 1898, 778.5),
+            ("Venus", 4.87, 108.2),
+        ]:
+            self.columns.append(Planet(name, mass, distance))
+
+    def check_queries(self):
+        self.assertEqual(self.columns.select("mass", low=1), [0, 2, 3])
+        self.assertEqual(self.columns.select("distance_from_sun", high=149.6), [0, 3])
+        self.assertEqual(
+            self.columns.select("mass", 0.642, 5.97, include_low=False), [0, 3]
+        )
+        self.assertEqual(self.columns.top("mass", 2), [2, 0])
+        self.assertEqual(self.columns.top("distance_from_sun", 10, largest=False), [3, 0, 1, 2])
+        self.assertEqual(PlanetColumns().top("mass", 3), [])
+
+    @unittest.skipIf(columns.np is None, "NumPy is not installed")
+    def test_vectorized_queries(self):
+        """Test range and top-k queries on NumPy views."""
+        self.check_queries()
+
+    def test_queries_without_numpy(self):
+        """Test the pure Python fallback gives the same answers."""
+        with mock.patch.object(columns, "np", None):
+            self.check_queries()
+
+    def test_moon_counts_follow_added_moons(self):
+        """Test the moon count column follows moons added later."""
+        solar_system = SolarSystem()
+        mars = Planet("Mars", 0.642, 227.9)
+        solar_system.add_planet(mars)
+        mars.add_moon(Moon("Phobos", 22))
+        self.assertEqual(list(solar_system.get_columns().moon_count), [1])
+
+
+class TestSortedIndex(unittest.TestCase):
+    """Tests for the SortedIndex class."""
+
+    def test_range_lookups(self):
+        """Test entries are found by key range in key order."""
+        index = SortedIndex()
+        for key, value in [(5, "e"), (1, "a"), (3, "c"), (3, "c2"), (9, "i")]:
+            index.add(key, value)
+
+        start, stop = index.span(2, 5)
+        self.assertEqual([v for _, v in index.items(start, stop)], ["c", "c2", "e"])
+        start, stop = index.span(3, None, include_low=False)
+        self.assertEqual([v for _, v in index.items(start, stop)], ["e", "i"])
+        self.assertEqual(index.span(6, 2), index.span(6, 6))
+
+    def test_bulk_merge_keeps_order(self):
+        """Test many pending entries merge into an existing index."""
+        index = SortedIndex("q")
+        for row in range(200):
+            index.add(row % 10, row)
+        index.span()
+        for row in range(200, 400):
+            index.add(row % 10, row)
+
+        start, stop = index.span(0, 0)
+        self.assertEqual(list(index.values[start:stop]), list(range(0, 400, 10)))
+
+    def test_build_positions_skips_nan(self):
+        """Test bulk builds index positions and leave out unknown keys."""
+        index = SortedIndex.build_positions([3.0, float("nan"), 1.0, 2.0])
+        self.assertEqual(list(index.values), [2, 3, 0])
+
+
+class TestPrefixIndex(unittest.TestCase):
+    """Tests for the PrefixIndex class."""
+
+    def test_complete_in_key_order(self):
+        """Test names added before and after a lookup are found by prefix."""
+        index = PrefixIndex()
+        for name in ["Saturn", "Sedna", "Mars"]:
+            index.add(name.lower(), name)
+        self.assertEqual([n for _, n in index.complete("s")], ["Saturn", "Sedna"])
+
+        index.add("salacia", "Salacia")
+        self.assertEqual(
+            [n for _, n in index.complete("sa")], ["Salacia", "Saturn"]
+        )
+        self.assertEqual(list(index.complete("x")), [])
+        self.assertEqual(len(index), 4)
+
+
+class TestDerivedColumns(unittest.TestCase):
+    """Tests for the derived quantities of every planet."""
+
+    def setUp(self):
+        self.solar_system = SolarSystem()
+        self.solar_system.add_planet(Planet("Earth", 5.97, 149.6))
+        self.solar_system.add_planet(Planet("Neptune", 102, 4495.1))
+
+    def check_values(self):
+        found = derived.DerivedColumns(
+            self.solar_system.get_columns(), self.solar_system.get_all_planet_names()
+        )
+        self.assertAlmostEqual(found.value("period_days", "Earth"), 365.26, places=2)
+        self.assertAlmostEqual(found.value("period_days", "neptune") / 365.25, 164.7, places=1)
+        self.assertAlmostEqual(found.value("distance_au", "Earth"), 1.0, places=2)
+        self.assertAlmostEqual(found.value("light_seconds", "Earth"), 499.0, places=0)
+        self.assertAlmostEqual(found.value("earth_masses", "Neptune"), 17.08, places=2)
+        self.assertIsNone(found.value("earth_masses", "Pluto"))
+        self.assertEqual(found.phrase("light_seconds", "Neptune"), "is 4 h 9 min from the Sun at the speed of light")
+
+    def test_values_with_and_without_numpy(self):
+        """Test the vectorized and plain loop passes agree."""
+        self.check_values()
+        with mock.patch.object(columns, "np", None), mock.patch.object(derived, "np", None):
+            self.check_values()
+
+    def test_kept_until_planets_change(self):
+        """Test derived columns are computed once per version of the planets."""
+        first = self.solar_system.get_derived()
+        self.assertIs(self.solar_system.get_derived(), first)
+        self.solar_system.add_planet(Planet("Mars", 0.642, 227.9))
+        second = self.solar_system.get_derived()
+        self.assertIsNot(second, first)
+        self.assertEqual(len(second), 3)
+        self.assertAlmostEqual(second.value("distance_au", "Mars"), 1.523, places=3)
+
+
+class TestStats(unittest.TestCase):
+    """Tests for the Stats class."""
+
+    def test_disabled_records_nothing(self):
+        """Test a disabled Stats ignores records and timers."""
+        stats = Stats()
+        stats.record("queries", "mass", 0.001)
+        with stats.timed("storage", "load"):
+            pass
+        self.assertEqual(stats.snapshot(), {"enabled": False, "groups": {}})
+
+    def test_histogram_percentiles(self):
+        """Test counts, maximum and bucketed percentiles."""
+        stats = Stats(enabled=True)
+        for _ in range(9):
+            stats.record("queries", "mass", 0.00002)
+        stats.record("queries", "mass", 0.2)
+
+        histogram = stats.snapshot()["groups"]["queries"]["mass"]
+        self.assertEqual(histogram["count"], 10)
+        self.assertEqual(histogram["p50_ms"], 0.05)
+        self.assertAlmostEqual(histogram["max_ms"], 200)
+        self.assertAlmostEqual(histogram["p99_ms"], 200)
+        self.assertEqual(sum(histogram["buckets"]), 10)
+
+        stats.reset()
+        self.assertEqual(stats.snapshot()["groups"], {})
+
+
+class TestEphemeris(unittest.TestCase):
+    """Tests for Keplerian orbit positions."""
+
+    # J2000 mean elements of Earth and Mars
+    EARTH = Orbit(1.00000261, 0.01671123, -0.00001531, 0.0, 102.93768193, 100.46457166)
+    MARS = Orbit(1.52371034, 0.09339410, 1.84969142, 49.55953891, -23.94362959, -4.55343205)
+
+    def test_solve_kepler(self):
+        """Test the eccentric anomalies satisfy Kepler's equation."""
+        import numpy as np
+
+        mean = np.linspace(-np.pi, np.pi, 1001)
+        for eccentricity in (0.0, 0.2, 0.6, 0.95):
+            anomaly = solve_kepler(mean, eccentricity)
+            residual = anomaly - eccentricity * np.sin(anomaly) - mean
+            self.assertLess(np.abs(residual).max(), 1e-10)
+
+    def test_positions_with_and_without_numpy(self):
+        """Test the vectorized and plain loop positions agree."""
+        elements = list(zip(self.EARTH.elements(), self.MARS.elements()))
+        days = [-5000.0, 0.0, 1234.5, 10000.0]
+        fast = positions(elements, days)
+        with mock.patch("ephemeris.np", None):
+            slow = positions(elements, days)
+        for t in range(len(days)):
+            for body in range(2):
+                for axis in range(3):
+                    self.assertAlmostEqual(fast[t][body][axis], slow[t][body][axis])
+
+    def test_closest_approach(self):
+        """Test the 2003 close approach of Mars is found."""
+        days, distance = closest_approach(
+            self.EARTH,
+            self.MARS,
+            start=to_days(date(2003, 1, 1)),
+            end=to_days(date(2004, 1, 1)),
+        )
+        self.assertEqual(from_days(days).strftime("%Y-%m-%d"), "2003-08-27")
+        self.assertAlmostEqual(distance, 0.373, places=2)
+
+    def test_orbit_round_trip(self):
+        """Test an orbit survives to_dict, from_dict and a planet's dict."""
+        self.assertEqual(Orbit.from_dict(self.MARS.to_dict()), self.MARS)
+        mars = Planet("Mars", 0.642, 227.9, self.MARS)
+        self.assertEqual(Planet.from_dict(mars.to_dict()).orbit, self.MARS)
+        self.assertNotIn("orbit", Planet("Vulcan", 1, 2).to_dict())
+
+
+class TestSimulation(unittest.TestCase):
+    """Tests for the N-body simulation."""
+
+    def setUp(self):
+        """Set up a random cluster of bodies."""
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        self.masses = rng.uniform(1, 10, 300)
+        self.positions = rng.normal(size=(300, 3))
+        self.velocities = rng.normal(size=(300, 3)) * 1e-4
+
+    def test_import_defers_numpy(self):
+        """Test importing the module leaves NumPy unloaded until a simulation runs."""
+        import subprocess
+        import sys
+
+        script = (
+            "import sys, simulation; loaded = 'numpy' in sys.modules; "
+            "simulation.Simulation([1.0], [[0, 0, 0]], [[0, 0, 0]]); "
+            "print(loaded, 'numpy' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.split(), ["False", "True"])
+
+    def test_backends_agree(self):
+        """Test Barnes-Hut forces are close to the all-pairs ones."""
+        import numpy as np
+
+        exact = Simulation(self.masses, self.positions, self.velocities).accelerations()
+        approximate = Simulation(
+            self.masses, self.positions, self.velocities, backend="barnes_hut", theta=0.5
+        ).accelerations()
+        error = np.linalg.norm(approximate - exact, axis=1) / np.linalg.norm(exact, axis=1)
+        self.assertLess(np.median(error), 1e-3)
+        self.assertLess(error.max(), 2e-2)
+
+    def test_workers_match_single_process(self):
+        """Test splitting forces between processes gives the same answer."""
+        import numpy as np
+
+        single = Simulation(self.masses, self.positions, self.velocities)
+        with mock.patch("simulation._PAIR_BLOCK", 300 * 100):
+            with Simulation(self.masses, self.positions, self.velocities, workers=2) as split:
+                self.assertTrue(np.allclose(split.accelerations(), single.accelerations()))
+
+    def test_orbit_conserves_energy(self):
+        """Test a circular orbit closes after a year with little energy drift."""
+        speed = 0.01720209895 * (1 + 5.97 / SUN_MASS) ** 0.5
+        simulation = Simulation(
+            [SUN_MASS, 5.97], [[0, 0, 0], [1, 0, 0]], [[0, 0, 0], [0, speed, 0]]
+        )
+        drift = simulation.run(0.5, 1461, every=100)
+        self.assertLess(max(abs(value) for _, value in drift), 1e-6)
+        offset = simulation.positions[1] - simulation.positions[0]
+        self.assertAlmostEqual(offset[0], 1.0, places=3)
+
+    def test_from_solar_system(self):
+        """Test only planets with orbits take part, with the Sun added."""
+        solar_system = SolarSystem()
+        solar_system.add_planet(Planet("Earth", 5.97, 149.6, TestEphemeris.EARTH))
+        solar_system.add_planet(Planet("Vulcan", 1, 50))
+        simulation = Simulation.from_solar_system(solar_system)
+        self.assertEqual(simulation.names, ["Sun", "Earth"])
+        self.assertAlmostEqual(abs(simulation.masses @ simulation.velocities).max(), 0)
+
+    def test_checkpoint_and_trajectory_round_trip(self):
+        """Test a run can be streamed to disk and resumed from a checkpoint."""
+        import numpy as np
+
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, "state.npz")
+        path = os.path.join(directory, "run.sst")
+        simulation = Simulation(self.masses[:20], self.positions[:20], self.velocities[:20])
+        with TrajectoryWriter(path, simulation.names) as trajectory:
+            simulation.run(10.0, 6, trajectory=trajectory, every=2, checkpoint=checkpoint)
+
+        frames = read_trajectory(path)
+        self.assertEqual(next(frames), simulation.names)
+        frames = list(frames)
+        self.assertEqual([time for time, _ in frames], [0.0, 20.0, 40.0, 60.0])
+        self.assertTrue(np.array_equal(frames[-1][1], simulation.positions))
+
+        resumed = Simulation.load_checkpoint(checkpoint)
+        self.assertEqual(resumed.time, 60.0)
+        self.assertEqual(resumed.initial_energy, simulation.initial_energy)
+        self.assertTrue(np.array_equal(resumed.velocities, simulation.velocities))
+        self.assertIsNone(Simulation.load_checkpoint(path))
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
 class TestQueryProcessor(unittest.TestCase):
     """Tests for the QueryProcessor class."""
     
@@ -238,6 +1213,276 @@ class TestQueryProcessor(unittest.TestCase):
         self.assertIn("Jupiter", result)
         self.assertIn("doesn't have any moons", result)
         
+    def test_query_ignores_partial_names(self):
+        """Test planet names inside other words are not matched."""
+        result = self.query_processor.process_query("How massive is a marshmallow?")
+        self.assertIn("I'm not sure", result)
+
+    def test_query_sees_planets_added_later(self):
+        """Test planets added after construction are recognised."""
+        self.solar_system.add_planet(Planet("Venus", 4.87, 108.2))
+        result = self.query_processor.process_query("How far is Venus?")
+        self.assertIn("108.2", result)
+
+    def test_repeated_query_is_cached(self):
+        """Test equivalent queries are answered from the cache."""
+        first = self.query_processor.process_query("How massive is Jupiter?")
+        second = self.query_processor.process_query("how MASSIVE is jupiter")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.query_processor.cache.hits, 1)
+
+    def test_cache_invalidated_by_changes(self):
+        """Test adding a moon invalidates cached answers."""
+        query = "How many moons does Jupiter have?"
+        self.assertIn("doesn't have any moons", self.query_processor.process_query(query))
+
+        jupiter = self.solar_system.get_planet_by_name("Jupiter")
+        jupiter.add_moon(Moon("Io", 3643))
+
+        self.assertIn("Io", self.query_processor.process_query(query))
+
+    def test_moon_queries(self):
+        """Test questions about moons rather than planets."""
+        jupiter = self.solar_system.get_planet_by_name("Jupiter")
+        jupiter.add_moon(Moon("Io", 3643))
+        jupiter.add_moon(Moon("Ganymede", 5262))
+        jupiter.add_moon(Moon("Amalthea"))
+        process = self.query_processor.process_query
+
+        self.assertEqual(process("Which planet does Phobos orbit?"), "Phobos orbits Mars.")
+        self.assertEqual(
+            process("What is the largest moon?"),
+            "The largest moon is Ganymede (5262 km, Jupiter).",
+        )
+        self.assertEqual(
+            process("What are the two smallest moons?"),
+            "The 2 smallest moons are: Deimos (12 km, Mars), Phobos (22 km, Mars).",
+        )
+        self.assertEqual(
+            process("What is the smallest moon of Jupiter?"),
+            "The smallest moon of Jupiter is Io (3643 km).",
+        )
+        self.assertIn("Ganymede (5262 km, Jupiter)", process("List moons bigger than 4000 km"))
+        self.assertIn("a moon of Jupiter", process("Tell me about Ganymede"))
+
+    def test_changing_moons_updates_queries(self):
+        """Test removing or replacing a moon reaches the indexes and the cache."""
+        process = self.query_processor.process_query
+        self.assertEqual(
+            process("What is the largest moon?"),
+            "The largest moon is Moon (3474 km, Earth).",
+        )
+        mars = self.solar_system.get_planet_by_name("Mars")
+        del mars.moons[0]
+
+        self.assertEqual(process("Which planet does Deimos orbit?"), "Deimos orbits Mars.")
+        self.assertIsNone(self.solar_system.get_moon_by_name("Phobos"))
+        total, moons = self.solar_system.moons_in_range()
+        self.assertEqual(total, 2)
+        self.assertEqual(
+            [(planet.name, moon.name) for planet, moon in moons],
+            [("Mars", "Deimos"), ("Earth", "Moon")],
+        )
+
+        mars.moons[0] = Moon("Deimos", 5000)
+        self.assertEqual(
+            process("What is the largest moon?"),
+            "The largest moon is Deimos (5000 km, Mars).",
+        )
+        mars.moons.insert(0, Moon("Phobos", 22))
+        self.assertEqual(process("Which planet does Phobos orbit?"), "Phobos orbits Mars.")
+        self.assertEqual(self.solar_system.get_moon_by_name("Deimos")[1].diameter, 5000)
+
+    def test_query_corrects_typos(self):
+        """Test misspelt planet names are answered, and can be switched off."""
+        # Questions naming no body never build the trigram index
+        self.query_processor.process_query("What is the most massive planet?")
+        self.assertIsNone(self.solar_system._fuzzy_index)
+        self.assertIn(
+            "Jupiter has a mass", self.query_processor.process_query("How massive is Jupyter?")
+        )
+        self.assertIn("Earth", self.query_processor.process_query("How far is Eatrh?"))
+        self.assertIn("I'm not sure", self.query_processor.process_query("Tell me about the sky"))
+        self.solar_system.add_planet(Planet("Kepler-90", 1.2, 0.7))
+        self.assertIn(
+            "Kepler-90 has a mass", self.query_processor.process_query("How massive is Keplr-90?")
+        )
+
+        strict = QueryProcessor(self.solar_system, max_edit_distance=0)
+        self.assertIn("I'm not sure", strict.process_query("How massive is Jupyter?"))
+
+    def test_stats_record_intents(self):
+        """Test answers are counted by the intent that produced them."""
+        self.query_processor.process_query("How massive is Jupiter?")
+        self.assertEqual(self.query_processor.stats_snapshot()["groups"], {})
+
+        self.query_processor.stats.enabled = True
+        self.query_processor.process_query("How massive is Jupiter?")
+        self.query_processor.process_query("How massive is Jupiter?")
+        self.query_processor.process_query("What colour is the sky?")
+
+        snapshot = self.query_processor.stats_snapshot()
+        queries = snapshot["groups"]["queries"]
+        self.assertEqual(queries["mass"]["count"], 2)
+        self.assertEqual(queries["unknown"]["count"], 1)
+        self.assertEqual(snapshot["cache"]["hits"], 2)
+        self.assertIn("mass", format_snapshot(snapshot))
+
+    def test_process_many(self):
+        """Test batch answers come back in order, inline and in a pool."""
+        queries = ["How massive is Jupiter?", "How far is Earth?"] * 5
+        expected = [self.query_processor.process_query(q) for q in queries]
+
+        self.assertEqual(list(self.query_processor.process_many(queries)), expected)
+        self.assertEqual(
+            list(self.query_processor.process_many(queries, workers=2, chunk_size=3)),
+            expected,
+        )
+
+    def test_comparative_queries(self):
+        """Test comparing planets against another planet."""
+        result = self.query_processor.process_query("Which planets are heavier than Earth?")
+        self.assertIn("Jupiter", result)
+        self.assertNotIn("Mars", result)
+
+        result = self.query_processor.process_query("Is Mars farther than Earth?")
+        self.assertTrue(result.startswith("Yes"))
+
+        result = self.query_processor.process_query("Which planets have more moons than Mars?")
+        self.assertIn("There are no planets", result)
+
+    def test_superlative_and_sort_queries(self):
+        """Test top-k and sorted answers."""
+        result = self.query_processor.process_query("What is the most massive planet?")
+        self.assertIn("Jupiter", result)
+
+        result = self.query_processor.process_query("Name the two closest planets")
+        self.assertIn("Earth", result)
+        self.assertIn("Mars", result)
+        self.assertNotIn("Jupiter", result)
+
+        result = self.query_processor.process_query("Sort the planets by mass")
+        self.assertLess(result.index("Mars"), result.index("Earth"))
+        self.assertLess(result.index("Earth"), result.index("Jupiter"))
+
+    def test_range_queries(self):
+        """Test between / closer than / larger than questions."""
+        result = self.query_processor.process_query(
+            "Which planets are between 100 and 300 million km from the Sun?"
+        )
+        self.assertIn("Earth", result)
+        self.assertIn("Mars", result)
+        self.assertNotIn("Jupiter", result)
+
+        result = self.query_processor.process_query("Which planets are closer than 200 million km?")
+        self.assertIn("Earth", result)
+        self.assertNotIn("Mars", result)
+
+        result = self.query_processor.process_query("Which moons are larger than 20 km?")
+        self.assertIn("Moon", result)
+        self.assertIn("Phobos", result)
+        self.assertNotIn("Deimos", result)
+
+        result = self.query_processor.process_query("Which moons are larger than 10,000 km?")
+        self.assertIn("There are no moons", result)
+
+    def test_position_queries(self):
+        """Test where and when questions are answered from the orbits."""
+        solar_system = SolarSystem()
+        solar_system.add_planet(Planet("Earth", 5.97, 149.6, TestEphemeris.EARTH))
+        solar_system.add_planet(Planet("Mars", 0.642, 227.9, TestEphemeris.MARS))
+        solar_system.add_planet(Planet("Jupiter", 1898, 778.5))
+        query_processor = QueryProcessor(solar_system)
+
+        result = query_processor.process_query("Where is Mars on 2030-01-01?")
+        self.assertIn("On 2030-01-01, Mars is 1.381 AU", result)
+        self.assertIn("from Earth", result)
+
+        result = query_processor.process_query("When are Earth and Mars closest in 2003?")
+        self.assertIn("In 2003, Earth and Mars are closest on 2003-08-27", result)
+
+        result = query_processor.process_query("When is Mars farthest from the Sun?")
+        self.assertIn("Mars is farthest from the Sun on", result)
+
+        result = query_processor.process_query("Where is Jupiter?")
+        self.assertEqual(result, "I don't have orbital elements for Jupiter.")
+
+        # Dates that don't exist or are out of range get an answer, not an error
+        for query in (
+            "Where is Mars in 0000?",
+            "When are Earth and Mars closest in 9999?",
+            "Where is Mars in 99999?",
+            "When is Mars closest to the Sun in 123456?",
+            "Where is Mars on 2030-02-30?",
+        ):
+            self.assertIn("not a date I can use", query_processor.process_query(query))
+        result = query_processor.process_query("When is Mars closest to the Sun from 2031-01-31?")
+        self.assertIn("In the year from 2031-01-31", result)
+
+    def test_compound_queries(self):
+        """Test several planets and attributes are answered in one go."""
+        result = self.query_processor.process_query("Mass and moons of Mars and Jupiter?")
+        self.assertEqual(
+            result,
+            "Mars has a mass of 0.642 × 10^24 kg and has 2 moons in our database: Phobos, Deimos.\n"
+            "Jupiter has a mass of 1898 × 10^24 kg and doesn't have any moons in our database.",
+        )
+        result = self.query_processor.process_query("How far and how massive is Earth?")
+        self.assertEqual(
+            result,
+            "Earth is 149.6 million km from the Sun and has a mass of 5.97 × 10^24 kg.",
+        )
+        result = self.query_processor.process_query("Tell me about Earth and Mars")
+        self.assertIn("Information about Earth", result)
+        self.assertIn("Information about Mars", result)
+        self.assertIn("Jupiter", self.query_processor.process_query("Which moons orbit Mars and Jupiter?"))
+        # "Moon" names a body here, so moons are not asked for
+        result = self.query_processor.process_query("How far is the Moon from Earth?")
+        self.assertEqual(result, "Earth is 149.6 million km from the Sun.")
+
+        # Questions that are more than a list of values are not planned
+        parsed = self.query_processor.parse("Is Mars heavier than Earth?")
+        self.assertIsNone(self.query_processor.plan(parsed))
+        self.assertIn("No, Mars", self.query_processor.process_query("Is Mars heavier than Earth?"))
+        parsed = self.query_processor.parse("How massive is Mars?")
+        self.assertIsNone(self.query_processor.plan(parsed))
+
+    def test_derived_queries(self):
+        """Test periods, light times and unit conversions are answered."""
+        result = self.query_processor.process_query("How long is a year on Jupiter?")
+        self.assertEqual(result, "Jupiter takes 11.87 years (4,334.0 days) to orbit the Sun.")
+        result = self.query_processor.process_query("How long does light take to reach Mars?")
+        self.assertEqual(result, "Mars is 12 min 40 s from the Sun at the speed of light.")
+        result = self.query_processor.process_query("How far is Mars in AU?")
+        self.assertEqual(result, "Mars is 1.523 AU from the Sun.")
+        result = self.query_processor.process_query("How many Earth masses is Jupiter?")
+        self.assertEqual(result, "Jupiter has a mass of 317.8 Earth masses.")
+        result = self.query_processor.process_query("Mass of Earth and Mars in Jupiter masses")
+        self.assertIn("Mars has a mass of 0.0003382 Jupiter masses.", result)
+
+    def test_derived_queries_read_the_queried_system(self):
+        """Test derived values come from the system queried, not the planet's own."""
+        copied = self.solar_system.copy()
+        # Earth stays in the copy but now belongs to no solar system
+        self.solar_system.remove_planet("Earth")
+        query_processor = QueryProcessor(copied)
+        self.assertEqual(
+            query_processor.process_query("How far is Earth in AU?"),
+            "Earth is 1.000 AU from the Sun.",
+        )
+
+        with mock.patch("derived.DerivedColumns.phrase", return_value=None):
+            self.assertEqual(
+                query_processor.process_query("How long is a year on Mars?"),
+                "Mars has an unknown orbital period.",
+            )
+            self.assertEqual(
+                query_processor.process_query("Mass and light time of Mars"),
+                "Mars has a mass of 0.642 × 10^24 kg and has an unknown "
+                "light travel time from the Sun.",
+            )
+
     def test_query_planet_in_list(self):
         """Test querying if a planet is in the list."""
         # Existing planet
@@ -251,5 +1496,497 @@ class TestQueryProcessor(unittest.TestCase):
         self.assertIn("Pluto", result)
         
 
+class TestCatalogue(unittest.TestCase):
+    """Tests for the sharded multi-system Catalogue."""
+
+    def setUp(self):
+        sol = SolarSystem()
+        jupiter = Planet("Jupiter", 1898, 778.5)
+        jupiter.add_moon(Moon("Ganymede", 5268))
+        sol.add_planet(jupiter)
+        sol.add_planet(Planet("Earth", 5.97, 149.6))
+
+        kepler = SolarSystem()
+        kepler.add_planet(Planet("Kepler-90h", 2500, 150.0))
+        kepler.add_planet(Planet("Earth", 6.5, 45.0))
+
+        trappist = SolarSystem()
+        trappist.add_planet(Planet("TRAPPIST-1e", 4.1, 4.4))
+
+        self.catalogue = Catalogue(shard_count=3)
+        self.catalogue.add_system("Sol", sol)
+        self.catalogue.add_system("Kepler-90", kepler)
+        self.catalogue.add_system("TRAPPIST-1", trappist)
+
+    def test_routes_to_named_systems(self):
+        """Test queries go only to the systems they name, or whose bodies they name."""
+        self.assertEqual(self.catalogue.route("How massive is Earth in Sol?")[0], ["Sol"])
+        self.assertEqual(
+            self.catalogue.route("How massive is Earth?")[0], ["Sol", "Kepler-90"]
+        )
+        self.assertEqual(self.catalogue.route("TRAPPIST-1e mass")[0], ["TRAPPIST-1"])
+        self.assertEqual(self.catalogue.route("Which is heaviest?")[0], [])
+
+        # "90" in the system name is not read as "the 90 heaviest"
+        answer = self.catalogue.process_query("Most massive planet of Kepler-90")
+        self.assertEqual(answer, "The most massive planet is Kepler-90h (2500 × 10^24 kg).")
+        answer = self.catalogue.process_query("How massive is Earth?")
+        self.assertTrue(answer.startswith("Sol: "))
+        self.assertIn("Kepler-90: ", answer)
+        self.assertIn("6.5", answer)
+
+        # Only the shard holding the system is asked
+        shard = self.catalogue.shards[self.catalogue.shard_for("TRAPPIST-1")]
+        with mock.patch.object(
+            Catalogue, "_scatter", wraps=self.catalogue._scatter
+        ) as scatter:
+            self.catalogue.process_query("TRAPPIST-1e mass")
+        self.assertEqual(list(scatter.call_args.args[0]), [self.catalogue.shards.index(shard)])
+
+    def test_replacing_a_system(self):
+        """Test a replaced system is routed by its new bodies only."""
+        kepler = SolarSystem()
+        kepler.add_planet(Planet("Kepler-90i", 1.9, 15.0))
+        self.catalogue.add_system("kepler-90", kepler)
+
+        self.assertEqual(len(self.catalogue), 3)
+        self.assertEqual(self.catalogue.route("How massive is Earth?")[0], ["Sol"])
+        self.assertEqual(self.catalogue.route("Kepler-90h mass")[0], [])
+        self.assertEqual(self.catalogue.route("Kepler-90i mass")[0], ["kepler-90"])
+        self.assertEqual(self.catalogue.route("Earth in Kepler-90")[0], ["kepler-90"])
+        self.assertEqual(
+            self.catalogue.process_query("Kepler-90i mass"),
+            "Kepler-90i has a mass of 1.9 × 10^24 kg.",
+        )
+        shard = self.catalogue.shards[self.catalogue.shard_for("Kepler-90")]
+        self.assertIn("kepler-90", shard.systems)
+        self.assertNotIn("Kepler-90", shard.systems)
+
+    def test_scatter_gather_superlatives(self):
+        """Test global questions merge every shard's best answers."""
+        self.assertEqual(
+            self.catalogue.process_query("Most massive planet anywhere?"),
+            "The most massive planet in the catalogue is Kepler-90h in Kepler-90 (2500 × 10^24 kg).",
+        )
+        answer = self.catalogue.process_query("Top 2 closest planets")
+        self.assertTrue(answer.startswith("The 2 planets closest to the Sun in the catalogue are: TRAPPIST-1e"))
+        self.assertIn("Earth in Kepler-90", answer)
+        self.assertIn(
+            "Ganymede (5268 km, Jupiter in Sol)",
+            self.catalogue.process_query("What is the largest moon?"),
+        )
+
+        # A change to one system is seen by the next global question
+        self.catalogue.shards[self.catalogue.shard_for("Sol")].systems["Sol"].add_planet(
+            Planet("Heavy", 9999, 1.0)
+        )
+        self.assertIn("Heavy in Sol", self.catalogue.process_query("heaviest planet"))
+
+    def test_worker_processes_match_inline(self):
+        """Test shards served from worker processes give the same answers."""
+        queries = [
+            "Most massive planet anywhere?",
+            "How far is Earth?",
+            "TRAPPIST-1e mass",
+            "largest moon",
+        ]
+        expected = [self.catalogue.process_query(query) for query in queries]
+        with self.catalogue:
+            self.catalogue.start()
+            self.assertEqual([self.catalogue.process_query(q) for q in queries], expected)
+
+    def test_stats_command_reaches_catalogue(self):
+        """Test ":stats" switches and shows the stats of the catalogue answering queries."""
+        app = PlanetApp()
+        app.query_processor = self.catalogue
+        self.assertEqual(app.stats_command(":stats off"), "Statistics switched off.")
+        self.assertFalse(self.catalogue.stats.enabled)
+        self.catalogue.process_query("How far is Earth?")
+        self.assertEqual(self.catalogue.stats_snapshot()["groups"], {})
+
+        app.stats_command(":stats on")
+        self.catalogue.process_query("How far is Earth?")
+        groups = self.catalogue.stats_snapshot()["groups"]
+        self.assertEqual(groups["catalogue"]["routed"]["count"], 1)
+        self.assertEqual(groups["queries"]["distance"]["count"], 2)
+        self.assertIn("routed", app.stats_command(":stats"))
+
+        # Shards sent to worker processes leave the stats behind
+        shard = pickle.loads(pickle.dumps(self.catalogue.shards[0]))
+        self.assertIsNone(shard.stats)
+
+    def test_import_leaves_main_unloaded(self):
+        """Test importing the module does not import main a second time."""
+        import subprocess
+        import sys
+
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, catalogue; print('main' in sys.modules)"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.split(), ["False"])
+
+    def test_load_directory(self):
+        """Test each data file in a directory becomes a system named after it."""
+        with tempfile.TemporaryDirectory() as directory:
+            for name in self.catalogue.system_names():
+                shard = self.catalogue.shards[self.catalogue.shard_for(name)]
+                shard.systems[name].save_to_file(os.path.join(directory, name + ".json"))
+            with open(os.path.join(directory, "notes.txt"), "w") as notes:
+                notes.write("not a system")
+            loaded = Catalogue.load_directory(directory, shard_count=2)
+        self.assertEqual(sorted(loaded.system_names()), ["Kepler-90", "Sol", "TRAPPIST-1"])
+        self.assertIn("Kepler-90h", loaded.process_query("heaviest planet"))
+
+
+class TestSharedSolarSystem(unittest.TestCase):
+    """Tests for copy-on-write versions of a SharedSolarSystem."""
+
+    def setUp(self):
+        solar_system = SolarSystem()
+        mars = Planet("Mars", 0.642, 227.9)
+        mars.add_moon(Moon("Phobos", 22))
+        solar_system.add_planet(mars)
+        solar_system.add_planet(Planet("Jupiter", 1898, 778.5))
+        for i in range(100):
+            solar_system.add_planet(Planet(f"Filler-{i}", i / 100, 10.0 + i))
+        self.shared = SharedSolarSystem(solar_system)
+
+    def test_edit_publishes_new_version(self):
+        """Test edits are published whole and never change older versions."""
+        old = self.shared.current()
+        old.complete_names("ph")
+        old.find_fuzzy_mentions("Jupyter")
+        self.assertTrue(old.frozen)
+        with self.assertRaises(RuntimeError):
+            old.add_planet(Planet("Venus", 4.87, 108.2))
+        with self.assertRaises(RuntimeError):
+            old.get_planet_by_name("Mars").add_moon(Moon("Deimos", 12))
+
+        with self.shared.edit() as draft:
+            mars = Planet("Mars", 0.7, 227.9)
+            mars.add_moon(Moon("Deimos", 12))
+            draft.update_planet(mars)
+            draft.remove_planet("Jupiter")
+            draft.add_planet(Planet("Venus", 4.87, 108.2))
+            # Not published until the edit ends
+            self.assertIs(self.shared.current(), old)
+        new = self.shared.current()
+        self.assertGreater(new.version, old.version)
+        self.assertEqual(new.get_planet_by_name("Mars").mass, 0.7)
+        self.assertEqual(new.complete_names("deim"), ["Deimos"])
+        self.assertEqual(new.find_planets("Venus and Jupiter")[0].name, "Venus")
+        self.assertIsNone(new.get_planet_by_name("Jupiter"))
+
+        self.assertEqual(old.get_planet_by_name("Mars").mass, 0.642)
+        self.assertEqual(old.get_moon_by_name("Phobos")[1].diameter, 22)
+        self.assertIsNone(old.get_moon_by_name("Deimos"))
+        self.assertEqual(old.complete_names("ph"), ["Phobos"])
+        self.assertEqual([p.name for p in old.find_planets("Venus and Jupiter")], ["Jupiter"])
+        self.assertEqual(old.find_fuzzy_mentions("Venis"), [])
+        self.assertEqual(len(old.planets), 102)
+
+        # A failed edit publishes nothing
+        with self.assertRaises(ValueError):
+            with self.shared.edit() as draft:
+                draft.remove_planet("Mars")
+                raise ValueError("changed my mind")
+        self.assertIs(self.shared.current(), new)
+
+        # A query processor reads the latest version for each query
+        processor = QueryProcessor(self.shared)
+        self.assertIn("0.7", processor.process_query("How massive is Mars?"))
+        with self.shared.edit() as draft:
+            draft.update_planet(Planet("Mars", 0.8, 227.9))
+        self.assertIn("0.8", processor.process_query("How massive is Mars?"))
+
+    def test_readers_during_writes(self):
+        """Test many reader threads always see one whole version while a writer edits."""
+        edits = 100
+        readers = 8
+        errors = []
+        checks = []
+        done = threading.Event()
+        with self.shared.edit() as draft:
+            for name in ("Alpha", "Beta"):
+                planet = Planet(name, 2000, 50.0)
+                planet.add_moon(Moon(f"{name}-0", 1))
+                draft.add_planet(planet)
+            draft.add_planet(Planet("New-0", 0.5, 60.0))
+
+        def write():
+            try:
+                for k in range(1, edits + 1):
+                    with self.shared.edit() as draft:
+                        for name in ("Alpha", "Beta"):
+                            planet = Planet(name, 2000 + k, 50.0)
+                            planet.add_moon(Moon(f"{name}-{k}", k))
+                            draft.update_planet(planet)
+                        draft.add_planet(Planet(f"New-{k}", 0.5, 60.0))
+                        draft.remove_planet(f"New-{k - 1}")
+            except Exception as error:
+                errors.append(repr(error))
+            finally:
+                done.set()
+
+        def read():
+            processor = QueryProcessor(self.shared)
+            last_version = 0
+            count = 0
+            try:
+                while not done.is_set():
+                    view = self.shared.current()
+                    self.assertGreaterEqual(view.version, last_version)
+                    last_version = view.version
+                    alpha = view.get_planet_by_name("Alpha")
+                    beta = view.get_planet_by_name("Beta")
+                    self.assertEqual(alpha.mass, beta.mass)
+                    k = int(alpha.mass) - 2000
+                    _, heaviest = view.planets_in_range("mass", alpha.mass, alpha.mass)
+                    self.assertEqual({p.name for p in heaviest}, {"Alpha", "Beta"})
+                    self.assertEqual(view.planets_in_range("mass", 0.5, 0.5)[0], 2)
+                    top = view.get_columns().top("mass", 2)
+                    self.assertEqual({view.planets[row].name for row in top}, {"Alpha", "Beta"})
+                    self.assertEqual(view.get_moon_by_name(f"Alpha-{k}")[0], alpha)
+                    self.assertIsNone(view.get_moon_by_name(f"Alpha-{k - 1}"))
+                    new = [n for n in view.get_all_planet_names() if n.startswith("New-")]
+                    self.assertEqual(new, [f"New-{k}"])
+                    self.assertEqual(view.complete_names("new-"), new)
+                    self.assertEqual([p.name for p in view.find_planets(new[0])], new)
+                    self.assertIn("Alpha has a mass of", processor.process_query("Alpha mass?"))
+                    count += 1
+            except Exception as error:
+                errors.append(repr(error))
+            checks.append(count)
+
+        threads = [threading.Thread(target=read) for _ in range(readers)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(checks), readers)
+        self.assertGreater(sum(checks), edits)
+        final = self.shared.current()
+        self.assertEqual(final.get_planet_by_name("Alpha").mass, 2000 + edits)
+        self.assertEqual(len(final.planets), 102 + 3)
+
+
+class TestQueryServer(unittest.TestCase):
+    """Tests for the QueryServer class against localhost."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        solar_system = SolarSystem()
+        solar_system.add_planet(Planet("Earth", 5.97, 149.6))
+        solar_system.add_planet(Planet("Jupiter", 1898, 778.5))
+        self.query_processor = QueryProcessor(solar_system)
+
+    async def exchange(self, lines, path=None):
+        """Send request lines over one connection and read the responses."""
+        server = QueryServer(self.query_processor, max_pending=2)
+        listener = await server.start(port=0, path=path)
+        try:
+            if path:
+                reader, writer = await asyncio.open_unix_connection(path)
+            else:
+                port = listener.sockets[0].getsockname()[1]
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            # Pipelined: every request is sent before any answer is read.
+            writer.write("".join(line + "\n" for line in lines).encode())
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in lines]
+            writer.close()
+            await writer.wait_closed()
+            return responses
+        finally:
+            await server.close()
+
+    def test_pipelined_requests_answered_in_order(self):
+        """Test pipelined requests over TCP come back in order."""
+        lines = [
+            json.dumps({"id": i, "query": query})
+            for i, query in enumerate(["How massive is Jupiter?", "How far is Earth?"] * 3)
+        ]
+        responses = asyncio.run(self.exchange(lines))
+
+        self.assertEqual([r["id"] for r in responses], list(range(6)))
+        self.assertIn("1898", responses[0]["answer"])
+        self.assertIn("149.6", responses[1]["answer"])
+        self.assertTrue(all(r["latency_ms"] >= 0 for r in responses))
+
+    def test_bad_requests_get_errors(self):
+        """Test malformed requests are answered with an error."""
+        responses = asyncio.run(self.exchange(['"How far is Earth?"', "{oops", '{"id": 7}']))
+
+        self.assertIn("149.6", responses[0]["answer"])
+        self.assertIn("error", responses[1])
+        self.assertEqual(responses[2]["id"], 7)
+        self.assertIn("error", responses[2])
+
+    def test_failed_query_does_not_stall_connection(self):
+        """Test a query that raises gets an error and later requests still get answers."""
+        process_query = self.query_processor.process_query
+
+        def fail_once(query):
+            if query == "boom":
+                raise RuntimeError("query failed")
+            return process_query(query)
+
+        with mock.patch.object(self.query_processor, "process_query", side_effect=fail_once):
+            responses = asyncio.run(
+                asyncio.wait_for(self.exchange(['"boom"', '"How far is Earth?"']), 10)
+            )
+        self.assertEqual(responses[0]["error"], "query failed")
+        self.assertIn("149.6", responses[1]["answer"])
+
+    def test_shared_solar_system_answers_in_parallel(self):
+        """Test each worker thread answers with its own processor over a SharedSolarSystem."""
+        processor = QueryProcessor(SharedSolarSystem(self.query_processor.solar_system))
+        process_query = QueryProcessor.process_query
+        # Passes only once three queries are being answered at the same time
+        barrier = threading.Barrier(3, timeout=5)
+        used = set()
+
+        def wait_for_others(self, query):
+            used.add(id(self))
+            barrier.wait()
+            return process_query(self, query)
+
+        async def ask_at_once():
+            server = QueryServer(processor, max_concurrency=3)
+            listener = await server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+
+            async def ask(query):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(json.dumps(query).encode() + b"\n")
+                response = json.loads(await reader.readline())
+                writer.close()
+                await writer.wait_closed()
+                return response
+
+            try:
+                return await asyncio.gather(*(ask("How far is Earth?") for _ in range(3)))
+            finally:
+                await server.close()
+
+        with mock.patch.object(QueryProcessor, "process_query", wait_for_others):
+            responses = asyncio.run(asyncio.wait_for(ask_at_once(), 10))
+        self.assertTrue(all("149.6" in r["answer"] for r in responses))
+        self.assertEqual(len(used), 3)
+        self.assertNotIn(id(processor), used)
+
+    def test_unix_socket(self):
+        """Test serving over a Unix socket."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "planets.sock")
+            responses = asyncio.run(self.exchange(['"How massive is Earth?"'], path))
+        self.assertIn("5.97", responses[0]["answer"])
+
+
+
+class RecordingText:
+    """Stand-in for a Tk text widget that records edits."""
+
+    def __init__(self):
+        self.calls = []
+
+    def insert(self, index, text):
+        self.calls.append(("insert", index, text))
+
+    def delete(self, start, end):
+        self.calls.append(("delete", start, end))
+
+    def see(self, index):
+        pass
+
+    def config(self, **options):
+        pass
+
+
+class TestGUI(unittest.TestCase):
+    """Tests for the GUI's logic, run without creating a window."""
+
+    def setUp(self):
+        """Build a PlanetAppGUI without Tk, with stand-in widgets."""
+        self.gui = gui.PlanetAppGUI.__new__(gui.PlanetAppGUI)
+        self.gui.max_transcript_entries = 2
+        self.gui._entry_lengths = deque()
+        self.gui._suggest_prefix = ""
+        self.gui._queries = queue.Queue()
+        self.gui._results = queue.Queue()
+        self.gui.response_text = RecordingText()
+        self.gui.root = mock.Mock()
+        tk = SimpleNamespace(NORMAL="normal", DISABLED="disabled", END="end")
+        patcher = mock.patch.object(gui, "tk", tk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transcript_is_trimmed(self):
+        """Test the oldest entries are deleted past max_transcript_entries."""
+        for text in ("aaa", "bb", "c", "dddd"):
+            self.gui.update_response_text(text)
+        calls = self.gui.response_text.calls
+        self.assertEqual(
+            [call for call in calls if call[0] == "insert"],
+            [("insert", "end", text) for text in ("aaa", "bb", "c", "dddd")],
+        )
+        self.assertEqual(
+            [call for call in calls if call[0] == "delete"],
+            [("delete", "1.0", "1.0 + 3 chars"), ("delete", "1.0", "1.0 + 2 chars")],
+        )
+        self.assertEqual(list(self.gui._entry_lengths), [1, 4])
+
+    def test_worker_answers_queries(self):
+        """Test the worker answers in order and survives a failing query."""
+
+        def process_query(query):
+            if query == "boom":
+                raise ValueError("bad query")
+            return f"answer to {query}"
+
+        solar_system = mock.Mock()
+        solar_system.complete_names.return_value = ["Mars", "Mercury"]
+        self.gui.planet_app = SimpleNamespace(
+            query_processor=SimpleNamespace(process_query=process_query),
+            solar_system=solar_system,
+        )
+        for request in [("query", "boom"), ("query", "mass"), ("complete", "M"), None]:
+            self.gui._queries.put(request)
+        self.gui._answer_queries()
+
+        results = []
+        while not self.gui._results.empty():
+            results.append(self.gui._results.get())
+        self.assertEqual(
+            results,
+            [
+                ("query", "boom", "Sorry, something went wrong: bad query"),
+                ("query", "mass", "answer to mass"),
+                ("complete", "M", ["Mars", "Mercury"]),
+            ],
+        )
+        solar_system.complete_names.assert_called_once_with("M", limit=gui.SUGGESTION_LIMIT)
+
+    def test_poll_shows_results_and_drops_stale_suggestions(self):
+        """Test polling shows answers and only current suggestions, then repeats."""
+        self.gui.show_suggestions = mock.Mock()
+        self.gui._suggest_prefix = "Ma"
+        self.gui._results.put(("complete", "M", ["Mars", "Mercury"]))
+        self.gui._results.put(("complete", "Ma", ["Mars"]))
+        self.gui._results.put(("query", "mass", "answer"))
+        self.gui._poll_results()
+
+        self.gui.show_suggestions.assert_called_once_with(["Mars"])
+        inserted = [call[2] for call in self.gui.response_text.calls if call[0] == "insert"]
+        self.assertEqual(inserted, [f"Q: mass\n\nanswer\n\n{'-' * 50}\n\n"])
+        self.gui.root.after.assert_called_once_with(gui.POLL_INTERVAL, self.gui._poll_results)
+
+
 if __name__ == "__main__":
     unittest.main()
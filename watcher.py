@@ -0,0 +1,195 @@
+import json
+import threading
+from collections import namedtuple
+
+import storage
+from models import Planet, SolarSystem
+
+# What changed between two reads of a data file: planets that are new or
+# differ, and the names of planets no longer there.
+DataDiff = namedtuple("DataDiff", ["updated", "removed"])
+
+
+def read_records(file_path, file_format=None, lines=None):
+    """
+    Read a data file as planet records, without building Planet objects.
+
+    JSON files written by this program hold one record per line. Given
+    the lines of the previous read, only lines not seen then are decoded;
+    the rest reuse their earlier record. Files laid out any other way are
+    decoded in full.
+
+    Args:
+        file_path (str): The file to read
+        file_format (str): "json", "binary" or "mapped"; guessed from the
+            extension when None
+        lines (dict): Line -> record from the previous read of a JSON
+            file; replaced by this read's lines
+
+    Returns:
+        dict: Planet name -> record as given by Planet.to_dict(), or None
+            if the file is missing or cannot be read
+    """
+    file_format = file_format or storage.detect_format(file_path)
+    try:
+        if file_format == "mapped":
+            solar_system = SolarSystem()
+            if not solar_system.load_from_file(file_path, "mapped"):
+                return None
+            return {planet.name: planet.to_dict() for planet in solar_system.planets}
+        if file_format == "binary":
+            with open(file_path, "rb") as infile:
+                return {record["name"]: record for record in storage.iter_binary(infile)}
+        with open(file_path, encoding="utf-8") as infile:
+            text = infile.read()
+        found = _read_lines(text, {} if lines is None else lines)
+        if found is None:
+            found = {}
+            records = json.loads(text)
+            if not isinstance(records, list):
+                raise ValueError("Expected a JSON array")
+        else:
+            found, records = found
+        if lines is not None:
+            lines.clear()
+            lines.update(found)
+        return {record["name"]: record for record in records}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _read_lines(text, previous):
+    """
+    Decode a JSON array written one record per line.
+
+    Returns:
+        tuple: (line -> record, records in order), or None if the text
+            is not laid out that way
+    """
+    rows = text.split("\n")
+    while rows and not rows[-1].strip():
+        rows.pop()
+    if len(rows) < 2 or rows[0].strip() != "[" or rows[-1].strip() != "]":
+        return None
+    found = {}
+    records = []
+    last = len(rows) - 2
+    for number, row in enumerate(rows[1:-1], 1):
+        line = row.strip()
+        if number < last:
+            if not line.endswith(","):
+                return None
+            line = line[:-1]
+        record = previous.get(line)
+        if record is None:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return None
+            if not isinstance(record, dict):
+                return None
+        found[line] = record
+        records.append(record)
+    return found, records
+
+
+def diff_records(old, new):
+    """
+    Compare two reads of a data file.
+
+    Only records that are new or differ are turned into planets.
+
+    Args:
+        old (dict): Records from the previous read, by planet name
+        new (dict): Records from this read, by planet name
+
+    Returns:
+        DataDiff: The new or changed planets and the removed names
+
+    Raises:
+        KeyError: If a changed record is missing a required field
+    """
+    updated = [
+        Planet.from_dict(record)
+        for name, record in new.items()
+        if old.get(name) is not record and old.get(name) != record
+    ]
+    removed = [name for name in old if name not in new]
+    return DataDiff(updated, removed)
+
+
+class FileWatcher:
+    """
+    Call a function whenever a file changes.
+
+    The file's size and modification time are polled on a background
+    thread, which needs nothing beyond the standard library and works the
+    same on every platform; checking a stamp costs one stat() call. The
+    function runs on that thread.
+    """
+
+    def __init__(self, file_path, on_change, interval=0.5, stamp=None):
+        """
+        Args:
+            file_path (str): The file to watch
+            on_change (callable): Called with no arguments after a change
+            interval (float): Seconds between checks
+            stamp (tuple): storage.source_stamp() of the contents already
+                seen; the file as it is now when None
+        """
+        self.file_path = file_path
+        self.on_change = on_change
+        self.interval = interval
+        self.stamp = storage.source_stamp(file_path) if stamp is None else stamp
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def check(self):
+        """
+        Call on_change if the file changed since the last check.
+
+        The stamp is taken before on_change runs, so a change made while
+        it runs is picked up by the next check. A missing file is not a
+        change: editors often replace files by deleting and renaming.
+
+        Returns:
+            bool: True if the file had changed
+        """
+        stamp = storage.source_stamp(self.file_path)
+        if stamp is None or stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        self.on_change()
+        return True
+
+    def start(self):
+        """Start checking on a background thread."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop checking and wait for the thread to finish."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # A failed reload must not end the watch; the next change
+                # to the file tries again.
+                pass